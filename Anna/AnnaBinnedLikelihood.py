@@ -0,0 +1,360 @@
+# =============================================================================
+#  @class AnnaBinnedLikelihood
+#  NumPy/SciPy binned likelihood fits, without ROOT
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-05-14
+
+import math
+import numpy as np
+from numpy.polynomial.legendre import leggauss
+from scipy.optimize import minimize
+
+# Gauss-Legendre points used to integrate the PDFs over a bin
+_nodes, _weights = leggauss(5)
+
+
+# ______________________________________
+def CrystalBall(x, mean, sigma, alpha, n):
+    """Crystal Ball shape, power-law tail on the left
+
+    As Ostap CrystalBall_pdf, the exponent of the tail is n + 1.
+    Not normalized.
+    """
+
+    t = (x - mean) / sigma
+    a = abs(alpha)
+    N = abs(n) + 1.
+    tail = math.exp(-0.5 * a * a) * (N / a) ** N
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        left = tail * np.power(np.maximum(N / a - a - t, 1e-300), -N)
+    return np.where(t > -a, np.exp(-0.5 * t * t), left)
+
+
+# ______________________________________
+def CB2(x, mean, sigma, alphaL, nL, alphaR, nR):
+    """Double sided Crystal Ball shape
+
+    As Ostap CB2_pdf, the exponents of the tails are nL + 1 and nR + 1.
+    Not normalized.
+    """
+
+    t = (x - mean) / sigma
+    aL, aR = abs(alphaL), abs(alphaR)
+    NL, NR = abs(nL) + 1., abs(nR) + 1.
+    tailL = math.exp(-0.5 * aL * aL) * (NL / aL) ** NL
+    tailR = math.exp(-0.5 * aR * aR) * (NR / aR) ** NR
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        left = tailL * np.power(np.maximum(NL / aL - aL - t, 1e-300), -NL)
+        right = tailR * np.power(np.maximum(NR / aR - aR + t, 1e-300), -NR)
+    core = np.exp(-0.5 * t * t)
+    return np.where(t < -aL, left, np.where(t > aR, right, core))
+
+
+# ______________________________________
+def ExpoPositive(x, tau, phis, xmin, xmax):
+    """Exponential times a positive polynomial, as Ostap Bkg_pdf
+
+    The polynomial is a Bernstein sum whose coefficients are the
+    squared coordinates of a unit vector given by the phis angles.
+    Not normalized.
+    """
+
+    u = (x - xmin) / (xmax - xmin)
+    degree = len(phis)
+    coefficients = list()
+    remaining = 1.
+    for phi in phis:
+        coefficients.append(remaining * math.cos(phi) ** 2)
+        remaining *= math.sin(phi) ** 2
+    coefficients.append(remaining)
+
+    poly = np.zeros_like(u)
+    for k, c in enumerate(coefficients):
+        binomial = math.factorial(degree) / (math.factorial(k) * math.factorial(degree - k))
+        poly += c * binomial * u ** k * (1. - u) ** (degree - k)
+    return np.exp(tau * (x - xmin)) * poly
+
+
+# ______________________________________
+class AnnaBinnedLikelihood:
+    """Extended binned likelihood fit of signal + background
+
+    The expected content of each bin is S * signal + B * background,
+    both PDFs being integrated over the bin (5 points Gauss-Legendre)
+    and normalized over the fit range. The Poisson negative
+    log-likelihood is minimized with scipy (L-BFGS-B, within the
+    parameter limits) and the errors come from the inverse of the
+    numerical Hessian at the minimum.
+
+    Signals: CB2_pdf, CrystalBall_pdf. Backgrounds: Bkg_pdf.
+    Parameters:
+        CB2_pdf -- mean, sigma, alphaL, nL, alphaR, nR
+        CrystalBall_pdf -- mean, sigma, alpha, n
+        Bkg_pdf -- tau, phi1 ... phi<power>
+        yields -- S, B
+
+    Only depends on numpy and scipy.
+    """
+
+    signals = {
+        'CB2_pdf': ['mean', 'sigma', 'alphaL', 'nL', 'alphaR', 'nR'],
+        'CrystalBall_pdf': ['mean', 'sigma', 'alpha', 'n']}
+    backgrounds = ['Bkg_pdf']
+
+    # Relative NLL change and projected gradient at which the minimization stops
+    tolerance = 1e-12
+
+    # ______________________________________
+    def __init__(self, edges, counts, signal, background, parameters, power=1):
+        """cstr
+
+        Arguments:
+            edges {array} -- bin edges of the fit range
+            counts {array} -- bin contents
+            signal {str} -- see signals
+            background {str} -- see backgrounds
+            parameters {dict} -- (value, min, max) by parameter name,
+                fixed when min == max. Missing parameters of the background
+                and the yields get default values
+
+        Keyword Arguments:
+            power {int} -- degree of the Bkg_pdf polynomial (default: {1})
+        """
+
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.asarray(counts, dtype=np.float64)
+        self.signal = signal
+        self.background = background
+        self.power = power
+        self.xmin, self.xmax = self.edges[0], self.edges[-1]
+
+        # Integration points of each bin
+        centers = 0.5 * (self.edges[1:] + self.edges[:-1])
+        half = 0.5 * (self.edges[1:] - self.edges[:-1])
+        self._x = centers[:, None] + half[:, None] * _nodes[None, :]
+        self._w = half[:, None] * _weights[None, :]
+
+        # All the parameters, with their defaults
+        total = max(self.counts.sum(), 1.)
+        slope = 50. / (self.xmax - self.xmin)
+        self.parameters = dict()
+        self.parameters['tau'] = (0., -slope, slope)
+        for i in range(power):
+            phi = math.acos(math.sqrt(1. / (power + 1 - i)))
+            self.parameters['phi{}'.format(i + 1)] = (phi, 0., 0.5 * math.pi)
+        self.parameters['S'] = (0.5 * total, 0., 2. * total + 10.)
+        self.parameters['B'] = (0.5 * total, 0., 2. * total + 10.)
+        self.parameters.update(parameters)
+
+        self.names = self.signals[signal] + ['tau'] + \
+            ['phi{}'.format(i + 1) for i in range(power)] + ['S', 'B']
+        missing = [name for name in self.names if name not in self.parameters]
+        if len(missing) > 0:
+            raise ValueError('Missing parameters {} for {}'.format(missing, signal))
+        self.free = [name for name in self.names if self.parameters[name][1] < self.parameters[name][2]]
+
+    # ______________________________________
+    def Evaluate(self, name, values, x):
+        """
+        Values of a PDF at x, not normalized
+        """
+
+        if name == 'CB2_pdf':
+            return CB2(
+                x, values['mean'], values['sigma'],
+                values['alphaL'], values['nL'], values['alphaR'], values['nR'])
+        elif name == 'CrystalBall_pdf':
+            return CrystalBall(x, values['mean'], values['sigma'], values['alpha'], values['n'])
+        return ExpoPositive(
+            x, values['tau'],
+            [values['phi{}'.format(i + 1)] for i in range(self.power)],
+            self.xmin, self.xmax)
+
+    # ______________________________________
+    def Fit(self, start=None):
+        """Minimize the negative log-likelihood
+
+        Keyword Arguments:
+            start {dict} -- starting values by parameter name,
+                the defaults for the missing ones (default: {None})
+
+        Returns:
+            dict -- 'values' and 'errors' by parameter name, 'status'
+                (0 if converged), 'covQual' (3 for an accurate covariance,
+                as RooFit), 'nll' and 'ncalls' (likelihood evaluations)
+        """
+
+        start = start if start is not None else dict()
+        x0 = [
+            min(max(start.get(name, self.parameters[name][0]), self.parameters[name][1]), self.parameters[name][2])
+            for name in self.free]
+
+        # Minimize in units of the parameter limits, so that all
+        # the parameters have the same scale
+        lower = np.array([self.parameters[name][1] for name in self.free])
+        scale = np.array([self.parameters[name][2] - self.parameters[name][1] for name in self.free])
+        result = minimize(
+            lambda u: self.GetNLL(lower + u * scale),
+            (np.array(x0) - lower) / scale,
+            method='L-BFGS-B',
+            bounds=[(0., 1.)] * len(self.free),
+            options={'ftol': self.tolerance, 'gtol': self.tolerance})
+        x = lower + result.x * scale
+        values = self.GetValues(x)
+
+        # Errors from the numerical Hessian, without the
+        # parameters at their limits
+        inside = [i for i, u in enumerate(result.x) if 1e-6 < u < 1. - 1e-6]
+        covariance, covQual = self.GetCovariance(x, inside)
+        errors = dict([(name, 0.) for name in self.names])
+        if covariance is not None:
+            for k, i in enumerate(inside):
+                errors[self.free[i]] = math.sqrt(max(covariance[k][k], 0.))
+
+        return {
+            'values': values,
+            'errors': errors,
+            'status': 0 if result.success else 4,
+            'covQual': covQual,
+            'nll': float(result.fun),
+            'ncalls': int(result.nfev)}
+
+    # ______________________________________
+    def Generate(self, values, seed):
+        """Pseudo-dataset: Poisson contents of the bins
+
+        Arguments:
+            values {dict} -- parameter values, e.g. the 'values' of Fit
+            seed {int} -- of the numpy random generator, the contents
+                only depend on it
+
+        Returns:
+            array -- contents of the bins
+        """
+
+        expected = np.maximum(self.GetExpected(values), 0.)
+        return np.random.RandomState(seed).poisson(expected).astype(np.float64)
+
+    # ______________________________________
+    def GetCovariance(self, x, indices):
+        """
+        Inverse of the numerical Hessian of the NLL for the free
+        parameters of the given indices, with the covariance
+        quality in the RooFit convention
+        """
+
+        n = len(indices)
+        if n == 0:
+            return None, 0
+        x = np.asarray(x, dtype=np.float64)
+        f0 = self.GetNLL(x)
+
+        # Steps of about a tenth of the error, from the diagonal
+        # curvature, so that the rounding of the NLL does not matter
+        steps = np.zeros(len(x))
+        for i in indices:
+            scale = self.parameters[self.free[i]][2] - self.parameters[self.free[i]][1]
+            steps[i] = 1e-3 * scale
+            e = np.zeros(len(x))
+            e[i] = steps[i]
+            curvature = (self.GetNLL(x + e) - 2. * f0 + self.GetNLL(x - e)) / (steps[i] ** 2)
+            if curvature > 0:
+                steps[i] = min(0.1 / math.sqrt(curvature), 0.1 * scale)
+
+        hessian = np.zeros((n, n))
+        for k, i in enumerate(indices):
+            for l, j in enumerate(indices[k:], k):
+                ei = np.zeros(len(x))
+                ej = np.zeros(len(x))
+                ei[i] = steps[i]
+                ej[j] = steps[j]
+                if i == j:
+                    value = (self.GetNLL(x + ei) - 2. * f0 + self.GetNLL(x - ei)) / (steps[i] ** 2)
+                else:
+                    value = (
+                        self.GetNLL(x + ei + ej) - self.GetNLL(x + ei - ej) -
+                        self.GetNLL(x - ei + ej) + self.GetNLL(x - ei - ej)) / (4. * steps[i] * steps[j])
+                hessian[k][l] = hessian[l][k] = value
+
+        try:
+            covariance = np.linalg.inv(hessian)
+        except np.linalg.LinAlgError:
+            return None, 0
+        if np.all(np.linalg.eigvalsh(hessian) > 0):
+            return covariance, 3
+        return covariance, 1
+
+    # ______________________________________
+    def GetCurves(self, values, npoints=200):
+        """Fitted curves sampled over the fit range
+
+        Arguments:
+            values {dict} -- parameter values, e.g. the 'values' of Fit
+
+        Keyword Arguments:
+            npoints {int} -- (default: {200})
+
+        Returns:
+            dict -- arrays 'x' and 'model', 'signal', 'background'
+                in entries per unit of x
+        """
+
+        x = np.linspace(self.xmin, self.xmax, npoints)
+        curves = {
+            'x': x,
+            'signal': values['S'] * self.GetDensity(self.signal, values, x),
+            'background': values['B'] * self.GetDensity(self.background, values, x)}
+        curves['model'] = curves['signal'] + curves['background']
+        return curves
+
+    # ______________________________________
+    def GetDensity(self, name, values, x):
+        """
+        Values of a PDF at x, normalized over the fit range
+        """
+
+        norm = np.sum(self.Evaluate(name, values, self._x) * self._w)
+        f = self.Evaluate(name, values, x)
+        return f / norm if norm > 0 else f
+
+    # ______________________________________
+    def GetExpected(self, values):
+        """
+        Expected content of each bin for the parameter values
+        """
+
+        signal = self.GetShape(self.signal, values)
+        background = self.GetShape(self.background, values)
+        return values['S'] * signal + values['B'] * background
+
+    # ______________________________________
+    def GetNLL(self, x):
+        values = self.GetValues(x)
+        expected = np.maximum(self.GetExpected(values), 1e-300)
+        return float(np.sum(expected - self.counts * np.log(expected)))
+
+    # ______________________________________
+    def GetShape(self, name, values):
+        """
+        Fraction of a PDF in each bin
+        """
+
+        f = self.Evaluate(name, values, self._x)
+        integrals = np.sum(f * self._w, axis=1)
+        norm = integrals.sum()
+        return integrals / norm if norm > 0 else integrals
+
+    # ______________________________________
+    def GetValues(self, x):
+        """
+        All the parameter values, from the free ones
+        """
+
+        values = dict([(name, self.parameters[name][0]) for name in self.names])
+        for name, value in zip(self.free, x):
+            values[name] = float(value)
+        return values
+
+# =============================================================================
+# The END
+# =============================================================================
@@ -23,7 +23,8 @@ class AnnaConfig:
 			"FitType",
 			"MotherLeaf",
 			"DaughterLeafs",
-			"ResultFilePath")
+			"ResultFilePath",
+			"TupleFilePath")
 
 	# ______________________________________
 	def ReadFromFile(self, configfile=""):
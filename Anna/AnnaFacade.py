@@ -5,15 +5,26 @@
 
 # From the framework
 from .AnnaConfig import AnnaConfig
-from .AnnaFitter import AnnaFitter
+from .AnnaFitter import AnnaFitter, has_numpy
+from .AnnaFitScheduler import AnnaFitScheduler
+from .AnnaFitPlanner import AnnaFitPlanner
+from .AnnaFitCache import AnnaFitCache
+from .AnnaToyMC import AnnaToyMC
+from .AnnaParallelFilter import AnnaParallelFilter
+from .AnnaFilterManifest import AnnaFilterManifest
+from .AnnaMultiFilter import AnnaMultiFilter
 # Tuple bank
 import TupleFilterBank as TupleFilterBank
 from TupleFilterBank import *
+from TupleFilterBank.AnnaDerivedColumns import AnnaDerivedColumns
+from TupleFilterBank.AnnaRDataFrameFilter import AnnaRDataFrameFilter
+from TupleFilterBank.AnnaTupleRef import AnnaTupleRef
 # ROOT and Ostap
 import ROOT
 import Ostap.ZipShelve as DBASE
 from Ostap.PyRoUts import *
 # Python
+import os
 import sys
 import logging
 from logging import debug, error, info, warning
@@ -77,10 +88,47 @@ class AnnaFacade:
         return "I am your father"
 
     # ______________________________________
-    def CreateFilteredTuple(self, tuple_filter_name='AnnaTupleFilterJpsiPbPb'):
+    def CreateFilteredTuple(self, tuple_filter_name='AnnaTupleFilterJpsiPbPb',
+        columnar=False, chunk_size=100000, nworkers=1, split='file',
+        incremental=False, checksum=False, multiplex=False, derived_cache=False,
+        rdataframe=False, nthreads=1):
         """
         Fill and save a filtered tuple from self.data after applying cuts
         on leafs.
+
+        The tuple is written in a ROOT file (see GetTupleFilePath) and
+        the result file only stores an AnnaTupleRef to it, that can be
+        given back as data for FitParticle.
+
+        Keyword Arguments:
+            tuple_filter_name {str} -- class from the TupleFilterBank
+            columnar {bool} -- read the chain in chunks of numpy arrays
+                instead of entry by entry (see AnnaTupleFilterBase.GetTupleColumnar)
+            chunk_size {int} -- entries per chunk in columnar mode
+            nworkers {int} -- if > 1, filter the chain with a pool of
+                nworkers processes (see AnnaParallelFilter)
+            split {str} -- how the chain is shared between the workers,
+                'file' or 'cluster' (columnar mode only)
+            incremental {bool} -- only filter the files of the chain that are
+                new or changed since the last run, and add them to the
+                previous output (see AnnaFilterManifest)
+            checksum {bool} -- in incremental mode, also compare the adler32
+                of the input files
+            multiplex {bool} -- read the chain once, in chunks, for all the
+                MotherLeaf x DaughterLeafs filters (see AnnaMultiFilter),
+                in this process: not with incremental, nworkers > 1 or rdataframe
+            derived_cache {bool} -- read the vertex and lifetime quantities
+                from a cache built once per input file (see AnnaDerivedColumns)
+            rdataframe {bool} -- run the filter as a compiled RDataFrame
+                graph (see AnnaRDataFrameFilter)
+            nthreads {int} -- threads of the RDataFrame backend, 0 for all the
+                cores: with more than one, a ghost candidate can be kept at a
+                cluster boundary (see AnnaRDataFrameFilter)
+
+        Returns:
+            dict -- AnnaCutFlow per MotherLeaf x DaughterLeafs, by the
+                suffix of the tuple file (see GetTupleSuffix), also saved
+                next to the tuple as CutFlow_<suffix>
         """
 
         print(" ================================================================ ")
@@ -96,9 +144,33 @@ class AnnaFacade:
             error('Need something to run on !')
             return
 
+        # The multiplexed read is serial and always by chunks
+        if multiplex is True:
+            incompatible = [
+                option for option, value in [
+                    ('incremental', incremental), ('nworkers > 1', nworkers > 1), ('rdataframe', rdataframe)]
+                if value is True]
+            if len(incompatible) > 0:
+                error('multiplex cannot be combined with {}'.format(', '.join(incompatible)))
+                return
+            if columnar is False:
+                warning('multiplex always reads the chain in chunks, columnar=False is ignored')
+
+        # One filter per MotherLeaf x DaughterLeafs
+        filters = list()
         for mother_leaf in self.configfile.map['MotherLeaf']:
             if mother_leaf == "#":
                 continue
+
+            derived_columns = None
+            if derived_cache is True:
+                derived_columns = AnnaDerivedColumns(
+                    mother_leaf,
+                    os.path.join(self.GetTupleDirectory(), 'AnnaDerived'))
+                if derived_columns.AddFriend(self.data) is False:
+                    error('Cannot cache the derived columns of {}'.format(mother_leaf))
+                    return
+
             for daughters_leaf in self.configfile.map['DaughterLeafs']:
 
                 # get the module
@@ -106,23 +178,84 @@ class AnnaFacade:
                     module = getattr(TupleFilterBank, tuple_filter_name)
                 except AttributeError:
                     error('Cannot find {} module'.format(tuple_filter_name))
+                    return
 
                 # Instance the object
                 try:
                     TupleFilter = getattr(module, tuple_filter_name)(mother_leaf, daughters_leaf)
                 except AttributeError:
                     error('Cannot find {} instance'.format(tuple_filter_name))
+                    return
+
+                # Stream the tuple on disk, only a reference is saved
+                TupleFilter.output_path = self.GetTupleFilePath(
+                    tuple_filter_name, mother_leaf, daughters_leaf)
+                TupleFilter.derived_columns = derived_columns
+                filters.append((
+                    mother_leaf,
+                    self.GetTupleSuffix(tuple_filter_name, mother_leaf, daughters_leaf),
+                    TupleFilter))
+
+        # Get the tuples
+        if multiplex is True:
+            multi_filter = AnnaMultiFilter(
+                [TupleFilter for mother_leaf, suffix, TupleFilter in filters], chunk_size)
+            multi_filter.ActivateBranches(self.data)
+            ntuples = multi_filter.GetTuples(self.data)
+        else:
+            ntuples = list()
+            for mother_leaf, suffix, TupleFilter in filters:
+
+                # Only read the branches the filter needs
+                TupleFilter.ActivateBranches(self.data)
+
+                if incremental is True:
+                    manifest = AnnaFilterManifest(TupleFilter, TupleFilter.output_path, checksum)
+                    ntuple = AnnaParallelFilter(
+                        TupleFilter,
+                        nworkers=nworkers,
+                        columnar=columnar,
+                        chunk_size=chunk_size).GetTupleIncremental(self.data, manifest)
+                elif rdataframe is True:
+                    ntuple = AnnaRDataFrameFilter(TupleFilter, nthreads).GetTuple(self.data)
+                elif nworkers > 1:
+                    ntuple = AnnaParallelFilter(
+                        TupleFilter,
+                        nworkers=nworkers,
+                        split=split,
+                        columnar=columnar,
+                        chunk_size=chunk_size).GetTuple(self.data)
+                elif columnar is True:
+                    ntuple = TupleFilter.GetTupleColumnar(self.data, chunk_size)
+                else:
+                    ntuple = TupleFilter.GetTuple(self.data)
+                ntuples.append(ntuple)
+
+        cutflows = dict()
+        for (mother_leaf, suffix, TupleFilter), ntuple in zip(filters, ntuples):
+            if ntuple is not None:
+                # One cut-flow per filter configuration
+                TupleFilter.cutflow.name = 'CutFlow_' + suffix
+                # The statistics index is saved with the reference
+                if isinstance(ntuple, AnnaTupleRef) and has_numpy is True:
+                    stats = ntuple.GetStats()
+                    if stats is not None:
+                        print(stats)
+                # Saved by suffix, the reference keeps the name of the tree
+                self.SaveResult(
+                    ntuple,
+                    'Tuple/{}'.format(mother_leaf),
+                    suffix)
+                self.SaveResult(
+                    TupleFilter.cutflow,
+                    'Tuple/{}'.format(mother_leaf))
+                cutflows[suffix] = TupleFilter.cutflow
+            else:
+                error("CreateFilteredTuple: Cannot get Tuple for {}".format(suffix))
 
-                # Get the tuple
-                ntuple = TupleFilter.GetTuple(self.data)
+        self.data.SetBranchStatus('*', 1)
 
-                if ntuple is not None:
-                    self.SaveResult(
-                        ntuple,
-                        'Tuple/{}'.format(mother_leaf))
-                else:
-                    error("CreateFilteredTuple: Cannot get Tuple")
-                    continue
+        return cutflows
 
     # ______________________________________
     def DrawMinv(self, particle_name="JPsi"):
@@ -196,12 +329,16 @@ class AnnaFacade:
         return
 
     # ______________________________________
-    def FitParticle(self, particle_name="JPsi", binning=[], option=""):
+    def FitParticle(self, particle_name="JPsi", binning=[], option="",
+        ncores=None, nworkers=None, cache=True, warm_start=False, engine='roofit', adaptive=False,
+        headless=False, dry_run=False):
         """Main Fit method
 
         Run over all combination of Centrality/Cut/Leaf from the config.
         The fit process is passed to AnnaFitter class that return an
-        AnnaSpectra to be stored in the result TFile.
+        AnnaSpectra to be stored in the result TFile. The combinations
+        are planned by an AnnaFitPlanner, that merges the identical ones,
+        and all the fits run as tasks of an AnnaFitScheduler.
 
         Keyword Arguments:
             particle_name {str} -- To set the particle mass
@@ -211,6 +348,28 @@ class AnnaFacade:
                 example :
                     ["JPSI_PT", 0., 4000., 8000.])
             option {str} -- possible options (for futur dvlp) (default: {""})
+            ncores {int} -- cores for all the fits, None for all the cores
+                of the machine (see AnnaFitScheduler) (default: {None})
+            nworkers {int} -- fit processes, the ncores are shared between
+                them and RooFit, 1 to fit in this process (default: {None})
+            cache {bool} -- only redo the fits whose histogram or fit type
+                changed since the last run (see AnnaFitCache) (default: {True})
+            warm_start {bool} -- fit the bins one after the other from
+                converged parameters, refit only when not converged
+                (see AnnaFitter.FitHistosWarm) (default: {False})
+            engine {str} -- 'roofit', 'numpy' or 'check' to compare
+                both (see AnnaFitter) (default: {'roofit'})
+            adaptive {bool} -- unbinned fits at low statistics, binning
+                scaled to the statistics otherwise
+                (see AnnaFitter.GetFitBinning) (default: {False})
+            headless {bool} -- do not draw the fits, keep their sampled
+                curves instead of the frames (see AnnaSpectra.DrawResults)
+                (default: {False})
+            dry_run {bool} -- only print the task graph and its cost
+                estimate (see AnnaFitPlanner) (default: {False})
+
+        Returns:
+            AnnaFitPlanner -- in dry run mode
         """
 
         print(" ================================================================ ")
@@ -222,58 +381,42 @@ class AnnaFacade:
             .format(self.configfile.map))
 
         # Check data type
-        if self.data is not None:
-            if isinstance(self.data, ROOT.TNtuple) is False:
-                error('Need a ROOT.TNtuple instead of {} !'.format(type(self.data)))
+        data = self.GetTuple(self.data)
+        data2 = self.GetTuple(self.data2)
+        if data is not None:
+            if isinstance(data, ROOT.TTree) is False:
+                error('Need a ROOT.TTree or AnnaTupleRef instead of {} !'.format(type(self.data)))
                 return
         else:
             error('Need something to run on !')
             return
 
-        for centrality in self.configfile.map['Centrality']:
-            for cut in self.configfile.map['CutCombination']:
-                for leaf in self.configfile.map['MotherLeaf']:
-                    spectrapath = "{}/FitParticle/{}/{}/{}".format(
-                        self.data.GetName(),
-                        centrality,
-                        cut,
-                        leaf)
-                    fitter = AnnaFitter(particle_name, binning)
-                    spectra = fitter.Fit(
-                        self.data,
-                        leaf,
-                        centrality,
-                        cut,
-                        self.configfile.map['FitType'],
-                        option)
-                    if spectra is None:
-                        error('Cannot get spectra')
-                        continue
-                    self.SaveResult(spectra, spectrapath)
-
-                    if self.data2 is not None:
-                        if isinstance(self.data, ROOT.NTuple):
-                            error('Need a ROOT.TNtuple for second data object!')
-                            return
-                        spectrapath = "{}/FitParticle/{}/{}/{}".format(
-                            self.data2.GetName(),
-                            centrality,
-                            cut,
-                            leaf
-                        )
-                        fitter = AnnaFitter(particle_name, binning)
-                        spectra = fitter.Fit(
-                            self.data2,
-                            leaf,
-                            centrality,
-                            cut,
-                            self.configfile.map['FitType'],
-                            option
-                        )
-                        if spectra is None:
-                            error('Cannot get spectra')
-                            continue
-                        self.SaveResult(spectra, spectrapath)
+        if data2 is not None:
+            if isinstance(data2, ROOT.TTree) is False:
+                error('Need a ROOT.TTree or AnnaTupleRef for second data object!')
+                return
+
+        # The campaign is planned once from the config
+        planner = AnnaFitPlanner(
+            particle_name, binning, self.configfile.map, engine=engine, adaptive=adaptive, headless=headless)
+        planner.AddData(data, self.GetTupleStats(self.data))
+        if data2 is not None:
+            planner.AddData(data2, self.GetTupleStats(self.data2))
+        if planner.Build() is False:
+            error('Cannot plan the fits')
+            return
+        print(planner)
+        if dry_run is True:
+            return planner
+
+        # Every fit of the campaign is a task of the scheduler
+        scheduler = AnnaFitScheduler(
+            ncores, nworkers, AnnaFitCache() if cache is True else None, warm_start)
+        for spectrapath, spectra in planner.Run(scheduler):
+            if spectra is None:
+                error('Cannot get spectra')
+                continue
+            self.SaveResult(spectra, spectrapath)
 
     # ______________________________________
     def GetResultFile(self):
@@ -315,7 +458,141 @@ class AnnaFacade:
                     return None
 
     # ______________________________________
-    def SaveResult(self, result, result_path):
+    def GetTuple(self, data):
+        """
+        Return the tuple behind an AnnaTupleRef,
+        other data objects are returned as is
+        """
+
+        if isinstance(data, AnnaTupleRef):
+            return data.GetTuple()
+        return data
+
+    # ______________________________________
+    def GetTupleStats(self, data):
+        """
+        Return the statistics index of an AnnaTupleRef
+        (see AnnaTupleStats), None for other data objects
+        """
+
+        if isinstance(data, AnnaTupleRef) and has_numpy is True:
+            return data.GetStats()
+        return None
+
+    # ______________________________________
+    def GetTupleDirectory(self):
+        """
+        Return the directory of the filtered tuples
+        (TupleFilePath key of the config file)
+        """
+
+        directory = self.configfile.map['TupleFilePath']
+        if isinstance(directory, list):
+            if len(directory) > 1:
+                warning(
+                    'Many path for the tuple file are setted ({}), I will take the first one'
+                    .format(directory))
+            directory = directory[0]
+        if directory == "#":
+            directory = os.getcwd()
+
+        return directory
+
+    # ______________________________________
+    def GetTupleFilePath(self, tuple_filter_name, mother_leaf, daughters_leaf):
+        """
+        Return the ROOT file in which the filtered tuple is written
+        """
+
+        return os.path.join(
+            self.GetTupleDirectory(),
+            'AnnaTuple_{}.root'.format(
+                self.GetTupleSuffix(tuple_filter_name, mother_leaf, daughters_leaf)))
+
+    # ______________________________________
+    def GetTupleSuffix(self, tuple_filter_name, mother_leaf, daughters_leaf):
+        """
+        Name of a filter configuration, in its tuple file and cut-flow names
+        """
+
+        return '{}_{}_{}'.format(
+            tuple_filter_name,
+            mother_leaf,
+            '_'.join(daughters_leaf) if isinstance(daughters_leaf, list) else daughters_leaf)
+
+    # ______________________________________
+    def RunToys(self, particle_name="JPsi", binning=[], spectra_name="", root='',
+        ntoys=100, ncores=None, nworkers=None, seed=0, parameters=None, engine='roofit', adaptive=False):
+        """Fit stability of the fit results with toys
+
+        Every converged subresult of the spectra of the
+        Centrality/Cut/Leaf combinations from the config is the model
+        of ntoys pseudo-datasets fitted again (see AnnaToyMC). The bias
+        and pull summaries are stored in the subresults and the
+        spectra saved back in the result file.
+
+        Keyword Arguments:
+            particle_name {str} -- (default: {"JPsi"})
+            binning {list} -- binning of the fits, see FitParticle (default: {[]})
+            spectra_name {str} -- The name of the spectra (default: {""})
+            root {str} -- The name of the root in the data file (default: {''})
+            ntoys {int} -- toys per subresult (default: {100})
+            ncores {int} -- see FitParticle (default: {None})
+            nworkers {int} -- see FitParticle (default: {None})
+            seed {int} -- the toys only depend on it (default: {0})
+            parameters {list} -- studied parameters, None for the
+                signal yield, mean and width (default: {None})
+            engine {str} -- engine of the toy fits, see FitParticle (default: {'roofit'})
+            adaptive {bool} -- see FitParticle (default: {False})
+        """
+
+        print(" ================================================================ ")
+        print("         RunToys {} for spectra {}".format(particle_name, spectra_name))
+        print(" ================================================================ ")
+
+        file = self.GetResultFile()
+        if file is None:
+            return
+
+        fitter = AnnaFitter(particle_name, binning, engine=engine, adaptive=adaptive)
+        fit_types = [
+            fit_type if isinstance(fit_type, list) else [fit_type]
+            for fit_type in self.configfile.map['FitType'] if fit_type != "#"]
+
+        toys = AnnaToyMC(ntoys, ncores, nworkers, seed, parameters)
+        spectras = list()
+        for centrality in self.configfile.map['Centrality']:
+            for cut in self.configfile.map['CutCombination']:
+                for leaf in self.configfile.map['MotherLeaf']:
+                    spectrapath = "{}/FitParticle/{}/{}/{}".format(root, centrality, cut, leaf)
+                    spectra = file.get('{}/{}'.format(spectrapath, spectra_name))
+                    if spectra is None:
+                        warning(
+                            'Cannot find spectra in {}/{}, continue ...'
+                            .format(spectrapath, spectra_name))
+                        continue
+                    spectras.append((spectrapath, spectra))
+
+                    for bin, result in spectra.GetResults().items():
+                        if result is None or result.subresults is None:
+                            continue
+                        for subresult in result.subresults.values():
+                            if subresult.histo is None:
+                                continue
+                            for fit_type in fit_types:
+                                if fitter.GetSubResultName(fit_type, subresult.histo) == subresult.GetName():
+                                    toys.AddSubResult(
+                                        '{}/{}/{}'.format(spectrapath, bin, subresult.GetName()),
+                                        fitter, fit_type, subresult)
+                                    break
+        file.close()
+
+        toys.Run()
+        for spectrapath, spectra in spectras:
+            self.SaveResult(spectra, spectrapath)
+
+    # ______________________________________
+    def SaveResult(self, result, result_path, result_name=None):
         """Add result to RootShelve file result.
 
         The method create / get a RootShelve file in the local directory
@@ -324,8 +601,15 @@ class AnnaFacade:
         Arguments:
             result {[type]} -- must inherit from TObject
             result_path {[type]} -- path inside AnnaResults.root
+
+        Keyword Arguments:
+            result_name {str} -- key inside result_path, None for
+                result.GetName() (default: {None})
         """
 
+        if result_name is None:
+            result_name = result.GetName()
+
         # Create / get results file in the local directory """
         db = self.GetResultFile()
 
@@ -334,21 +618,21 @@ class AnnaFacade:
 
             # Check if file exists
             try:
-                o = db[str(result_path + '/' + result.GetName())]
+                o = db[str(result_path + '/' + result_name)]
             except KeyError:
-                print("No object in {}/{}".format(result_path, result.GetName()))
+                print("No object in {}/{}".format(result_path, result_name))
                 o = None
 
             if o is not None:
-                print("Replacing {}/{}".format(result_path, result.GetName()))
+                print("Replacing {}/{}".format(result_path, result_name))
                 del o
 
-            db[str(result_path + '/' + result.GetName())] = result
-            if db[str(result_path + '/' + result.GetName())] is not None:
-                print("+++result {}/{} adopted".format(result_path, result.GetName()))
+            db[str(result_path + '/' + result_name)] = result
+            if db[str(result_path + '/' + result_name)] is not None:
+                print("+++result {}/{} adopted".format(result_path, result_name))
 
             else:
-                error("Could not adopt result {}".format(result.GetName()))
+                error("Could not adopt result {}".format(result_name))
                 db.close()
                 return
 
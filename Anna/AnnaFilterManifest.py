@@ -0,0 +1,246 @@
+# =============================================================================
+#  @class AnnaFilterManifest
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-04-10
+
+import ROOT
+from TupleFilterBank.AnnaCutFlow import AnnaCutFlow
+from TupleFilterBank.AnnaTupleRef import AnnaTupleRef
+# Python
+import hashlib
+import json
+import os
+import zlib
+from logging import error, info, warning
+
+
+# ______________________________________
+class AnnaFilterManifest:
+    """Bookkeeping of the input files already filtered
+
+    The manifest is a json file written next to the filtered tuple.
+    Each processed input file is recorded with its size and mtime
+    (or ROOT UUID for remote files), an optional adler32 checksum,
+    the part file holding its filtered entries and its cut-flow.
+    The whole manifest is bound to the filter fingerprint
+    (class, leafs, masks, columns): if the filter changes, all the
+    parts are invalidated.
+
+    The manifest is saved after each input file, so an interrupted
+    run resumes from the last completed file.
+    """
+
+    # ______________________________________
+    def __init__(self, tuple_filter, tuple_path, checksum=False):
+        """cstr
+
+        Arguments:
+            tuple_filter {AnnaTupleFilterBase} -- the configured filter
+            tuple_path {str} -- the filtered tuple file, the parts are
+                written in <tuple_path without .root>_parts/
+
+        Keyword Arguments:
+            checksum {bool} -- also compare the adler32 of local
+                files, slower but robust to touched files (default: {False})
+        """
+
+        self.tuple_filter = tuple_filter
+        self.checksum = checksum
+        self.path = os.path.splitext(tuple_path)[0] + '.manifest.json'
+        self.part_dir = os.path.splitext(tuple_path)[0] + '_parts'
+        self.fingerprint = tuple_filter.GetFingerprint()
+        self.files = dict()
+        self.Load()
+
+    # ______________________________________
+    def __str__(self):
+        return "AnnaFilterManifest {} ({} files)".format(self.path, len(self.files))
+
+    # ______________________________________
+    def AddFile(self, file_path, part_path, cutflow):
+        """Record a filtered input file and save the manifest
+
+        Arguments:
+            file_path {str} -- input file
+            part_path {str} -- file with its filtered entries
+            cutflow {AnnaCutFlow} -- cut-flow of the filter for this file
+        """
+
+        f = ROOT.TFile.Open(part_path)
+        if not f or f.IsZombie():
+            error('Cannot open {}, {} not recorded'.format(part_path, file_path))
+            return
+        tree = f.Get(self.tuple_filter.name)
+        kept = tree.GetEntries() if tree else 0
+        f.Close()
+
+        record = self.GetFileInfo(file_path)
+        if record is None:
+            return
+        record['part'] = os.path.abspath(part_path)
+        record['kept'] = kept
+        record['cutflow'] = cutflow.ToDict()
+        self.files[file_path] = record
+        self.Save()
+
+    # ______________________________________
+    def GetAdler32(self, file_path):
+        value = 1
+        with open(file_path, 'rb') as f:
+            block = f.read(1 << 24)
+            while block:
+                value = zlib.adler32(block, value)
+                block = f.read(1 << 24)
+        return '{:08x}'.format(value & 0xffffffff)
+
+    # ______________________________________
+    def GetCutFlow(self):
+        """
+        Sum of the cut-flows of all the recorded files
+        """
+
+        cutflow = AnnaCutFlow()
+        for path in sorted(self.files):
+            cutflow.Add(AnnaCutFlow(content=self.files[path]['cutflow']))
+        return cutflow
+
+    # ______________________________________
+    def GetFileInfo(self, file_path):
+        """Identity of an input file
+
+        Returns:
+            dict -- size and mtime for local files, size and
+                ROOT UUID otherwise. None if the file cannot be read
+        """
+
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            record = {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+            if self.checksum is True:
+                record['adler32'] = self.GetAdler32(file_path)
+            return record
+
+        f = ROOT.TFile.Open(file_path)
+        if not f or f.IsZombie():
+            error('Cannot open {}'.format(file_path))
+            return None
+        record = {'size': f.GetSize(), 'uuid': f.GetUUID().AsString()}
+        f.Close()
+        return record
+
+    # ______________________________________
+    def GetPartPath(self, file_path):
+        """
+        Part file of an input file, unique per input path
+        """
+
+        key = hashlib.sha1(file_path.encode('utf-8')).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        return os.path.join(self.part_dir, '{}_{}.root'.format(name, key))
+
+    # ______________________________________
+    def GetPendingFiles(self, chain):
+        """Input files of the chain that are new or have changed
+
+        Arguments:
+            chain {TChain}
+
+        Returns:
+            list -- (file path, tree name) pairs in the chain order
+        """
+
+        pending = list()
+        for element in chain.GetListOfFiles():
+            file_path = element.GetTitle()
+            if self.IsDone(file_path) is False:
+                pending.append((file_path, element.GetName()))
+
+        info(
+            'GetPendingFiles: {} new or changed files, {} already filtered'
+            .format(len(pending), len(self.files)))
+        return pending
+
+    # ______________________________________
+    def GetTupleRef(self, chain):
+        """Reference to all the recorded parts
+
+        Parts follow the chain order, files recorded by a previous
+        run but not in the chain anymore come last.
+
+        Returns:
+            AnnaTupleRef
+        """
+
+        paths = [element.GetTitle() for element in chain.GetListOfFiles()]
+        paths += sorted([path for path in self.files if path not in paths])
+
+        ref = AnnaTupleRef(self.tuple_filter.name)
+        for path in paths:
+            if path in self.files:
+                ref.AddFile(self.files[path]['part'], self.files[path]['kept'])
+        return ref
+
+    # ______________________________________
+    def IsDone(self, file_path):
+        """
+        True if the file was filtered and did not change since
+        """
+
+        record = self.files.get(file_path)
+        if record is None or os.path.isfile(record['part']) is False:
+            return False
+
+        current = self.GetFileInfo(file_path)
+        if current is None:
+            return False
+        for key in current:
+            if record.get(key) != current[key]:
+                return False
+        return True
+
+    # ______________________________________
+    def Load(self):
+        """
+        Read the manifest, it is dropped if the filter changed
+        """
+
+        if os.path.isfile(self.path) is False:
+            return
+
+        try:
+            with open(self.path) as f:
+                content = json.load(f)
+        except ValueError:
+            warning('Cannot read {}, start from scratch'.format(self.path))
+            return
+
+        if content.get('fingerprint') != self.fingerprint:
+            warning(
+                '{} was made with another filter definition, start from scratch'
+                .format(self.path))
+            return
+
+        self.files = content['files']
+
+    # ______________________________________
+    def Save(self):
+        """
+        Write the manifest, atomically so that an interruption
+        never leaves a truncated file
+        """
+
+        if os.path.isdir(os.path.dirname(os.path.abspath(self.path))) is False:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)))
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(
+                {'filter': self.tuple_filter.__class__.__name__,
+                 'fingerprint': self.fingerprint,
+                 'files': self.files},
+                f, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+# =============================================================================
+# The END
+# =============================================================================
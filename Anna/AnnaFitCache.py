@@ -0,0 +1,167 @@
+# =============================================================================
+#  @class AnnaFitCache
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-05-09
+
+# Ostap
+import Ostap.ZipShelve as DBASE
+# Python
+import copy
+import hashlib
+import json
+from logging import debug, error, info
+
+
+# ______________________________________
+class AnnaFitCache:
+    """Fit subresults stored by the content of their inputs
+
+    The key of a fit is a hash of the histogram (binning, contents
+    and errors, and the entries of an unbinned fit) and of AnnaFitter.GetFitSpec (PDFs, range, parameter
+    overrides, particle mean and width, engine and fit modes, warm start
+    included, so that warm and cold fits are kept apart): a fit is only redone when
+    one of them changed, whatever the name of the histogram or the
+    order of the key=value pairs of the fit type.
+
+    The subresults (parameters, fit and covariance status, frame or curves)
+    are kept in a DBASE, without their histogram. They are given back
+    with the name, title and histogram of the current fit.
+
+    The converged parameters of each bin are also kept under a key
+    that does not depend on the histogram content nor on the warm
+    start mode (see GetSeedKey),
+    to warm-start the fit of the same bin in the next campaign
+    (see AnnaFitter.FitHistosWarm).
+    """
+
+    # Bump when the content of the subresults changes
+    version = 3
+
+    # ______________________________________
+    def __init__(self, path='AnnaFitCache'):
+        """cstr
+
+        Keyword Arguments:
+            path {str} -- the DBASE file (default: {'AnnaFitCache'})
+        """
+
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    # ______________________________________
+    def Get(self, keys):
+        """Stored subresults or seeds
+
+        Arguments:
+            keys {list} -- see GetKey and GetSeedKey
+
+        Returns:
+            dict -- AnnaResult or seed by key, for the keys found
+        """
+
+        found = dict()
+        db = DBASE.open(self.path)
+        if db is None:
+            error('Cannot open {}'.format(self.path))
+            return found
+        for key in keys:
+            if key in db:
+                found[key] = db[key]
+        db.close()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        info('Get: {} of {} entries found in {}'.format(len(found), len(keys), self.path))
+        return found
+
+    # ______________________________________
+    def GetHistoHash(self, histo):
+        """
+        Hash of the binning, contents and errors of a TH1
+        """
+
+        axis = histo.GetXaxis()
+        content = [axis.GetNbins(), repr(axis.GetXmin()), repr(axis.GetXmax())]
+        for i in range(axis.GetNbins() + 2):
+            content.append([repr(histo.GetBinContent(i)), repr(histo.GetBinError(i))])
+        return hashlib.sha1(json.dumps(content).encode('utf-8')).hexdigest()
+
+    # ______________________________________
+    def GetKey(self, histo, fit_spec, values=None):
+        """Key of a fit
+
+        Arguments:
+            histo {TH1}
+            fit_spec {dict} -- see AnnaFitter.GetFitSpec
+
+        Keyword Arguments:
+            values {array} -- entries of the histo for an unbinned
+                fit, see AnnaFitter.FillHistos (default: {None})
+
+        Returns:
+            str
+        """
+
+        content = [self.version, self.GetHistoHash(histo), fit_spec]
+        if values is not None:
+            content.append(hashlib.sha1(values.tobytes()).hexdigest())
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    # ______________________________________
+    def GetSeedKey(self, spectra_key, histo, fit_spec):
+        """Key of the seed of a bin
+
+        Arguments:
+            spectra_key {str} -- e.g. the path of the spectra in the result file
+            histo {TH1}
+            fit_spec {dict} -- see AnnaFitter.GetFitSpec
+
+        Returns:
+            str
+        """
+
+        content = [self.version, spectra_key, histo.GetName(), fit_spec]
+        return 'seed_' + hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    # ______________________________________
+    def Put(self, subresults, seeds=None):
+        """Store subresults
+
+        Arguments:
+            subresults {dict} -- AnnaResult by key
+
+        Keyword Arguments:
+            seeds {dict} -- seed by seed key (default: {None})
+        """
+
+        if len(subresults) == 0 and not seeds:
+            return
+        db = DBASE.open(self.path)
+        if db is None:
+            error('Cannot open {}'.format(self.path))
+            return
+        for key, subresult in subresults.items():
+            stored = copy.copy(subresult)
+            stored.histo = None
+            db[key] = stored
+            debug('Put: {} stored as {}'.format(subresult.GetName(), key))
+        if seeds is not None:
+            for key, seed in seeds.items():
+                db[key] = seed
+        db.close()
+
+    # ______________________________________
+    def Restore(self, subresult, name, histo):
+        """
+        Give a stored subresult the name and histogram of the current fit
+        """
+
+        subresult.name = name
+        subresult.title = histo.GetTitle()
+        subresult.histo = histo
+        return subresult
+
+# =============================================================================
+# The END
+# =============================================================================
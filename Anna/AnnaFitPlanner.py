@@ -0,0 +1,418 @@
+# =============================================================================
+#  @class AnnaFitPlanner
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-05-18
+
+from .AnnaFitter import AnnaFitter, has_numpy
+# Python
+import json
+from logging import debug, error, warning
+
+
+# ______________________________________
+class AnnaFitPlanner:
+    """Fit campaign compiled from the config into a task graph
+
+    The Centrality, CutCombination, MotherLeaf and FitType entries of
+    the config are parsed once: the fit types are decoded into fit
+    specifications (see AnnaFitter.GetFitSpec) and the centralities
+    and cuts into selections. Entries giving the same fit or the same
+    selection (duplicated lines, reordered key=value pairs, unknown
+    centralities and "#" that both mean no cut...) are merged.
+
+    The campaign is then a graph of nodes:
+        fill -- one read of a tuple for all its histograms (AnnaFitter.FillHistos)
+        fit -- one bin of one selection fitted with one fit specification,
+            depends on the fill of its tuple
+        store -- one spectra saved in the result file, depends on the
+            fits of its selection. Several stores can share the same fits.
+
+    Print the planner for the graph and the cost estimate before running it:
+
+        planner = AnnaFitPlanner('JPsi', binning, config.map)
+        planner.AddData(tree, stats)
+        if planner.Build() is True:
+            print(planner)
+            for path, spectra in planner.Run(scheduler):
+                ...
+    """
+
+    # Cost model of the estimate: seconds per fit and
+    # per value read from a tuple
+    fit_seconds = {'roofit': 2., 'numpy': 0.2, 'check': 2.2}
+    read_seconds = 2e-8
+
+    # ______________________________________
+    def __init__(self, particle_name, binning, config_map, engine='roofit', adaptive=False, headless=False):
+        """cstr
+
+        Arguments:
+            particle_name {str} -- see AnnaFitter
+            binning {list} -- see AnnaFitter
+            config_map {dict} -- AnnaConfig.map
+
+        Keyword Arguments:
+            engine {str} -- see AnnaFitter (default: {'roofit'})
+            adaptive {bool} -- see AnnaFitter (default: {False})
+            headless {bool} -- see AnnaFitter (default: {False})
+        """
+
+        self.particle_name = particle_name
+        self.binning = binning
+        self.config_map = config_map
+        self.engine = engine
+        self.adaptive = adaptive
+        self.headless = headless
+
+        self._fitter = None
+        self.datasets = list()
+        self.nodes = dict()
+        self.merged = {'fill': 0, 'fit': 0, 'store': 0}
+
+    # ______________________________________
+    def __str__(self):
+        cost = self.GetCost()
+        lines = [
+            ' --- Fit campaign of {} for {}'.format(self.particle_name, self.binning),
+            '     {} fill, {} fit and {} store tasks ({} fills, {} fits and {} stores merged)'.format(
+                cost['fills'], cost['fits'], cost['stores'],
+                self.merged['fill'], self.merged['fit'], self.merged['store']),
+            '     {} values read from the tuples, ~{:.0f} s'.format(cost['values'], cost['read_seconds'])]
+        if cost['empty'] > 0 or cost['unbinned'] > 0:
+            lines.append(
+                '     {} fits of bins expected to be empty skipped, {} unbinned'
+                ' (before the centrality and cut selections)'.format(cost['empty'], cost['unbinned']))
+        lines.append(
+            '     {} fits with the {} engine, ~{:.0f} s on one core (fits found in the cache are not counted)'
+            .format(cost['fits'] - cost['empty'], self.engine, cost['fit_seconds']))
+        return '\n'.join(lines)
+
+    # ______________________________________
+    def AddData(self, tree, stats=None):
+        """Add a tuple to the campaign
+
+        Arguments:
+            tree {TTree}
+
+        Keyword Arguments:
+            stats {AnnaTupleStats} -- statistics index of the tuple (default: {None})
+        """
+
+        self.datasets.append((tree, stats))
+
+    # ______________________________________
+    def AddNode(self, key, kind, content, deps=[]):
+        """
+        Add a node to the graph, or merge it with the identical node
+        """
+
+        if key in self.nodes:
+            self.merged[kind] += 1
+            return False
+        node = dict(content)
+        node['kind'] = kind
+        node['deps'] = list(deps)
+        node['order'] = len(self.nodes)
+        self.nodes[key] = node
+        return True
+
+    # ______________________________________
+    def Build(self):
+        """Parse the config and build the task graph
+
+        Returns:
+            bool -- False in case of error
+        """
+
+        self.nodes = dict()
+        self.merged = {'fill': 0, 'fit': 0, 'store': 0}
+        if len(self.datasets) == 0:
+            error('Need something to run on !')
+            return False
+
+        # Typed fit specifications, once per fit type
+        fit_types = self.GetFitTypes()
+        if len(fit_types) == 0:
+            error('No valid FitType in the config')
+            return False
+
+        centralities = self.GetUnique(
+            self.config_map['Centrality'], self.GetCentralityKey)
+        cuts = self.GetUnique(
+            self.config_map['CutCombination'], self.GetCutKey)
+        leafs = self.GetUnique(self.config_map['MotherLeaf'], lambda leaf: leaf)
+
+        for tree, stats in self.datasets:
+            fitter = AnnaFitter(
+                self.particle_name, self.binning, stats,
+                engine=self.engine, adaptive=self.adaptive, headless=self.headless)
+
+            # One read of the tuple for all its histograms
+            fill_key = ('fill', self.GetTreeKey(tree))
+            self.AddNode(fill_key, 'fill', {
+                'tree': tree,
+                'stats': stats,
+                'fitter': fitter,
+                'leafs': [leaf for leaf, key in leafs],
+                'centralities': [centrality for centrality, key in centralities],
+                'cuts': [cut for cut, key in cuts]})
+
+            for centrality, centrality_key in self.GetExpanded(self.config_map['Centrality'], self.GetCentralityKey):
+                for cut, cut_key in self.GetExpanded(self.config_map['CutCombination'], self.GetCutKey):
+                    for leaf, leaf_key in self.GetExpanded(self.config_map['MotherLeaf'], lambda leaf: leaf):
+                        group = (fill_key[1], leaf, centrality_key, cut_key)
+
+                        # Fits of the selection, by bin and fit specification
+                        fit_keys = list()
+                        for i, bin_limits in enumerate(fitter.GetBinsAsList()):
+                            for fit_type, spec_key in fit_types:
+                                fit_key = ('fit', group, i, spec_key)
+                                self.AddNode(fit_key, 'fit', {
+                                    'group': group,
+                                    'bin': i,
+                                    'bin_limits': bin_limits,
+                                    'fit_type': fit_type}, [fill_key])
+                                fit_keys.append(fit_key)
+
+                        # The spectra is stored in the path of the config entries
+                        path = "{}/FitParticle/{}/{}/{}".format(tree.GetName(), centrality, cut, leaf)
+                        self.AddNode(('store', path), 'store', {
+                            'path': path,
+                            'group': group,
+                            'selection': (leaf, self.GetRepresentative(centralities, centrality_key),
+                                          self.GetRepresentative(cuts, cut_key))}, fit_keys)
+
+        debug('Build: {} nodes, merged {}'.format(len(self.nodes), self.merged))
+        return True
+
+    # ______________________________________
+    def GetCentralityKey(self, centrality):
+        """
+        Centrality cut of an entry, null for no cut
+        (see AnnaFitter.FillHistos)
+        """
+
+        limits = self.GetFitter()._centrality.get(centrality)
+        if centrality == "branch":
+            limits = None
+        return json.dumps(limits)
+
+    # ______________________________________
+    def GetCost(self):
+        """Dry-run estimate of the campaign
+
+        Returns:
+            dict -- number of fill, fit and store tasks, values read,
+                fits of bins expected to be empty or unbinned
+                (from the statistics index) and estimated seconds
+        """
+
+        cost = {
+            'fills': 0, 'fits': 0, 'stores': 0, 'values': 0,
+            'empty': 0, 'unbinned': 0, 'read_seconds': 0., 'fit_seconds': 0.}
+        expected = dict()
+        for key, node in self.nodes.items():
+            if node['kind'] == 'fill':
+                cost['fills'] += 1
+                columns = len(node['leafs']) + len(node['fitter'].GetBinType().split('--')) + \
+                    len([cut for cut in node['cuts'] if cut != "#"]) + 1
+                cost['values'] += int(node['tree'].GetEntries()) * columns
+                for i, bin_limits in enumerate(node['fitter'].GetBinsAsList()):
+                    expected[(key[1], i)] = self.GetExpectedEntries(node, bin_limits)
+            elif node['kind'] == 'store':
+                cost['stores'] += 1
+
+        for key, node in self.nodes.items():
+            if node['kind'] != 'fit':
+                continue
+            cost['fits'] += 1
+            entries = expected.get((node['group'][0], node['bin']))
+            if entries is None:
+                continue
+            if entries < 1.:
+                cost['empty'] += 1
+            elif self.adaptive is True and entries < AnnaFitter._unbinned_entries:
+                cost['unbinned'] += 1
+
+        cost['read_seconds'] = cost['values'] * self.read_seconds
+        cost['fit_seconds'] = (cost['fits'] - cost['empty']) * self.fit_seconds.get(self.engine, 1.)
+        return cost
+
+    # ______________________________________
+    def GetCutKey(self, cut):
+        return json.dumps(None if cut == "#" else cut)
+
+    # ______________________________________
+    def GetEntries(self, entries):
+        """
+        Config entries as a list of str ("#" when not set)
+        """
+
+        if not isinstance(entries, list):
+            entries = [entries]
+        return [
+            "|".join(entry) if isinstance(entry, list) else entry
+            for entry in entries]
+
+    # ______________________________________
+    def GetExpanded(self, entries, get_key):
+        """
+        (entry, key) of each config entry, in the config order
+        """
+
+        return [(entry, get_key(entry)) for entry in self.GetEntries(entries)]
+
+    # ______________________________________
+    def GetExpectedEntries(self, node, bin_limits):
+        """
+        Entries expected in a bin from the statistics index,
+        None if unknown
+        """
+
+        stats = node['stats']
+        names = node['fitter'].GetBinType().split('--')
+        if stats is None:
+            return None
+        fraction = 1.
+        for i, name in enumerate(names):
+            if stats.HasColumn(name) is False:
+                return None
+            fraction *= stats.GetFraction(name, bin_limits[2 * i], bin_limits[2 * i + 1])
+        return stats.GetEntries(names[0]) * fraction
+
+    # ______________________________________
+    def GetFitTypes(self):
+        """
+        Valid fit types of the config with the key of their fit
+        specification, the same key for the fit types to be merged
+        """
+
+        fitter = self.GetFitter()
+        fit_types = list()
+        keys = set()
+        for fit_type in self.config_map['FitType']:
+            if fit_type == "#":
+                continue
+            if not isinstance(fit_type, list):
+                fit_type = [fit_type]
+            spec = fitter.GetFitSpec(fit_type)
+            if spec is None:
+                error('Cannot decode FitType {}, skip it'.format(fit_type))
+                continue
+            key = json.dumps(spec, sort_keys=True)
+            if key in keys:
+                warning('FitType {} is the same fit as a previous one, merged'.format(fit_type))
+            keys.add(key)
+            fit_types.append((fit_type, key))
+        return fit_types
+
+    # ______________________________________
+    def GetFitter(self):
+        """
+        Fitter used to decode the config
+        """
+
+        if self._fitter is None:
+            self._fitter = AnnaFitter(
+                self.particle_name, self.binning,
+                engine=self.engine, adaptive=self.adaptive, headless=self.headless)
+        return self._fitter
+
+    # ______________________________________
+    def GetRepresentative(self, unique, key):
+        """
+        First config entry of the merged entries with key
+        """
+
+        for entry, entry_key in unique:
+            if entry_key == key:
+                return entry
+        return None
+
+    # ______________________________________
+    def GetTreeKey(self, tree):
+        """
+        Identity of a tuple, the same tuple added twice is read once
+        """
+
+        current = tree.GetCurrentFile()
+        if current:
+            return '{}:{}'.format(current.GetName(), tree.GetName())
+        return '{}:{}'.format(id(tree), tree.GetName())
+
+    # ______________________________________
+    def GetUnique(self, entries, get_key):
+        """
+        (entry, key) of the config entries, one per key
+        """
+
+        unique = list()
+        keys = set()
+        for entry, key in self.GetExpanded(entries, get_key):
+            if key in keys:
+                continue
+            keys.add(key)
+            unique.append((entry, key))
+        return unique
+
+    # ______________________________________
+    def Run(self, scheduler):
+        """Execute the graph: the fills, then the fits on the
+        scheduler, then the spectra of the store nodes
+
+        Arguments:
+            scheduler {AnnaFitScheduler}
+
+        Returns:
+            list -- (path, AnnaSpectra) of the store nodes, in the config order
+        """
+
+        fit_types = dict()
+        for key, node in self.nodes.items():
+            if node['kind'] == 'fit':
+                fit_types.setdefault(node['group'], list())
+                if node['fit_type'] not in fit_types[node['group']]:
+                    fit_types[node['group']].append(node['fit_type'])
+
+        # One read per tuple
+        filled = dict()
+        for key, node in sorted(self.nodes.items(), key=lambda item: item[1]['order']):
+            if node['kind'] != 'fill':
+                continue
+            histos, values = dict(), dict()
+            if has_numpy is True:
+                histos = node['fitter'].FillHistos(
+                    node['tree'], node['leafs'], node['centralities'], node['cuts'],
+                    values if self.adaptive is True else None)
+                if histos is None:
+                    error('Cannot fill histos of {}'.format(node['tree'].GetName()))
+                    return list()
+            filled[key[1]] = (node, histos, values)
+
+        # The fits of each selection, once
+        stores = sorted(
+            [node for node in self.nodes.values() if node['kind'] == 'store'],
+            key=lambda node: node['order'])
+        groups = list()
+        for node in stores:
+            if node['group'] in groups:
+                continue
+            fill, histos, values = filled[node['group'][0]]
+            selection = node['selection']
+            fit_histos = histos.get(selection)
+            fit_values = values.get(selection)
+            if fit_histos is None:
+                fit_values = list() if self.adaptive is True else None
+                fit_histos = fill['fitter'].GetHistos(fill['tree'], selection[0], selection[1], selection[2], fit_values)
+            if fit_histos is None:
+                error("Cannot retrived histos for {}/{}/{}".format(*selection))
+                continue
+            scheduler.AddFits(node['group'], fill['fitter'], fit_histos, fit_types[node['group']], fit_values)
+            groups.append(node['group'])
+
+        spectras = dict(scheduler.Run())
+        return [(node['path'], spectras.get(node['group'])) for node in stores]
+
+# =============================================================================
+# The END
+# =============================================================================
@@ -0,0 +1,319 @@
+# =============================================================================
+#  @class AnnaFitScheduler
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-05-07
+
+from .AnnaFitter import AnnaFitter
+# Python
+import copy
+import json
+import multiprocessing
+from logging import error, info
+
+
+# Fitters of this process, by configuration
+_fitters = dict()
+
+
+# ______________________________________
+def GetTaskFitter(task):
+    """
+    Fitter of a task, shared by all the tasks of the process with
+    the same configuration so that its fit models are reused
+    (see AnnaFitter.GetModel)
+    """
+
+    key = json.dumps(
+        [task['particle'], task['binning'], task['ncpu'], task['engine'], task['adaptive'], task['headless']])
+    if key not in _fitters:
+        _fitters[key] = AnnaFitter(
+            task['particle'], task['binning'], ncpu=task['ncpu'], engine=task['engine'], adaptive=task['adaptive'],
+            headless=task['headless'])
+    return _fitters[key]
+
+
+# ______________________________________
+def RunFitTask(task):
+    """Fit one histogram with one fit type, or in warm start mode
+    all the histograms of a spectra with one fit type.
+
+    Executed in the worker processes of AnnaFitScheduler,
+    see GetTaskFitter.
+
+    Arguments:
+        task {dict} -- see AnnaFitScheduler.GetTasks and GetChains
+
+    Returns:
+        list -- (task index, FitHisto result) pairs
+    """
+
+    fitter = GetTaskFitter(task)
+    if 'histos' in task:
+        results = fitter.FitHistosWarm(
+            task['fit_type'], task['histos'], task['seeds'], task['to_fit'], task['values'])
+        return [
+            (index, results[i])
+            for i, index in enumerate(task['indices']) if task['to_fit'][i] is True]
+    return [(task['index'], fitter.FitHisto([task['fit_type']], task['histo'], values=task['values']))]
+
+
+# ______________________________________
+class AnnaFitScheduler:
+    """Run all the fits of a campaign with a pool of processes
+
+    Every (histogram, fit type) pair of the registered spectra is an
+    independent task. The tasks run in nworkers processes and each fit
+    is given ncores / nworkers cores for RooFit, so that the machine is
+    never oversubscribed: with fewer tasks than cores, the remaining
+    cores go to RooFit.
+
+    The subresults are put back in the order of the serial
+    AnnaFitter.Fit, and each fit starts from the same parameters
+    (see AnnaFitter.ResetParameters and GetModel), so the spectra are the
+    same as the serial ones.
+
+    With an AnnaFitCache, the fits whose histogram and fit
+    specification did not change are taken from the cache
+    and only the others are run.
+
+    In warm start mode, the bins of a spectra are fitted one after
+    the other for each fit type (see AnnaFitter.FitHistosWarm), so
+    the spectra and fit types are the parallel tasks. The bins found
+    in the cache seed their neighbours, and the bins to be fitted
+    again are seeded from the previous campaign.
+
+        scheduler = AnnaFitScheduler(ncores=16, nworkers=8)
+        scheduler.AddFits(path, fitter, histos, fit_types)
+        for path, spectra in scheduler.Run():
+            ...
+    """
+
+    # ______________________________________
+    def __init__(self, ncores=None, nworkers=None, cache=None, warm_start=False):
+        """cstr
+
+        Keyword Arguments:
+            ncores {int} -- cores for all the fits, None for
+                all the cores of the machine (default: {None})
+            nworkers {int} -- size of the process pool, None to use
+                one process per task up to ncores (default: {None})
+            cache {AnnaFitCache} -- where the fits are looked
+                for and stored (default: {None})
+            warm_start {bool} -- see AnnaFitter.FitHistosWarm (default: {False})
+        """
+
+        self.ncores = ncores if ncores is not None else multiprocessing.cpu_count()
+        self.nworkers = nworkers
+        self.cache = cache
+        self.warm_start = warm_start
+        self.fits = list()
+
+    # ______________________________________
+    def AddFits(self, key, fitter, histos, fit_types, values=None):
+        """Register the fits of one spectra
+
+        Arguments:
+            key {str} -- returned with the spectra, e.g. its path in the result file
+            fitter {AnnaFitter} -- with the particle and binning of the spectra
+            histos {list} -- as returned by AnnaFitter.GetHistos
+            fit_types {list} -- fit configuration strings
+
+        Keyword Arguments:
+            values {list} -- entries of each histo for the unbinned
+                fits, see AnnaFitter.FillHistos (default: {None})
+        """
+
+        if not values:
+            values = [None] * len(histos)
+        self.fits.append((key, fitter, histos, fit_types, values))
+
+    # ______________________________________
+    def GetBudget(self, ntasks):
+        """Share the cores between processes and RooFit
+
+        Arguments:
+            ntasks {int}
+
+        Returns:
+            int, int -- processes, cores per fit
+        """
+
+        nworkers = self.nworkers if self.nworkers is not None else self.ncores
+        nworkers = max(min(nworkers, ntasks, self.ncores), 1)
+        return nworkers, max(self.ncores // nworkers, 1)
+
+    # ______________________________________
+    def GetChains(self, tasks, results, seeds):
+        """Group the tasks by spectra and fit type, in the bin order
+
+        Arguments:
+            tasks {list} -- see GetTasks
+            results {dict} -- FitHisto results of the tasks found in the cache
+            seeds {dict} -- previous campaign seed by task index
+
+        Returns:
+            list -- warm start tasks, with the pending ones to fit
+        """
+
+        chains = dict()
+        for task in tasks:
+            chains.setdefault((task['fit'], str(task['fit_type'])), list()).append(task)
+
+        jobs = list()
+        for fit, fit_type in sorted(chains):
+            chain = chains[(fit, fit_type)]
+            if all([task['index'] in results for task in chain]):
+                continue
+            fitter = self.fits[fit][1]
+            job_seeds = list()
+            for task in chain:
+                if task['index'] in results:
+                    subresults = results[task['index']]
+                    job_seeds.append(
+                        fitter.GetSeed(subresults[0], task['histo']) if subresults else None)
+                else:
+                    job_seeds.append(seeds.get(task['index']))
+            jobs.append({
+                'index': len(jobs),
+                'particle': chain[0]['particle'],
+                'binning': chain[0]['binning'],
+                'engine': chain[0]['engine'],
+                'adaptive': chain[0]['adaptive'],
+                'headless': chain[0]['headless'],
+                'fit_type': chain[0]['fit_type'],
+                'indices': [task['index'] for task in chain],
+                'histos': [task['histo'] for task in chain],
+                'values': [task['values'] for task in chain],
+                'seeds': job_seeds,
+                'to_fit': [task['index'] not in results for task in chain]})
+        return jobs
+
+    # ______________________________________
+    def GetTasks(self):
+        """
+        One task per histogram and fit type, in the serial order
+        """
+
+        tasks = list()
+        for i, (key, fitter, histos, fit_types, values) in enumerate(self.fits):
+            for j, histo in enumerate(histos):
+                if histo is None:
+                    continue
+                for k, fit_type in enumerate(fit_types):
+                    tasks.append({
+                        'index': len(tasks),
+                        'fit': i,
+                        'histo_index': j,
+                        'particle': fitter._particle_name,
+                        'binning': fitter._binning,
+                        'engine': fitter.engine,
+                        'adaptive': fitter.adaptive,
+                        'headless': fitter.headless,
+                        'fit_type': fit_type,
+                        'histo': histo,
+                        'values': values[j]})
+        return tasks
+
+    # ______________________________________
+    def Run(self):
+        """Run all the registered fits
+
+        Returns:
+            list -- (key, AnnaSpectra) pairs in the order of AddFits
+        """
+
+        tasks = self.GetTasks()
+        results = dict()
+
+        # Fits already done with the same inputs
+        keys = dict()
+        seed_keys = dict()
+        seeds = dict()
+        if self.cache is not None:
+            for task in tasks:
+                fit_spec = self.fits[task['fit']][1].GetFitSpec(task['fit_type'])
+                if fit_spec is not None:
+                    # Warm and cold fits are different results,
+                    # but they share their seeds
+                    fit_spec['warm_start'] = self.warm_start
+                    keys[task['index']] = self.cache.GetKey(task['histo'], fit_spec, task['values'])
+                    seed_spec = dict(fit_spec)
+                    del seed_spec['warm_start']
+                    seed_keys[task['index']] = self.cache.GetSeedKey(
+                        self.fits[task['fit']][0], task['histo'], seed_spec)
+            found = self.cache.Get(list(set(keys.values())))
+            for task in tasks:
+                key = keys.get(task['index'])
+                if key in found:
+                    fitter = self.fits[task['fit']][1]
+                    results[task['index']] = [self.cache.Restore(
+                        copy.copy(found[key]),
+                        fitter.GetSubResultName(task['fit_type'], task['histo']),
+                        task['histo'])]
+            if self.warm_start is True:
+                pending_keys = [
+                    seed_keys[task['index']] for task in tasks
+                    if task['index'] not in results and task['index'] in seed_keys]
+                found = self.cache.Get(pending_keys)
+                for task in tasks:
+                    if seed_keys.get(task['index']) in found:
+                        seeds[task['index']] = found[seed_keys[task['index']]]
+        pending = [task for task in tasks if task['index'] not in results]
+
+        # In warm start mode a task fits all the bins of a spectra
+        if self.warm_start is True:
+            jobs = self.GetChains(tasks, results, seeds)
+        else:
+            jobs = pending
+
+        nworkers, ncpu = self.GetBudget(len(jobs))
+        for job in jobs:
+            job['ncpu'] = ncpu
+        print(
+            ' --- {} fits ({} from the cache) in {} tasks on {} processes with {} cores each ({} cores)'
+            .format(len(tasks), len(tasks) - len(pending), len(jobs), nworkers, ncpu, self.ncores))
+
+        if nworkers <= 1:
+            for job in jobs:
+                for index, subresult_list in RunFitTask(job):
+                    results[index] = subresult_list
+        elif len(jobs) > 0:
+            pool = multiprocessing.Pool(processes=nworkers)
+            try:
+                for job_results in pool.imap_unordered(RunFitTask, jobs):
+                    for index, subresult_list in job_results:
+                        results[index] = subresult_list
+                    info('Run: {}/{} fits done'.format(len(results), len(tasks)))
+            finally:
+                pool.close()
+                pool.join()
+
+        # Store the new fits, and their parameters for the next campaign
+        if self.cache is not None:
+            new_results = dict()
+            new_seeds = dict()
+            for task in pending:
+                subresult_list = results.get(task['index'])
+                if task['index'] not in keys or not subresult_list or len(subresult_list) != 1:
+                    continue
+                new_results[keys[task['index']]] = subresult_list[0]
+                seed = self.fits[task['fit']][1].GetSeed(subresult_list[0], task['histo'])
+                if seed is not None:
+                    new_seeds[seed_keys[task['index']]] = seed
+            self.cache.Put(new_results, new_seeds)
+
+        # Subresults of each histogram, in the fit_types order
+        subresult_lists = [[list() for histo in histos] for key, fitter, histos, fit_types, values in self.fits]
+        for task in tasks:
+            if results.get(task['index']) is None:
+                error('Cannot fit {} with {}'.format(task['histo'].GetName(), task['fit_type']))
+                continue
+            subresult_lists[task['fit']][task['histo_index']] += results[task['index']]
+
+        return [
+            (key, fitter.GetSpectra(histos, subresult_lists[i]))
+            for i, (key, fitter, histos, fit_types, values) in enumerate(self.fits)]
+
+# =============================================================================
+# The END
+# =============================================================================
@@ -11,7 +11,26 @@ from Ostap.PyRoUts import *
 import Ostap.FitModels as Models
 # Python modules
 from logging import debug, error, warning, info
+from array import array
 import inspect
+import itertools
+import json
+import time
+
+# One-pass filling of the histograms needs numpy and root_numpy
+try:
+    import numpy as np
+    from root_numpy import fill_hist, tree2array
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+# Binned likelihood fits without RooFit need numpy and scipy
+try:
+    from .AnnaBinnedLikelihood import AnnaBinnedLikelihood
+    has_scipy = True
+except ImportError:
+    has_scipy = False
 
 
 class AnnaFitter:
@@ -21,7 +40,47 @@ class AnnaFitter:
     differently according to binning
     """
     # ______________________________________
-    def __init__(self, particle=None, binning=[]):
+    # Values of a subresult that are not fit parameters
+    _status_keys = [
+        'FitResult', 'CovMatrixStatus', 'FitCalls', 'SavedFitCalls', 'WarmStart', 'EngineMaxPull',
+        'Unbinned', 'FitBins', 'FitTime', 'ToyFits', 'ToyFailed']
+
+    # Yields of Fit1D, scaled with the entries when seeding
+    _yields = ['S', 'B']
+
+    # Name of the background PDF, Ostap names its parameters
+    # after it (tau_bkgr, phi1_bkgr...)
+    _background_name = 'bkgr'
+
+    # Shape parameters of the signal PDFs: argument of the Ostap
+    # PDF, key in the fit type, name of the parameter, default range
+    _signal_parameters = {
+        'CB2_pdf': [
+            ('alphaL', 'alL', 'aL', 0.01, 0.5),
+            ('alphaR', 'alR', 'aR', 0.01, 0.5),
+            ('nL', 'nL', 'nL', 0.01, 0.5),
+            ('nR', 'nR', 'nR', 0.01, 0.5)],
+        'CrystalBall_pdf': [
+            ('alpha', 'alpha', 'alpha', 1.5, 2.5),
+            ('n', 'n', 'n', 0.5, 1.5)]}
+
+    # Fit engines, see FitHistoNumpy and CheckEngines
+    _engines = ['roofit', 'numpy', 'check']
+
+    # Largest difference between the engines in check mode, in RooFit errors
+    _check_tolerance = 1.
+
+    # Adaptive mode: histograms with fewer entries are fitted unbinned,
+    # the others binned with at least _min_fit_bins bins (see GetFitBinning)
+    _unbinned_entries = 1000
+    _min_fit_bins = 20
+
+    # Points of the sampled curves of a headless fit (see GetCurves)
+    _curve_points = 200
+
+    # ______________________________________
+    def __init__(self, particle=None, binning=[], stats=None, ncpu=8, warm_start=False, engine='roofit',
+                 adaptive=False, headless=False):
         """cstr
 
         Keyword Arguments:
@@ -32,8 +91,41 @@ class AnnaFitter:
                         ["JPSI_PT", 0., 4000., 8000.]
                     Could also be 2D :
                         [["JPSI_PT", 0., 4000., 8000.], ["JPSI_P", 0., 4000., 8000.] ]
+            stats {AnnaTupleStats} -- statistics index of the tuple, used for
+                    the histogram ranges and to check the binning (default: {None})
+            ncpu {int} -- processes of each RooFit likelihood,
+                    see AnnaFitScheduler for the CPU budget (default: {8})
+            warm_start {bool} -- fit the bins one after the other, each one
+                    starting from converged parameters (see FitHistosWarm)
+                    and refit only when not converged (default: {False})
+            engine {str} -- 'roofit', 'numpy' to fit without RooFit
+                    (see FitHistoNumpy) or 'check' to fit with RooFit
+                    and compare with numpy (see CheckEngines) (default: {'roofit'})
+            adaptive {bool} -- fit the low statistics histograms unbinned
+                    and the others with a binning scaled to their
+                    statistics (see GetFitBinning) (default: {False})
+            headless {bool} -- do not draw the fits, store their sampled
+                    curves instead of a frame (see GetCurves) (default: {False})
         """
 
+        # Cores given to RooFit for each fit
+        self.ncpu = ncpu
+        self.warm_start = warm_start
+
+        # Fit engine
+        if engine not in self._engines:
+            error('Wrong engine ({}), possibles are {}'.format(engine, self._engines))
+            return None
+        if engine != 'roofit' and has_scipy is False:
+            warning('The {} engine requires numpy and scipy, fit with RooFit'.format(engine))
+            engine = 'roofit'
+        self.engine = engine
+        self.adaptive = adaptive
+        self.headless = headless
+
+        # Ranges and quantiles of the tuple columns
+        self._stats = stats
+
         # Centrality percentage based on VELO cluster cut
         self._centrality = {
             "branch": "nVeloClusters",
@@ -47,32 +139,20 @@ class AnnaFitter:
             "70_90": [5580, 1311]}
 
         # Adopt binning
-        self._binning, self._2D = self.CheckBinning(binning)
-        if not self._binning:
+        self._axes = self.CheckBinning(binning)
+        if not self._axes:
             print("Binning is not good ...")
             return None
+        self._binning = binning
 
         # Several dictionnaries used for fit
-        self._fit_key = {
-            "signal": None,
-            "bkgr": None,
-            "weight": None}
-
-        # Mass map
-        self._mean_map = {
-            "JPsi": ROOT.RooRealVar(
-                'JPsi_mean', 'J/psi(1S) mean', 3080., 3120.),
-            "PsiP": ROOT.RooRealVar(
-                'PsiP_mean', 'Psi(2S) mean', 3600., 3800.),
-            "Upsilon": ROOT.RooRealVar(
-                'Upsilon_mean', 'Upsilon (1S) mean', 8500., 10500.),
-            "UpsilonPrime": ROOT.RooRealVar(
-                'UpsilonPrime_mean', 'Upsilon (2S) mean', 9000., 11000.)}
+        self._decoded = dict()
+        self._mean_map = None
+        self._width_map = None
+        self.ResetParameters()
 
-        # width map
-        self._width_map = {
-            "JPsi": ROOT.RooRealVar(
-                'JPsi_width', 'J/psi(1S) width', 5., 15.)}
+        # Fit models by fit type and range, see GetModel
+        self._models = dict()
 
         # Set particule name
         try:
@@ -87,114 +167,156 @@ class AnnaFitter:
     def CheckBinning(self, binning):
         """Check binning format
 
-        Fiew tests to check if binning pass several conditions
+        Fiew tests to check if binning pass several conditions,
+        on each axis for a N dimensional binning
 
         Arguments:
-            binning {list}
+            binning {list} -- ["JPSI_PT", 0., 4000., 8000.], or one
+                such list per axis
 
         Returns:
-            bool -- Binning pass the conditions or not
+            list -- the axes of the binning, None if it is wrong
         """
 
         ok = True
-        is2D = False
 
         # Check size
         try:
-            assert len(binning) >= 2
+            assert len(binning) >= 1
         except AssertionError:
             error("binning is too small")
-            ok = False
+            return None
 
-        # Check if 2D binning
-        if type(binning[0]) == list():
+        # Check if N dimensional binning
+        if isinstance(binning[0], list):
+            axes = binning
+        else:
+            axes = [binning]
+
+        for axis in axes:
             try:
-                assert type(binning[1]) == list()
+                assert isinstance(axis, list) and len(axis) >= 1
             except AssertionError:
                 error(
                     " --- Wrong bin format ({}), should be list()"
-                    .format(type(binning[1])))
-                return False
-
-            print(' --- Fit with a 2D binning {}-{}'.format)
-            (
-                binning[0][0],
-                binning[1][0])
-            is2D = True
-
-        # Further checks for 1D binning
-        if is2D is False:
-            # Check binning size
-            try:
-                assert len(binning[1:]) >= 2
-            except AssertionError:
-                error(""" Not enought bins ({}),
-                required at least 2 """.format(len(binning[1:])))
+                    .format(type(axis)))
                 ok = False
+                continue
 
-            # Check binning ordening
-            if ok is True:
-                for i, limit in enumerate(binning[1:-1]):
-                    try:
-                        assert limit < binning[i + 2]
-                    except AssertionError:
-                        error(" Binning {} not order properly".format())
-                        ok = False
-
-        else:
             # Check binning size
             try:
-                assert len(binning[0][1:]) >= 2
+                assert len(axis[1:]) >= 2
             except AssertionError:
                 error(
-                    " Not enought bins ({}), required at least 2 "
-                    .format(len(binning[0][1:])))
-                ok = False
-            try:
-                assert len(binning[1][1:]) >= 2
-            except AssertionError:
-                error(
-                    "Not enought bins ({}), required at least 2"
-                    .format(len(binning[1][1:])))
+                    " Not enought bins ({}) for {}, required at least 2 "
+                    .format(len(axis[1:]), axis[0]))
                 ok = False
+                continue
 
             # Check binning ordening
-            if ok is True:
-                for i, limit in enumerate(binning[0][1:-1]):
-                    try:
-                        assert limit < binning[0][i + 2]
-                    except AssertionError:
-                        error(" Binning {} not order properly".format())
-                        ok = False
-                for i, limit in enumerate(binning[1][1:-1]):
-                    try:
-                        assert limit < binning[1][i + 2]
-                    except AssertionError:
-                        error(" Binning {} not order properly".format())
-                        ok = False
+            for i, limit in enumerate(axis[1:-1]):
+                try:
+                    assert limit < axis[i + 2]
+                except AssertionError:
+                    error(" Binning {} not order properly".format(axis[0]))
+                    ok = False
 
         try:
             assert ok is True
         except AssertionError:
             error("Binning is wrong")
-            return None, None
+            return None
+
+        if len(axes) > 1:
+            print(' --- Fit with a {}D binning {}'.format(
+                len(axes), ' x '.join([axis[0] for axis in axes])))
+
+        # Compare with the content of the tuple
+        if self._stats is not None:
+            for axis in axes:
+                self.CheckBinningStats(axis)
 
         debug("Binning is correct")
-        return binning, is2D
+        return axes
 
     # ______________________________________
-    def ConfigureCuts(self, centrality, cut, bintype, bin_limits):
+    def CheckBinningStats(self, binning):
+        """Compare a 1D binning with the statistics index of the tuple
 
-        cut_update = str()
+        Warn about limits outside the range of the variable and
+        bins expected to be empty, and print the expected entries per bin.
 
-        if self._2D is True:
-            bin_names = bintype.split('--')
-            cut_update = "{2} < {0} && {0} < {3} && {4} < {1} && {1} < {5}".format(
-                bin_names[0], bin_names[1],
-                bin_limits[0], bin_limits[1], bin_limits[2], bin_limits[3])
-        else:
-            cut_update = "{1} < {0} && {0} < {2}".format(
-                bintype, bin_limits[0], bin_limits[1])
+        Arguments:
+            binning {list} -- ["JPSI_PT", 0., 4000., 8000.]
+        """
+
+        name, limits = binning[0], binning[1:]
+        if self._stats.HasColumn(name) is False:
+            warning("{} is not in the statistics index".format(name))
+            return
+
+        vmin = self._stats.GetMinimum(name)
+        vmax = self._stats.GetMaximum(name)
+        if limits[0] > vmin or limits[-1] < vmax:
+            info(
+                " Binning {} [{}, {}] does not cover the whole range of the tuple [{}, {}]"
+                .format(name, limits[0], limits[-1], vmin, vmax))
+
+        entries = self._stats.GetEntries(name)
+        for i in range(len(limits) - 1):
+            expected = entries * self._stats.GetFraction(name, limits[i], limits[i + 1])
+            print(
+                ' --- {} bin [{}, {}] : ~{:.0f} entries expected'
+                .format(name, limits[i], limits[i + 1], expected))
+            if limits[i + 1] <= vmin or limits[i] >= vmax:
+                warning(
+                    " Bin [{}, {}] is outside the range of {} [{}, {}]"
+                    .format(limits[i], limits[i + 1], name, vmin, vmax))
+
+    # ______________________________________
+    def CheckEngines(self, subresult, subresult_numpy):
+        """Compare the RooFit and numpy fits of a histogram
+
+        The largest difference of the common parameters, in units
+        of the RooFit error, is stored as EngineMaxPull in the RooFit
+        subresult, with a warning above self._check_tolerance.
+
+        Arguments:
+            subresult {AnnaResult} -- the RooFit fit
+            subresult_numpy {AnnaResult} -- the numpy fit, see FitHistoNumpy
+        """
+
+        if subresult_numpy is None:
+            error('No numpy fit to compare with {}'.format(subresult.GetName()))
+            return
+
+        pulls = dict()
+        for name in subresult.GetValueNames():
+            if name in self._status_keys or not subresult_numpy.HasValue(name):
+                continue
+            sigma = subresult.GetErrorStat(name)
+            if sigma > 0:
+                pulls[name] = abs(subresult.GetValue(name) - subresult_numpy.GetValue(name)) / sigma
+
+        max_pull = max(pulls.values()) if len(pulls) > 0 else 0.
+        subresult.Set("EngineMaxPull", max_pull, 0., 0.)
+        print(' --- RooFit vs numpy : {}'.format(
+            ', '.join(['{} {:.2f}'.format(name, pulls[name]) for name in sorted(pulls)])))
+        if max_pull > self._check_tolerance:
+            warning(
+                '{} : RooFit and numpy fits differ by up to {:.2f} sigma (status {}/{} vs {}/{})'
+                .format(
+                    subresult.GetName(), max_pull,
+                    subresult.GetValue("FitResult"), subresult.GetValue("CovMatrixStatus"),
+                    subresult_numpy.GetValue("FitResult"), subresult_numpy.GetValue("CovMatrixStatus")))
+
+    # ______________________________________
+    def ConfigureCuts(self, centrality, cut, bintype, bin_limits):
+
+        cut_update = " && ".join([
+            "{1} < {0} && {0} < {2}".format(
+                name, bin_limits[2 * i], bin_limits[2 * i + 1])
+            for i, name in enumerate(bintype.split('--'))])
 
         add_centrality = True
         try:
@@ -233,13 +355,9 @@ class AnnaFitter:
                 .format(self._fit_key['bkgr']))
             return None
 
-        background = getattr(Models, self._fit_key['bkgr'])(
-            'bkgr',
-            mass=range)
-
         # Due to Ostap architectur, data members of PDF can't be set
-        # after initiating the function. Therefor, one must find bellow
-        # a mess to try to correctly create the background PDF object
+        # after initiating the function. Therefor, the parameters are
+        # configured first and the PDF object is created once with them
 
         # ---- Configure Bkg_pdf ----
         if self._fit_key['bkgr'] == 'Bkg_pdf':
@@ -250,13 +368,16 @@ class AnnaFitter:
             self.UpdateParameters(param)
 
             background = getattr(Models, self._fit_key['bkgr'])(
-                'bkgr',
+                self._background_name,
                 mass=range,
                 power=int(param['power']))
         else:
             warning(
                 '{} has not default value setted, we encourage you to implement the code'
                 .format(self._fit_key['bkgr']))
+            background = getattr(Models, self._fit_key['bkgr'])(
+                self._background_name,
+                mass=range)
 
         return background
 
@@ -278,59 +399,33 @@ class AnnaFitter:
                 for signal function'''.format(self._fit_key['signal']))
             return None
 
-        # Default PDF object
-        sig = getattr(Models, self._fit_key['signal'])(
-            'signal',
-            mass=range,
-            mean=self._mean_map[self._particle_name],
-            sigma=self._width_map[self._particle_name])
-
         # Due to Ostap architectur, data members of PDF can't be set
-        # after initiating the function. Therefor, one must find bellow
-        # a mess to try to correctly create the background PDF object
+        # after initiating the function. Therefor, the parameters are
+        # configured first and the PDF object is created once with them
 
-        # ---- Configure CB2 ----
-        if self._fit_key['signal'] == 'CB2_pdf':
-            # Default value
-            param = {
-                'alL': ROOT.RooRealVar('aL', 'aL', 0.01, 0.5),
-                'alR': ROOT.RooRealVar('aR', 'aR', 0.01, 0.5),
-                'nL': ROOT.RooRealVar('nL', 'nL', 0.01, 0.5),
-                'nR': ROOT.RooRealVar('nR', 'nR', 0.01, 0.5)}
-
-            self.UpdateParameters(param)
+        # ---- Configure CB2, CrystalBall ----
+        if self._fit_key['signal'] in self._signal_parameters:
+            param = self.GetSignalParameters()
 
+            arguments = dict([
+                (argument, param[key])
+                for argument, key, name, vmin, vmax in self._signal_parameters[self._fit_key['signal']]])
             sig = getattr(Models, self._fit_key['signal'])(
                 'signal',
                 mass=range,
                 mean=self._mean_map[self._particle_name],
                 sigma=self._width_map[self._particle_name],
-                alphaL=param['alL'],
-                alphaR=param['alR'],
-                nL=param['nL'],
-                nR=param['nR'])
-
-        # ---- Configure CrystalBall ----
-        elif self._fit_key['signal'] == 'CrystalBall_pdf':
-            # Default value
-            param = {
-                'alpha': ROOT.RooRealVar('alpha', 'alpha', 1.5, 2.5),
-                'n': ROOT.RooRealVar('n', 'n', 0.5, 1.5)}
-
-            self.UpdateParameters(param)
-
-            sig = getattr(Models, self._fit_key['signal'])(
-                'signal',
-                mass=range,
-                mean=self._mean_map[self._particle_name],
-                sigma=self._width_map[self._particle_name],
-                alpha=param['alpha'],
-                n=param['n'])
+                **arguments)
 
         else:
             warning(
                 '{} has not default value setted, we encourage you to implement the code'
                 .format(self._fit_key['signal']))
+            sig = getattr(Models, self._fit_key['signal'])(
+                'signal',
+                mass=range,
+                mean=self._mean_map[self._particle_name],
+                sigma=self._width_map[self._particle_name])
 
         return sig
 
@@ -346,6 +441,9 @@ class AnnaFitter:
         If the key is different from standard key value it is assumed
         to be the value for a parameter of the fit function.
 
+        Each fit_type is parsed once, after ResetParameters the
+        decoded keys are given back for the next fits.
+
         Arguments:
             fit_type {str} -- example :
                 particle=JPsi|leaf=jpsi_M|range=2;5|signal=CB2_pdf|bkgr=Bkg_pdf
@@ -353,6 +451,12 @@ class AnnaFitter:
         Returns:
             bool -- If the fit is correctly decoded
         """
+        # Already decoded
+        decoded_key = json.dumps(fit_type)
+        if decoded_key in self._decoded:
+            self._fit_key = dict(self._decoded[decoded_key])
+            return True
+
         # Always reset the data member at each fit_type
         self._fit_key["weight"] = 1
 
@@ -382,10 +486,154 @@ class AnnaFitter:
                 " but found none ...")
             return False
 
+        self._decoded[decoded_key] = dict(self._fit_key)
         return True
 
     # ______________________________________
-    def Fit(self, tuple, leaf, centrality, cut, fit_types, option):
+    def FillHistos(self, tuple, leafs, centralities, cuts, values=None):
+        """Fill the histograms of all combinations in one read of the tuple
+
+        The tuple is read once, with the leafs, the binning variable(s),
+        the centrality branch and one column per cut (evaluated by ROOT).
+        Entries are sent to their bin with numpy.digitize and selected
+        for each centrality and cut with masks.
+
+        The histograms are the ones GetHistos would project:
+        100 bins between the minimum and maximum of the leaf,
+        strict inequalities at the bin and centrality limits.
+
+        Arguments:
+            tuple {TTree} --
+            leafs {list} --
+            centralities {list} --
+            cuts {list} -- "#" for no cut
+
+        Keyword Arguments:
+            values {dict} -- filled, if given, with the list of the entries
+                of each histogram (numpy array) by (leaf, centrality, cut),
+                None for the histograms with at least _unbinned_entries
+                entries, for the unbinned fits (default: {None})
+
+        Returns:
+            dict -- list of histograms by (leaf, centrality, cut), in the
+                GetBinsAsList() order with None for empty bins.
+                None in case of error
+        """
+
+        if has_numpy is False:
+            error(' one-pass filling requires numpy and root_numpy')
+            return None
+
+        for leaf in leafs:
+            try:
+                assert tuple.GetLeaf(leaf) is not None
+            except AssertionError:
+                error("cannot find leaf {}".format(leaf))
+                return None
+
+        bin_all = self.GetBinsAsList()
+        bin_names = self.GetBinType().split('--')
+        bin_edges = [axis[1:] for axis in self._axes]
+
+        centrality_masks = dict()
+        for centrality in centralities:
+            if centrality == "branch" or centrality not in self._centrality:
+                warning("skip centrality cut ({})".format(centrality))
+                centrality_masks[centrality] = None
+            else:
+                centrality_masks[centrality] = self._centrality[centrality]
+        cut_columns = dict()
+        for cut in cuts:
+            if cut == "#":
+                warning("skip specific cut ({})".format(cut))
+                cut_columns[cut] = None
+            else:
+                cut_columns[cut] = "({})".format(cut)
+
+        # Single read of all the columns
+        columns = list()
+        for column in list(leafs) + bin_names:
+            if column not in columns:
+                columns.append(column)
+        if any([limits is not None for limits in centrality_masks.values()]):
+            columns.append(self._centrality["branch"])
+        for column in cut_columns.values():
+            if column is not None and column not in columns:
+                columns.append(column)
+        print(' --- Reading {} entries of {} with {}'.format(tuple.GetEntries(), tuple.GetName(), columns))
+        arrays = tree2array(tuple, branches=columns)
+
+        # Bin of each entry, in the GetBinsAsList() order
+        index = np.zeros(len(arrays), dtype=np.int64)
+        inside = np.ones(len(arrays), dtype=bool)
+        for name, edges in zip(bin_names, bin_edges):
+            edges = np.asarray(edges, dtype=np.float64)
+            axis_values = arrays[name]
+            i = np.digitize(axis_values, edges) - 1
+            inside &= (i >= 0) & (i < len(edges) - 1)
+            inside &= axis_values != edges[np.clip(i, 0, len(edges) - 1)]
+            index = index * (len(edges) - 1) + i
+
+        # Centrality and cut masks
+        for centrality, limits in centrality_masks.items():
+            if limits is not None:
+                clusters = arrays[self._centrality["branch"]]
+                centrality_masks[centrality] = (clusters > limits[1]) & (clusters < limits[0])
+        for cut, column in cut_columns.items():
+            if column is not None:
+                cut_columns[cut] = arrays[column] != 0
+
+        histos = dict()
+        for leaf in leafs:
+            leaf_values = arrays[leaf]
+            if self._stats is not None and self._stats.HasColumn(leaf):
+                vmin, vmax = self.GetHistoRange(tuple, leaf)
+            elif len(leaf_values) > 0:
+                vmin, vmax = leaf_values.min(), leaf_values.max()
+            else:
+                vmin, vmax = 0., 0.
+
+            for centrality in centralities:
+                for cut in cuts:
+                    mask = inside.copy()
+                    if centrality_masks[centrality] is not None:
+                        mask &= centrality_masks[centrality]
+                    if cut_columns[cut] is not None:
+                        mask &= cut_columns[cut]
+
+                    # Group the selected entries by bin
+                    cell_index = index[mask]
+                    order = np.argsort(cell_index, kind='mergesort')
+                    selected = leaf_values[mask][order]
+                    bounds = np.searchsorted(cell_index[order], np.arange(len(bin_all) + 1))
+
+                    histo_list = list()
+                    value_list = list()
+                    for i, bin_limits in enumerate(bin_all):
+                        if bounds[i] == bounds[i + 1]:
+                            error(
+                                "could not get histo for {} in bin {} ({}/{})"
+                                .format(leaf, bin_limits, centrality, cut))
+                            histo_list.append(None)
+                            value_list.append(None)
+                            continue
+                        histo = ROOT.TH1F('histo', 'histo', 100, vmin, vmax)
+                        histo.SetDirectory(0)
+                        histo.SetName("{}_{}".format(leaf, bin_limits))
+                        fill_hist(histo, selected[bounds[i]:bounds[i + 1]])
+                        histo_list.append(histo)
+                        if bounds[i + 1] - bounds[i] < self._unbinned_entries:
+                            value_list.append(selected[bounds[i]:bounds[i + 1]].copy())
+                        else:
+                            value_list.append(None)
+                    histos[(leaf, centrality, cut)] = histo_list
+                    if values is not None:
+                        values[(leaf, centrality, cut)] = value_list
+
+        return histos
+
+    # ______________________________________
+    def Fit(self, tuple, leaf, centrality, cut, fit_types, option, histos=None, values=None):
         """The main fit method
 
         Histogrames are retrieved according to the cut we apply
@@ -408,65 +656,73 @@ class AnnaFitter:
             fit_types {list}
             option {str}
 
+        Keyword Arguments:
+            histos {list} -- histograms from FillHistos, retrieved
+                with GetHistos if None (default: {None})
+            values {list} -- entries of each histo for the unbinned
+                fits, see FillHistos (default: {None})
+
         Returns:
             AnnaSpectra -- storage class for a results
         """
 
-        # The spectra that will be return
-        spectra = AnnaSpectra(
-            name=self._particle_name + "_" + self.GetBinType(),
-            title=self._particle_name + "_" + self.GetBinType())
-
         # Get list of histograms (one per cut)
-        print(' --- try to get histos ...')
-        histos = self.GetHistos(tuple, leaf, centrality, cut)
+        if histos is None:
+            print(' --- try to get histos ...')
+            values = list() if self.adaptive is True else None
+            histos = self.GetHistos(tuple, leaf, centrality, cut, values)
         if histos is None:
             error("Cannot retrived histos for {}/{}/{}".format(leaf, centrality, cut))
             return None
         print(' --- histos retrived ...')
         debug("Fit: histos = {}".format(histos))
 
-        # Construct our AnnaRestult for each histo or bins
-        annaresults = [
-            AnnaResult(self.GetBinType(), self.GetBinsAsString()[i])
-            for i in range(0, len(histos))]
-
-        # Run over each AnnaResults (or bin or histos) and add subresults
-        added_result = 0
-        for i, annaresult in enumerate(annaresults):
-            debug("Fit: annaresult = {}".format(annaresult))
-            subresults = list()
-            added_subresult = 0
-
-            # Create a subresults for each fit_type
-            subresults.append(self.FitHisto(fit_types, histos[i]))
-
-            # Adopt each subresults
-            for subresult in subresults:
-                debug("Fit: subresult = {}".format(subresult))
-                added_subresult += annaresult.AdoptSubResult(subresult)
-                print(
-                    ' ----- number of subresults fitted for {} - {} : {}'
-                    .format(annaresult.GetName(), self.GetBinsAsString()[i], added_subresult))
-            # Finally add result to spectra
-            added_result += spectra.AdoptResult(annaresult, self.GetBinsAsString()[i])
-
-        print(
-            "number of results added for {} : {}"
-            .format(spectra.GetName(), added_result))
+        # Create a subresults for each fit_type
+        if not values:
+            values = [None] * len(histos)
+        if self.warm_start is True:
+            subresult_lists = [list() if histo is not None else None for histo in histos]
+            for fit_type in fit_types:
+                for i, subresults in enumerate(self.FitHistosWarm(fit_type, histos, values=values)):
+                    if subresults is not None:
+                        subresult_lists[i] += subresults
+        else:
+            subresult_lists = [
+                self.FitHisto(fit_types, histo, values=values[i]) if histo is not None else None
+                for i, histo in enumerate(histos)]
 
-        return spectra
+        return self.GetSpectra(histos, subresult_lists)
 
     # ______________________________________
-    def FitHisto(self, fit_methods, histo):
+    def FitHisto(self, fit_methods, histo, seed=None, values=None):
         """Fit Histogram for all fit_methods.
 
         The result is stored in a AnnaResult
 
+        In warm start mode the fit starts from the seed parameters,
+        otherwise from the defaults. In both modes a fit that did not
+        converge is redone once, and the measured cost of the fit is
+        stored as FitCalls: the Minuit fits with RooFit, the likelihood
+        evaluations with the numpy engine. WarmStart tells the mode.
+
+        In adaptive mode the fit is unbinned or binned with a binning
+        scaled to the statistics (see GetFitBinning). The choice is
+        stored as Unbinned and FitBins, with the FitTime in seconds.
+
+        In headless mode the fit is not drawn: the subresult keeps the
+        sampled model curves (see GetCurves) instead of the frame, and
+        AnnaSpectra.DrawResults rebuilds the frame when needed.
+
         Arguments:
             fit_methods {list} -- fit configuration string
             histo {TH1} -- histo to be fitted
 
+        Keyword Arguments:
+            seed {dict} -- starting parameters in warm start
+                mode, see GetSeed (default: {None})
+            values {array} -- entries of the histo for an
+                unbinned fit, see FillHistos (default: {None})
+
         Returns:
             list -- contains all the AnnaResults
         """
@@ -481,41 +737,49 @@ class AnnaFitter:
         print(""" \n========= > Fit histo {} < ========= """.format(histo.GetName()))
 
         for i, fit_method in enumerate(fit_methods):
+            start = time.time()
+
             # Get the fit configuration
-            for key in self._fit_key.keys():
-                self._fit_key[key] = None
+            self.ResetParameters()
             self.DecodeFitType(fit_method)
 
-            # Redefine the fit range to the histo boundaries
-            hmin = histo.GetXaxis().GetXmin()
-            hmax = histo.GetXaxis().GetXmax()
-            if 'range' in self._fit_key.keys():
-                if self._fit_key['range'] is not None:
-                    print self._fit_key['range']
-                    hmin = float(min(self._fit_key['range'].split(';')))
-                    hmax = float(max(self._fit_key['range'].split(';')))
-
-            fit_range = ROOT.RooRealVar(
-                histo.GetXaxis().GetName(),
-                histo.GetXaxis().GetTitle(),
-                hmin, hmax)
-
-            # get PDF and create fit model
-            signal = self.CreateSignalPDF(fit_range)
-            if signal is None:
-                continue
-            background = self.CreateBackgroundPDF(fit_range)
-            if background is None:
+            hmin, hmax = self.GetFitRange(histo)
+
+            # Binned or unbinned
+            unbinned, group = self.GetFitBinning(histo, values)
+            fit_histo = histo
+            if group > 1:
+                fit_histo = histo.Rebin(group, histo.GetName() + '_rebinned')
+                fit_histo.SetDirectory(0)
+
+            # Fit without RooFit
+            if self.engine == 'numpy' and self.IsNumpySupported() is True:
+                sr = self.FitHistoNumpy(fit_method, histo, hmin, hmax, seed, fit_histo)
+                if sr is not None:
+                    self.SetFitBinning(sr, False, fit_histo, start)
+                    subresult_list.append(sr)
                 continue
 
-            # return None
-            model = Models.Fit1D(signal=signal, background=background)
+            # get the fit model
+            model, fit_range = self.GetModel(histo, hmin, hmax)
+            if model is None:
+                continue
 
-            data = ROOT.RooDataHist(
-                histo.GetName(),
-                histo.GetTitle(),
-                ROOT.RooArgList(fit_range),
-                histo)
+            if unbinned is True:
+                data = ROOT.RooDataSet(
+                    histo.GetName(),
+                    histo.GetTitle(),
+                    ROOT.RooArgSet(fit_range))
+                for value in values:
+                    if hmin <= value <= hmax:
+                        fit_range.setVal(value)
+                        data.add(ROOT.RooArgSet(fit_range))
+            else:
+                data = ROOT.RooDataHist(
+                    histo.GetName(),
+                    histo.GetTitle(),
+                    ROOT.RooArgList(fit_range),
+                    fit_histo)
 
             print(
                 " \n------- > with {} + {} (weight = {} ) \n"
@@ -524,75 +788,438 @@ class AnnaFitter:
                     self._fit_key['bkgr'],
                     self._fit_key['weight']))
 
-            result, frame = model.fitTo(
-                data,
-                silent=False,
-                draw=True,
-                refit=True,
-                ncpu=8)
+            if self.warm_start is True and seed is not None:
+                self.SetSeed(model, data, seed, histo)
+
+            # Refit from where the fit stopped, as fitTo(refit=True),
+            # counting the Minuit fits actually done
+            ncalls = 0
+            while True:
+                result, frame = model.fitTo(
+                    data,
+                    silent=False,
+                    draw=self.headless is False,
+                    refit=False,
+                    ncpu=self.ncpu)
+                ncalls += 1
+                if self.IsConverged(result) is True or ncalls == 2:
+                    break
             debug("{}".format(result))
 
             # Create the AnnaResult
-            sr_name = "{}_{}".format(fit_method, histo.GetName())
+            sr_name = self.GetSubResultName(fit_method, histo)
             sr = AnnaResult(name=sr_name, title=histo.GetTitle(), histo=histo)
             sr.weigth = self._fit_key['weight']
             sr.frame = frame
             for key in result.parameters().keys():
                 sr.Set(key, result(key)[0].value(), result(key)[0].error())
+            if self.headless is True:
+                sr.curves = self.GetCurves(model, fit_range, sr)
             sr.Set("FitResult", result.status(), 0., 0.)
             sr.Set("CovMatrixStatus", result.covQual(), 0., 0.)
+            sr.Set("FitCalls", ncalls, 0., 0.)
+            sr.Set("WarmStart", int(self.warm_start), 0., 0.)
+            self.SetFitBinning(sr, unbinned, fit_histo, start)
+
+            # Same fit without RooFit
+            if self.engine == 'check' and self.IsNumpySupported() is True:
+                self.CheckEngines(sr, self.FitHistoNumpy(fit_method, histo, hmin, hmax, seed, fit_histo))
 
             subresult_list.append(sr)
 
         return subresult_list
 
     # ______________________________________
-    def GetBinType(self):
+    def FitHistoNumpy(self, fit_method, histo, hmin, hmax, seed=None, data=None):
+        """Fit a histogram with AnnaBinnedLikelihood, without RooFit
 
-        if self._2D:
-            return self._binning[0][0] + '--' + self._binning[1][0]
-        else:
-            return self._binning[0]
+        Same PDFs and parameters as the RooFit fit (see GetLikelihood).
+        The background parameters are named as with Ostap (tau_bkgr, phi1_bkgr...).
+        FitResult and CovMatrixStatus follow the RooFit convention.
+        There is no frame, the sampled curves are stored instead
+        (see GetCurves).
+
+        Arguments:
+            fit_method {list} -- fit configuration string, already decoded
+            histo {TH1} -- histo to be fitted
+            hmin {float} -- fit range
+            hmax {float} -- fit range
+
+        Keyword Arguments:
+            seed {dict} -- see GetSeed (default: {None})
+            data {TH1} -- the bins to fit, e.g. the rebinned
+                histo (default: {None}, the histo itself)
+
+        Returns:
+            AnnaResult -- None in case of error
+        """
+
+        likelihood, names, bins = self.GetLikelihood(histo, hmin, hmax, data)
+        if likelihood is None:
+            return None
+
+        print(
+            " \n------- > with {} + {} (weight = {} ), numpy engine \n"
+            .format(
+                self._fit_key['signal'],
+                self._fit_key['bkgr'],
+                self._fit_key['weight']))
+
+        # Starting point, as SetSeed
+        start = dict()
+        if self.warm_start is True and seed is not None:
+            scale = histo.Integral() / seed['entries'] if seed['entries'] > 0 else 1.
+            for name in likelihood.names:
+                if names[name] in seed['parameters']:
+                    value = seed['parameters'][names[name]]
+                    start[name] = value * scale if name in self._yields else value
+
+        # Redone once if not converged, as the RooFit fit
+        result = likelihood.Fit(start)
+        ncalls = result['ncalls']
+        if result['status'] != 0 or result['covQual'] != 3:
+            result = likelihood.Fit(result['values'])
+            ncalls += result['ncalls']
+        debug("{}".format(result))
+
+        sr = AnnaResult(name=self.GetSubResultName(fit_method, histo), title=histo.GetTitle(), histo=histo)
+        sr.weigth = self._fit_key['weight']
+        sr.frame = None
+        for name in likelihood.free:
+            sr.Set(names[name], result['values'][name], result['errors'][name])
+        sr.curves = dict([
+            (name, array('f', curve))
+            for name, curve in likelihood.GetCurves(result['values'], self._curve_points).items()])
+        sr.Set("FitResult", result['status'], 0., 0.)
+        sr.Set("CovMatrixStatus", result['covQual'], 0., 0.)
+        sr.Set("FitCalls", ncalls, 0., 0.)
+        sr.Set("WarmStart", int(self.warm_start), 0., 0.)
+        return sr
+
+    # ______________________________________
+    def FitHistosWarm(self, fit_method, histos, seeds=None, to_fit=None, values=None):
+        """Fit the histograms of the binning one after the other,
+        each one starting from converged parameters
+
+        The seed of a bin is, by priority, the one given in seeds (e.g. the
+        same bin in the previous campaign), the last converged bin before
+        it, or the fit of the integrated histogram. A fit is only redone
+        when it does not converge. When the seed of a bin is a cold fit of
+        the same bin in a previous campaign, the FitCalls saved with respect
+        to it are printed and stored as SavedFitCalls.
+
+        Arguments:
+            fit_method {list} -- fit configuration string
+            histos {list} -- as returned by GetHistos
+
+        Keyword Arguments:
+            seeds {list} -- seed per histo, None when unknown (default: {None})
+            to_fit {list} -- bool per histo, False for the bins already
+                fitted whose seed is only used for the next ones (default: {None})
+            values {list} -- entries per histo for the unbinned
+                fits, see FillHistos (default: {None})
+
+        Returns:
+            list -- FitHisto result per histo, None for the bins not fitted
+        """
+
+        if seeds is None:
+            seeds = [None] * len(histos)
+        if to_fit is None:
+            to_fit = [True] * len(histos)
+        if values is None:
+            values = [None] * len(histos)
+
+        warm_start = self.warm_start
+        self.warm_start = True
+
+        results = [None] * len(histos)
+        previous, integrated = None, None
+        nfits, ncalls, ncold, nsaved = 0, 0, 0, 0
+        for i, histo in enumerate(histos):
+            if histo is None:
+                continue
+            if to_fit[i] is False:
+                if seeds[i] is not None:
+                    previous = seeds[i]
+                continue
+
+            if seeds[i] is not None:
+                seed, source = seeds[i], 'previous campaign'
+            elif previous is not None:
+                seed, source = previous, 'neighbour bin'
+            else:
+                if integrated is None:
+                    integrated, calls = self.FitIntegrated(fit_method, histos)
+                    ncalls += calls
+                seed, source = integrated, 'integrated fit'
+
+            # Measured cost of the cold fit of the same bin, if any
+            cold_calls = seeds[i].get('cold_calls') if seeds[i] is not None else None
+
+            results[i] = self.FitHisto([fit_method], histo, seed, values[i])
+            for sr in results[i] if results[i] is not None else []:
+                calls = sr.GetValue("FitCalls")
+                saved = ''
+                if cold_calls is not None:
+                    sr.Set("SavedFitCalls", cold_calls - calls, 0., 0.)
+                    saved = ', {} saved'.format(cold_calls - calls)
+                    ncold += 1
+                    nsaved += cold_calls - calls
+                print(
+                    ' --- {} : seeded from the {}, {} fit calls{}'
+                    .format(histo.GetName(), source if seed is not None else 'defaults', calls, saved))
+                nfits += 1
+                ncalls += calls
+                if self.GetSeed(sr, histo) is not None:
+                    previous = self.GetSeed(sr, histo)
+
+        print(
+            ' --- Warm start {} : {} fits in {} fit calls, {} saved on the {} bins with a cold fit'
+            .format(fit_method, nfits, ncalls, nsaved, ncold))
+
+        self.warm_start = warm_start
+        return results
+
+    # ______________________________________
+    def FitIntegrated(self, fit_method, histos):
+        """Fit the sum of the histograms of the binning
+
+        Returns:
+            dict, int -- seed (see GetSeed, None if the fit did
+                not converge) and FitCalls of the fit
+        """
+
+        integrated = None
+        for histo in histos:
+            if histo is None:
+                continue
+            if integrated is None:
+                integrated = histo.Clone(histo.GetName() + '_integrated')
+                integrated.SetDirectory(0)
+            else:
+                integrated.Add(histo)
+        if integrated is None:
+            return None, 0
+
+        subresults = self.FitHisto([fit_method], integrated)
+        if not subresults:
+            return None, 0
+        return self.GetSeed(subresults[0], integrated), subresults[0].GetValue("FitCalls")
+
+    # ______________________________________
+    def GenerateToy(self, fit_method, histo, parameters, seed):
+        """Pseudo-dataset of a fitted model
+
+        The bins of the fit range get Poisson contents around the
+        model with the fitted parameters (see GetLikelihood and
+        AnnaBinnedLikelihood.Generate), the other bins are empty.
+        Only for the PDFs of the numpy engine, and all the free
+        parameters of the model must be given.
+
+        Arguments:
+            fit_method {list} -- fit configuration string
+            histo {TH1} -- the fitted histo
+            parameters {dict} -- fitted values by parameter name,
+                see GetSeed
+            seed {int} -- the contents only depend on it
+
+        Returns:
+            TH1 -- None in case of error
+        """
+
+        if has_scipy is False:
+            error('The toys require numpy and scipy')
+            return None
+        self.ResetParameters()
+        if self.DecodeFitType(fit_method) is False:
+            return None
+        if self._fit_key['signal'] not in AnnaBinnedLikelihood.signals or \
+                self._fit_key['bkgr'] not in AnnaBinnedLikelihood.backgrounds:
+            error('Cannot generate toys for {} + {}'.format(self._fit_key['signal'], self._fit_key['bkgr']))
+            return None
+
+        hmin, hmax = self.GetFitRange(histo)
+        likelihood, names, bins = self.GetLikelihood(histo, hmin, hmax)
+        if likelihood is None:
+            return None
+        missing = [names[name] for name in likelihood.free if names[name] not in parameters]
+        if len(missing) > 0:
+            error('Cannot generate toys of {} : no {} in the parameters'.format(histo.GetName(), ', '.join(missing)))
+            return None
+        values = dict([
+            (name, parameters.get(names[name], likelihood.parameters[name][0]))
+            for name in likelihood.names])
+        counts = likelihood.Generate(values, seed)
+
+        toy = histo.Clone(histo.GetName() + '_toy')
+        toy.SetDirectory(0)
+        toy.Reset()
+        for i, count in zip(bins, counts):
+            toy.SetBinContent(i, count)
+            toy.SetBinError(i, count ** 0.5)
+        return toy
+
+    # ______________________________________
+    def GetBinType(self):
+        return '--'.join([axis[0] for axis in self._axes])
 
     # ______________________________________
     def GetBinsAsList(self):
+        """
+        [min, max] of each axis for each cell of the binning,
+        the last axis running fastest
+        """
 
-        if self._2D is True:
-            return [
-                [
-                    self._binning[0][i], self._binning[0][i + 1],
-                    self._binning[1][j], self._binning[1][j + 1]
-                ]
-                for i in range(1, len(self._binning[0][1:]))
-                for j in range(1, len(self._binning[1][1:]))]
-        else:
-            return [
-                [
-                    self._binning[i], self._binning[i + 1]
-                ] for i in range(1, len(self._binning[1:]))]
+        return [
+            [limit for axis, i in zip(self._axes, cell) for limit in axis[i + 1:i + 3]]
+            for cell in self.GetCells()]
 
     # ______________________________________
     def GetBinsAsString(self):
+        return [
+            '_'.join(['{}'.format(limit) for limit in bin_limits])
+            for bin_limits in self.GetBinsAsList()]
 
-        if self._2D is True:
-            return [
-                "{}_{}_{}_{}".format(
-                    self._binning[0][i], self._binning[0][i + 1],
-                    self._binning[1][j], self._binning[1][j + 1]
-                )
-                for i in range(1, len(self._binning[0][1:]))
-                for j in range(1, len(self._binning[1][1:]))
-            ]
-        else:
-            return [
-                "{}_{}".format(
-                    self._binning[i], self._binning[i + 1]
-                )
-                for i in range(1, len(self._binning[1:]))
-            ]
+    # ______________________________________
+    def GetCells(self):
+        """
+        Index of the bin on each axis for each cell of the binning,
+        in the GetBinsAsList() order
+        """
+
+        return list(itertools.product(*[range(len(axis) - 2) for axis in self._axes]))
 
     # ______________________________________
-    def GetHistos(self, tuple, leaf, centrality, cut):
+    def GetCurves(self, model, fit_range, subresult):
+        """Fitted curves sampled over the fit range
+
+        A few kB per fit instead of a RooPlot, see
+        AnnaSpectra.GetFrame to draw them.
+
+        Arguments:
+            model {Fit1D} -- the fitted model
+            fit_range {RooRealVar} -- fit variable
+            subresult {AnnaResult} -- with the fitted yields
+
+        Returns:
+            dict -- float arrays 'x' and 'model', 'signal',
+                'background' in entries per unit of x
+        """
+
+        xmin, xmax = fit_range.getMin(), fit_range.getMax()
+        x = [xmin + (xmax - xmin) * i / (self._curve_points - 1.) for i in range(self._curve_points)]
+        normset = ROOT.RooArgSet(fit_range)
+        value = fit_range.getVal()
+
+        curves = {'x': array('f', x)}
+        for name, pdf, yield_name in [
+                ('signal', model.signal.pdf, self._yields[0]),
+                ('background', model.background.pdf, self._yields[1])]:
+            n = subresult.GetValue(yield_name) if subresult.HasValue(yield_name) else 0.
+            curve = array('f')
+            for xi in x:
+                fit_range.setVal(xi)
+                curve.append(n * pdf.getVal(normset))
+            curves[name] = curve
+        curves['model'] = array('f', [s + b for s, b in zip(curves['signal'], curves['background'])])
+
+        fit_range.setVal(value)
+        return curves
+
+    # ______________________________________
+    def GetFitBinning(self, histo, values=None):
+        """Binned or unbinned fit of a histogram, and its binning
+
+        In adaptive mode, a histogram with less than _unbinned_entries
+        entries is fitted unbinned when its entries are known. The others
+        are fitted binned with about 2 N^(1/3) bins for N entries (Rice
+        rule), at least _min_fit_bins and at most the bins of the histo,
+        by merging neighbouring bins.
+
+        Arguments:
+            histo {TH1}
+
+        Keyword Arguments:
+            values {array} -- entries of the histo (default: {None})
+
+        Returns:
+            bool, int -- unbinned, histo bins merged in each fit bin
+        """
+
+        if self.adaptive is False:
+            return False, 1
+        if values is not None and len(values) < self._unbinned_entries:
+            return True, 1
+
+        nbins = histo.GetNbinsX()
+        target = min(max(int(2. * histo.GetEntries() ** (1. / 3.)), self._min_fit_bins), nbins)
+        group = max([g for g in range(1, nbins + 1) if nbins % g == 0 and nbins // g >= target])
+        return False, group
+
+    # ______________________________________
+    def GetFitRange(self, histo):
+        """
+        Fit range of the decoded fit type, the histo boundaries by default
+        """
+
+        # Redefine the fit range to the histo boundaries
+        hmin = histo.GetXaxis().GetXmin()
+        hmax = histo.GetXaxis().GetXmax()
+        if 'range' in self._fit_key.keys():
+            if self._fit_key['range'] is not None:
+                limits = [float(v) for v in self._fit_key['range'].split(';')]
+                hmin = min(limits)
+                hmax = max(limits)
+        return hmin, hmax
+
+    # ______________________________________
+    def GetFitSpec(self, fit_method):
+        """Everything a fit depends on, apart from the histogram
+
+        The decoded fit type (signal and background PDFs, range,
+        weight and parameter overrides) with the particle, the
+        limits of its mean and width parameters, the fit engine,
+        the adaptive binning, headless and warm start modes.
+
+        Arguments:
+            fit_method {list} -- fit configuration string
+
+        Returns:
+            dict -- None if the fit type cannot be decoded
+        """
+
+        self.ResetParameters()
+        if self.DecodeFitType(fit_method) is False:
+            return None
+
+        spec = dict(self._fit_key)
+        spec['particle'] = self._particle_name
+        spec['engine'] = self.engine
+        spec['adaptive'] = self.adaptive
+        spec['headless'] = self.headless
+        spec['warm_start'] = self.warm_start
+        for name, parameters in [('mean', self._mean_map), ('width', self._width_map)]:
+            if self._particle_name in parameters:
+                var = parameters[self._particle_name]
+                spec[name] = [var.GetName(), var.getMin(), var.getMax()]
+
+        self.ResetParameters()
+        return spec
+
+    # ______________________________________
+    def GetHistoRange(self, tuple, leaf):
+        """
+        Minimum and maximum of a leaf, from the statistics
+        index if there is one, else from the tuple
+        """
+
+        if self._stats is not None and self._stats.HasColumn(leaf):
+            return self._stats.GetMinimum(leaf), self._stats.GetMaximum(leaf)
+        return tuple.GetMinimum(leaf), tuple.GetMaximum(leaf)
+
+    # ______________________________________
+    def GetHistos(self, tuple, leaf, centrality, cut, values=None):
         """Retrieve list of histograms
 
         All histograms are projected from the tuple
@@ -604,10 +1231,24 @@ class AnnaFitter:
             centrality {str} --
             cut {str} --
 
+        Keyword Arguments:
+            values {list} -- filled with the entries of each histogram
+                for the unbinned fits, see FillHistos (default: {None})
+
         Returns:
-            list -- contains al histograms
+            list -- contains al histograms, in the GetBinsAsList()
+                order with None for empty bins
         """
 
+        if has_numpy is True:
+            histo_values = dict() if values is not None else None
+            histos = self.FillHistos(tuple, [leaf], [centrality], [cut], histo_values)
+            if histos is None:
+                return None
+            if values is not None:
+                values.extend(histo_values[(leaf, centrality, cut)])
+            return histos[(leaf, centrality, cut)]
+
         histo_list = list()
         bin_all = self.GetBinsAsList()
         bintype = self.GetBinType()
@@ -625,20 +1266,22 @@ class AnnaFitter:
             for bin_limits in bin_all]
         debug("histo_cuts : {}".format(histo_cuts))
 
+        vmin, vmax = self.GetHistoRange(tuple, leaf)
         for i, histo_cut in enumerate(histo_cuts):
             print(' --- Getting histo from leaf {} with cut {}'.format(leaf, histo_cut))
             histo = ROOT.TH1F(
                 'histo', 'histo',
-                100, tuple.GetMinimum(leaf), tuple.GetMaximum(leaf))
+                100, vmin, vmax)
             tuple.Project('histo', leaf, histo_cut)
 
             try:
                 assert histo.GetEntries() > 0
             except AssertionError:
                 error("could not get histo with cut {}".format(histo_cut))
+                histo_list.append(None)
                 continue
+            histo.SetName("{}_{}".format(leaf, bin_all[i]))
             histo_list.append(histo)
-            histo_list[i].SetName("{}_{}".format(leaf, bin_all[i]))
 
         return histo_list
 
@@ -652,6 +1295,274 @@ class AnnaFitter:
         split_pair = split_pair.split(separator)
         return split_pair[0], split_pair[1]
 
+    # ______________________________________
+    def GetLikelihood(self, histo, hmin, hmax, data=None):
+        """AnnaBinnedLikelihood of the decoded fit type
+
+        Same PDFs, parameter names, limits and fit type overrides as
+        the RooFit fit (see CreateSignalPDF and CreateBackgroundPDF),
+        on the bins of the histo whose center is in [hmin, hmax].
+
+        Arguments:
+            histo {TH1} -- histo to be fitted
+            hmin {float} -- fit range
+            hmax {float} -- fit range
+
+        Keyword Arguments:
+            data {TH1} -- the bins to fit, e.g. the rebinned
+                histo (default: {None}, the histo itself)
+
+        Returns:
+            AnnaBinnedLikelihood, dict, list -- the likelihood, the names
+                of its parameters in the subresults and the histo bins
+                of the fit range, None, None, None in case of error
+        """
+
+        data = data if data is not None else histo
+        axis = data.GetXaxis()
+        bins = [i for i in range(1, axis.GetNbins() + 1) if hmin <= axis.GetBinCenter(i) <= hmax]
+        if len(bins) < 2:
+            error('Not enough bins of {} in [{}, {}]'.format(histo.GetName(), hmin, hmax))
+            return None, None, None
+        edges = [axis.GetBinLowEdge(i) for i in bins] + [axis.GetBinUpEdge(bins[-1])]
+        counts = [data.GetBinContent(i) for i in bins]
+
+        # Same parameters as the RooFit PDFs
+        if self._particle_name not in self._width_map:
+            error('No width for {}'.format(self._particle_name))
+            return None, None, None
+        names = dict()
+        parameters = dict()
+        for name, var in [
+                ('mean', self._mean_map[self._particle_name]),
+                ('sigma', self._width_map[self._particle_name])]:
+            names[name] = var.GetName()
+            parameters[name] = (0.5 * (var.getMin() + var.getMax()), var.getMin(), var.getMax())
+        param = self.GetSignalParameters()
+        for argument, key, name, vmin, vmax in self._signal_parameters[self._fit_key['signal']]:
+            if isinstance(param[key], float):
+                names[argument] = name
+                parameters[argument] = (param[key], param[key], param[key])
+            else:
+                names[argument] = param[key].GetName()
+                parameters[argument] = (param[key].getVal(), param[key].getMin(), param[key].getMax())
+        power = {'power': 1}
+        self.UpdateParameters(power)
+
+        try:
+            likelihood = AnnaBinnedLikelihood(
+                edges, counts,
+                self._fit_key['signal'], self._fit_key['bkgr'],
+                parameters, power=int(power['power']))
+        except ValueError as e:
+            error('Cannot fit {} : {}'.format(histo.GetName(), e))
+            return None, None, None
+        for name in likelihood.names:
+            if name not in names:
+                names[name] = name if name in self._yields else '{}_{}'.format(name, self._background_name)
+        return likelihood, names, bins
+
+    # ______________________________________
+    def GetModel(self, histo, hmin, hmax):
+        """Fit model of the decoded fit type, from the pool
+
+        The model of a fit type and fit range is built once (see
+        CreateSignalPDF and CreateBackgroundPDF) and reused for all
+        the histograms, with its parameters set back to their initial
+        values and errors before each fit.
+
+        Arguments:
+            histo {TH1} -- histo to be fitted
+            hmin {float} -- fit range
+            hmax {float} -- fit range
+
+        Returns:
+            Fit1D, RooRealVar -- model and fit variable,
+                None, None in case of error
+        """
+
+        key = json.dumps(
+            [self._fit_key, self._particle_name,
+             histo.GetXaxis().GetName(), histo.GetXaxis().GetTitle(), hmin, hmax],
+            sort_keys=True)
+        if key in self._models:
+            model, fit_range, snapshot = self._models[key]
+            for var, value, var_error in snapshot:
+                var.setVal(value)
+                var.setError(var_error)
+            return model, fit_range
+
+        fit_range = ROOT.RooRealVar(
+            histo.GetXaxis().GetName(),
+            histo.GetXaxis().GetTitle(),
+            hmin, hmax)
+
+        # get PDF and create fit model
+        signal = self.CreateSignalPDF(fit_range)
+        if signal is None:
+            return None, None
+        background = self.CreateBackgroundPDF(fit_range)
+        if background is None:
+            return None, None
+        model = Models.Fit1D(signal=signal, background=background)
+
+        snapshot = [
+            (var, var.getVal(), var.getError())
+            for var in model.pdf.getParameters(ROOT.RooArgSet(fit_range))]
+        self._models[key] = (model, fit_range, snapshot)
+        debug('GetModel: {} models in the pool'.format(len(self._models)))
+        return model, fit_range
+
+    # ______________________________________
+    def GetSeed(self, subresult, histo):
+        """Starting point for the next fits
+
+        Arguments:
+            subresult {AnnaResult} -- as returned by FitHisto
+            histo {TH1} -- the fitted histo
+
+        Returns:
+            dict -- parameters and entries of the histo, and FitCalls
+                if it was a cold fit (else None), None if the fit did not converge
+        """
+
+        if subresult.GetValue("FitResult") != 0 or subresult.GetValue("CovMatrixStatus") != 3:
+            return None
+        cold_calls = None
+        if subresult.HasValue("WarmStart") and subresult.GetValue("WarmStart") == 0:
+            cold_calls = subresult.GetValue("FitCalls")
+        return {
+            'entries': histo.Integral(),
+            'cold_calls': cold_calls,
+            'parameters': dict([
+                (name, subresult.GetValue(name))
+                for name in subresult.GetValueNames() if name not in self._status_keys])}
+
+    # ______________________________________
+    def GetSignalParameters(self):
+        """
+        Shape parameters of the signal PDF by fit type key, RooRealVar
+        with the default range or overridden by the fit type
+        (see UpdateParameters)
+        """
+
+        param = dict([
+            (key, ROOT.RooRealVar(name, name, vmin, vmax))
+            for argument, key, name, vmin, vmax in self._signal_parameters[self._fit_key['signal']]])
+        self.UpdateParameters(param)
+        return param
+
+    # ______________________________________
+    def GetSpectra(self, histos, subresult_lists):
+        """Store the fitted subresults in an AnnaSpectra
+
+        Arguments:
+            histos {list} -- as returned by GetHistos
+            subresult_lists {list} -- FitHisto result for each histo
+
+        Returns:
+            AnnaSpectra -- storage class for a results
+        """
+
+        # The spectra that will be return
+        spectra = AnnaSpectra(
+            name=self._particle_name + "_" + self.GetBinType(),
+            title=self._particle_name + "_" + self.GetBinType())
+        spectra.SetAxes(self._axes)
+        cells = self.GetCells()
+        bins = self.GetBinsAsString()
+
+        # Construct our AnnaRestult for each histo or bins
+        annaresults = [
+            AnnaResult(self.GetBinType(), bins[i])
+            for i in range(0, len(histos))]
+
+        # Run over each AnnaResults (or bin or histos) and add subresults
+        added_result = 0
+        for i, annaresult in enumerate(annaresults):
+            if histos[i] is None:
+                continue
+            debug("Fit: annaresult = {}".format(annaresult))
+            subresults = [subresult_lists[i]]
+            added_subresult = 0
+
+            # Adopt each subresults
+            for subresult in subresults:
+                debug("Fit: subresult = {}".format(subresult))
+                added_subresult += annaresult.AdoptSubResult(subresult)
+                print(
+                    ' ----- number of subresults fitted for {} - {} : {}'
+                    .format(annaresult.GetName(), bins[i], added_subresult))
+            # Finally add result to spectra
+            added_result += spectra.AdoptResult(annaresult, bins[i], cells[i])
+
+        print(
+            "number of results added for {} : {}"
+            .format(spectra.GetName(), added_result))
+
+        return spectra
+
+    # ______________________________________
+    def GetSubResultName(self, fit_method, histo):
+        return "{}_{}".format(fit_method, histo.GetName())
+
+    # ______________________________________
+    def IsConverged(self, result):
+        return result.status() == 0 and result.covQual() == 3
+
+    # ______________________________________
+    def IsNumpySupported(self):
+        """
+        If the decoded fit type can be fitted by AnnaBinnedLikelihood
+        """
+
+        if has_scipy is False:
+            return False
+        if self._fit_key['signal'] not in AnnaBinnedLikelihood.signals or \
+                self._fit_key['bkgr'] not in AnnaBinnedLikelihood.backgrounds:
+            warning(
+                'No numpy engine for {} + {}, fit with RooFit'
+                .format(self._fit_key['signal'], self._fit_key['bkgr']))
+            return False
+        return True
+
+    # ______________________________________
+    def ResetParameters(self):
+        """
+        Fresh fit keys and mean/width parameters back to their initial
+        values, so that each fit starts from the same point whatever was
+        fitted before (and gives the same result in a worker of
+        AnnaFitScheduler). The parameters are built once, for the
+        models of the pool (see GetModel)
+        """
+
+        self._fit_key = {
+            "signal": None,
+            "bkgr": None,
+            "weight": None}
+
+        if self._mean_map is not None:
+            for var in list(self._mean_map.values()) + list(self._width_map.values()):
+                var.setVal(0.5 * (var.getMin() + var.getMax()))
+                var.setError(0.)
+            return
+
+        # Mass map
+        self._mean_map = {
+            "JPsi": ROOT.RooRealVar(
+                'JPsi_mean', 'J/psi(1S) mean', 3080., 3120.),
+            "PsiP": ROOT.RooRealVar(
+                'PsiP_mean', 'Psi(2S) mean', 3600., 3800.),
+            "Upsilon": ROOT.RooRealVar(
+                'Upsilon_mean', 'Upsilon (1S) mean', 8500., 10500.),
+            "UpsilonPrime": ROOT.RooRealVar(
+                'UpsilonPrime_mean', 'Upsilon (2S) mean', 9000., 11000.)}
+
+        # width map
+        self._width_map = {
+            "JPsi": ROOT.RooRealVar(
+                'JPsi_width', 'J/psi(1S) width', 5., 15.)}
+
     # ______________________________________
     def SetAdditionalAttributeToModel(self, model):
         """Run over self._fit_key and try to configure
@@ -678,8 +1589,9 @@ class AnnaFitter:
 
             # Set attribute according to if it is a range or not
             if ';' in self._fit_key[attribute]:
-                varmin = float(min(self._fit_key[attribute].split(';')))
-                varmax = float(max(self._fit_key[attribute].split(';')))
+                limits = [float(v) for v in self._fit_key[attribute].split(';')]
+                varmin = min(limits)
+                varmax = max(limits)
                 var = ROOT.RooRealVar(
                     self._particle_name + '_' + attribute,
                     self._particle_name + '_' + attribute,
@@ -689,6 +1601,48 @@ class AnnaFitter:
             else:
                 setattr(model, attribute, self._fit_key[attribute])
 
+    # ______________________________________
+    def SetFitBinning(self, subresult, unbinned, histo, start):
+        """
+        Store the binning choice and the time of a fit
+        """
+
+        nbins = 0 if unbinned is True else histo.GetNbinsX()
+        subresult.Set("Unbinned", int(unbinned), 0., 0.)
+        subresult.Set("FitBins", nbins, 0., 0.)
+        subresult.Set("FitTime", time.time() - start, 0., 0.)
+        print(
+            ' --- {} fit{} in {:.2f} s'
+            .format(
+                'unbinned' if unbinned is True else 'binned',
+                '' if unbinned is True else ' with {} bins'.format(nbins),
+                time.time() - start))
+
+    # ______________________________________
+    def SetSeed(self, model, data, seed, histo):
+        """Set the free parameters of the model to the seed values
+
+        The yields are scaled by the ratio of the entries,
+        values are kept inside the parameter limits.
+
+        Arguments:
+            model {Ostap.FitModels} --
+            data {RooDataHist} --
+            seed {dict} -- see GetSeed
+            histo {TH1} -- the histo to be fitted
+        """
+
+        parameters = model.pdf.getParameters(data)
+        scale = histo.Integral() / seed['entries'] if seed['entries'] > 0 else 1.
+        for name, value in seed['parameters'].items():
+            var = parameters.find(name)
+            if not var or var.isConstant():
+                continue
+            if name in self._yields:
+                value *= scale
+            var.setVal(min(max(value, var.getMin()), var.getMax()))
+            debug('Seed {} = {}'.format(name, var.getVal()))
+
     # ______________________________________
     def UpdateParameters(self, param):
         """
@@ -700,8 +1654,9 @@ class AnnaFitter:
             if attribute in param.keys():
                 # Set attribute according to if it is a range or not
                 if ';' in self._fit_key[attribute]:
-                    varmin = float(min(self._fit_key[attribute].split(';')))
-                    varmax = float(max(self._fit_key[attribute].split(';')))
+                    limits = [float(v) for v in self._fit_key[attribute].split(';')]
+                    varmin = min(limits)
+                    varmax = max(limits)
                     var = ROOT.RooRealVar(
                         attribute,
                         attribute,
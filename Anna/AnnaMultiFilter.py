@@ -0,0 +1,160 @@
+# =============================================================================
+#  @class AnnaMultiFilter
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-04-18
+
+from TupleFilterBank.AnnaCutExpression import AnnaCutAnd
+from TupleFilterBank.AnnaTupleFilterBase import has_columnar
+# Python
+import time
+from logging import error, info
+# Ostap
+from Ostap.progress_bar import ProgressBar
+
+
+# ______________________________________
+class AnnaMultiFilter:
+    """Run many TupleFilterBank filters over a single read of a TChain
+
+    Each chunk of the chain is read once, with the branches of all
+    the filters, and given to the ProcessChunk of every filter, each
+    one filling its own tuple. The cuts common to all the filters are
+    evaluated by ROOT while reading, the others by each filter on
+    the arrays (see AnnaTupleFilterBase.GetTupleColumnar).
+
+    The reading time is shared equally between the 'selection'
+    entry of the filter cut-flows.
+    """
+
+    # ______________________________________
+    def __init__(self, tuple_filters, chunk_size=100000):
+        """cstr
+
+        Arguments:
+            tuple_filters {list} -- configured AnnaTupleFilterBase instances
+
+        Keyword Arguments:
+            chunk_size {int} -- entries per chunk (default: {100000})
+        """
+
+        self.tuple_filters = tuple_filters
+        self.chunk_size = chunk_size
+
+    # ______________________________________
+    def ActivateBranches(self, chain):
+        """
+        Switch off all the chain branches not read by any filter
+        """
+
+        branches = self.GetBranches([tuple_filter.GetRequiredBranches() for tuple_filter in self.tuple_filters])
+        chain.SetBranchStatus('*', 0)
+        for branch in branches:
+            chain.SetBranchStatus(branch, 1)
+        info('ActivateBranches: {} branches read for {} filters'.format(len(branches), len(self.tuple_filters)))
+
+    # ______________________________________
+    def GetBranches(self, branch_lists):
+        """
+        Union of branch lists, without duplicates
+        """
+
+        branches = list()
+        for branch_list in branch_lists:
+            for branch in branch_list:
+                if branch not in branches:
+                    branches.append(branch)
+        return branches
+
+    # ______________________________________
+    def GetTuples(self, chain, start=0, stop=None):
+        """Filter the chain with all the filters in one pass
+
+        Arguments:
+            chain {TChain}
+
+        Keyword Arguments:
+            start {int} -- first entry (default: {0})
+            stop {int} -- last entry excluded, None for
+                the end of the chain (default: {None})
+
+        Returns:
+            list -- TNtuple or AnnaTupleRef per filter,
+                None for a filter that cannot run
+        """
+
+        results = [None] * len(self.tuple_filters)
+        if has_columnar is False:
+            error(' multiplexed mode requires numpy, scipy and root_numpy')
+            return results
+
+        chain_branches = [branch.GetName() for branch in chain.GetListOfBranches()]
+
+        # Keep the filters that can run on this chain
+        general_cuts = dict()
+        for i, tuple_filter in enumerate(self.tuple_filters):
+            if tuple_filter.CheckChainBranch(chain) is False:
+                error(' attributes are missing for {}, skip it'.format(tuple_filter.name))
+                continue
+            general_cut = tuple_filter.GetGeneralCut()
+            if general_cut is None:
+                error(' cannot get the mask of {}, skip it'.format(tuple_filter.name))
+                continue
+            general_cuts[i] = general_cut
+        if len(general_cuts) == 0:
+            return results
+
+        # ROOT evaluates the cuts on chain branches shared by all the filters
+        indices = sorted(general_cuts)
+        pushed = [general_cuts[i].Split(chain_branches)[0] for i in indices]
+        common = set([cut.ToFormula() for cut in pushed[0].cuts])
+        for cut in pushed[1:]:
+            common &= set([single_cut.ToFormula() for single_cut in cut.cuts])
+        selection = '&&'.join([cut.ToFormula() for cut in pushed[0].cuts if cut.ToFormula() in common])
+        print(" ----> Multiplexed mode, selection applied while reading : \n {}".format(selection))
+
+        # Each filter evaluates its other cuts on the arrays
+        branch_lists = list()
+        ntuples = dict()
+        for i in indices:
+            tuple_filter = self.tuple_filters[i]
+            remaining_cut = AnnaCutAnd(
+                [cut for cut in general_cuts[i].cuts if cut.ToFormula() not in common])
+            ntuple = tuple_filter.StartColumnar(remaining_cut)
+            if ntuple is None:
+                continue
+            ntuples[i] = ntuple
+            branch_lists.append(tuple_filter.GetColumnarBranches(remaining_cut))
+            print(" ----> {} on the arrays : \n {}".format(tuple_filter.name, remaining_cut.ToFormula()))
+        if len(ntuples) == 0:
+            return results
+        branches = self.GetBranches(branch_lists)
+        indices = sorted(ntuples)
+        reader = self.tuple_filters[indices[0]]
+
+        if stop is None or stop > chain.GetEntries():
+            stop = chain.GetEntries()
+        tot_entries = stop - start
+
+        print(' --- Start running {} filters over events ...'.format(len(ntuples)))
+        with ProgressBar(max_value=tot_entries, silent=False) as bar:
+            for first in range(start, stop, self.chunk_size):
+                last = min(first + self.chunk_size, stop)
+                read_start = time.time()
+                arrays = reader.ReadChunk(chain, branches, selection, first, last)
+                read_time = (time.time() - read_start) / len(ntuples)
+                for i in indices:
+                    self.tuple_filters[i].cutflow.FillArray('selection', last - first, len(arrays), read_time)
+                    self.tuple_filters[i].ProcessChunk(arrays, ntuples[i])
+                bar.update_amount(last - start)
+
+        for i in indices:
+            print(
+                ' --- Done ! {} : ran over {} entries, {} were kept !'
+                .format(self.tuple_filters[i].name, tot_entries, ntuples[i].GetEntries()))
+            results[i] = self.tuple_filters[i].CloseTuple(ntuples[i])
+
+        return results
+
+# =============================================================================
+# The END
+# =============================================================================
@@ -0,0 +1,328 @@
+# =============================================================================
+#  @class AnnaParallelFilter
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-03-20
+
+import ROOT
+from TupleFilterBank.AnnaCutFlow import AnnaCutFlow
+# Python
+import copy
+import multiprocessing
+import os
+import shutil
+import tempfile
+from logging import error, info
+
+
+# ______________________________________
+def RunFilterTask(task):
+    """Run a filter over one entry range of one file.
+
+    Executed in the worker processes of AnnaParallelFilter,
+    the filtered tuple is streamed into task['output'].
+
+    Arguments:
+        task {dict} -- see AnnaParallelFilter.SplitChain
+
+    Returns:
+        int, str, AnnaCutFlow -- task index, output file (None in case of error), cut-flow
+    """
+
+    tuple_filter = task['filter']
+    tuple_filter.cutflow = AnnaCutFlow()
+    tuple_filter.output_path = task['output']
+
+    chain = ROOT.TChain(task['tree'])
+    chain.Add(task['file'])
+    if tuple_filter.derived_columns is not None:
+        tuple_filter.derived_columns.AddFriend(chain)
+    tuple_filter.ActivateBranches(chain)
+
+    if task['columnar'] is True:
+        ref = tuple_filter.GetTupleColumnar(
+            chain, task['chunk_size'], task['start'], task['stop'])
+    else:
+        ref = tuple_filter.GetTuple(chain)
+
+    if ref is None:
+        error('Cannot filter {} [{}, {}['.format(task['file'], task['start'], task['stop']))
+        return task['index'], None, tuple_filter.cutflow
+
+    return task['index'], task['output'], tuple_filter.cutflow
+
+
+# ______________________________________
+class AnnaParallelFilter:
+    """Run a TupleFilterBank filter over a TChain with a pool of processes
+
+    The chain is split into entry ranges, either one per file
+    or groups of TTree clusters. Each range is filtered in a worker
+    process and the outputs are merged in the order of the chain,
+    so that the filtered tuple has the same entry order as
+    the serial GetTuple.
+
+    The ghost check is scoped to an event: the cluster ranges end
+    at the end of an event (see GetEventBoundary), so that both
+    splits give the serial result.
+    """
+
+    # ______________________________________
+    def __init__(self, tuple_filter, nworkers=4, split='file', columnar=True,
+        chunk_size=100000, min_entries=500000):
+        """cstr
+
+        Arguments:
+            tuple_filter {AnnaTupleFilterBase} -- the configured filter
+
+        Keyword Arguments:
+            nworkers {int} -- size of the process pool (default: {4})
+            split {str} -- 'file' or 'cluster' (default: {'file'})
+            columnar {bool} -- use GetTupleColumnar (default: {True})
+            chunk_size {int} -- entries per chunk in columnar mode (default: {100000})
+            min_entries {int} -- minimal entries per range
+                in 'cluster' mode (default: {500000})
+        """
+
+        self.tuple_filter = tuple_filter
+        self.nworkers = nworkers
+        self.split = split
+        self.columnar = columnar
+        self.chunk_size = chunk_size
+        self.min_entries = min_entries
+
+    # ______________________________________
+    def GetClusterRanges(self, file_path, tree_name):
+        """Group the TTree clusters of a file in ranges of
+        at least self.min_entries entries
+
+        Each range is extended to the end of its last event,
+        the entries of an event are never split.
+
+        Returns:
+            list -- [start, stop] pairs
+        """
+
+        f = ROOT.TFile.Open(file_path)
+        tree = f.Get(tree_name)
+        entries = tree.GetEntries()
+
+        ranges = list()
+        iterator = tree.GetClusterIterator(0)
+        range_start = 0
+        cluster_start = iterator.Next()
+        while cluster_start < entries:
+            cluster_stop = iterator.GetNextEntry()
+            if cluster_stop - range_start >= self.min_entries:
+                range_stop = self.GetEventBoundary(tree, cluster_stop, entries)
+                ranges.append([range_start, range_stop])
+                range_start = range_stop
+            cluster_start = iterator.Next()
+
+        if range_start < entries:
+            ranges.append([range_start, entries])
+
+        f.Close()
+        return ranges
+
+    # ______________________________________
+    def GetEventBoundary(self, tree, entry, entries):
+        """First entry from entry whose (runNumber, eventNumber)
+        differs from the one of the previous entry
+
+        Arguments:
+            tree {TTree}
+            entry {int} -- > 0
+            entries {int} -- of the tree
+
+        Returns:
+            int -- entries if the event goes on to the end of the tree
+        """
+
+        tree.SetBranchStatus('*', 0)
+        tree.SetBranchStatus('runNumber', 1)
+        tree.SetBranchStatus('eventNumber', 1)
+
+        tree.GetEntry(entry - 1)
+        event = (tree.runNumber, tree.eventNumber)
+        while entry < entries:
+            tree.GetEntry(entry)
+            if (tree.runNumber, tree.eventNumber) != event:
+                break
+            entry += 1
+        return entry
+
+    # ______________________________________
+    def GetTuple(self, chain):
+        """Filter the chain in parallel
+
+        Arguments:
+            chain {TChain}
+
+        Returns:
+            TNtuple -- or AnnaTupleRef if tuple_filter.output_path
+                is set, None in case of error
+        """
+
+        if self.split == 'cluster' and self.columnar is False:
+            error('Cluster ranges require the columnar mode')
+            return None
+
+        output_dir = tempfile.mkdtemp(prefix='AnnaParallelFilter_')
+        tasks = self.SplitChain(chain, output_dir)
+        print(
+            ' --- Run {} on {} ranges with {} workers'
+            .format(self.tuple_filter.name, len(tasks), self.nworkers))
+
+        results = list(self.IterTasks(tasks))
+
+        # A missing range would give an incomplete tuple
+        failed = [index for index, output, cutflow in results if output is None]
+        if len(failed) > 0:
+            error('No output for ranges {}, cannot merge the tuple'.format(sorted(failed)))
+            shutil.rmtree(output_dir)
+            return None
+
+        # Merge in the chain order
+        ntuple = self.tuple_filter.NewTuple()
+        if ntuple is None:
+            shutil.rmtree(output_dir)
+            return None
+        for index, output, cutflow in sorted(results, key=lambda result: result[0]):
+            self.tuple_filter.cutflow.Add(cutflow)
+            f = ROOT.TFile.Open(output)
+            ntuple.CopyEntries(f.Get(ntuple.GetName()))
+            f.Close()
+
+        print(
+            ' --- Done ! Ran over {} entries, {} kept !'
+            .format(self.tuple_filter.cutflow.GetEntries(), ntuple.GetEntries()))
+        print(self.tuple_filter.cutflow)
+        result = self.tuple_filter.CloseTuple(ntuple)
+        shutil.rmtree(output_dir)
+
+        return result
+
+    # ______________________________________
+    def GetTupleIncremental(self, chain, manifest):
+        """Filter only the files of the chain not yet in the manifest
+
+        Each input file is filtered in its own part file, recorded
+        in the manifest as soon as it is done. The result references
+        the parts of all the files of the manifest.
+
+        Arguments:
+            chain {TChain}
+            manifest {AnnaFilterManifest}
+
+        Returns:
+            AnnaTupleRef -- tuple_filter.cutflow is set to the
+                cut-flow of all the files of the manifest
+        """
+
+        if os.path.isdir(manifest.part_dir) is False:
+            os.makedirs(manifest.part_dir)
+
+        tasks = list()
+        for file_path, tree_name in manifest.GetPendingFiles(chain):
+            tasks.append(self.MakeTask(
+                len(tasks), file_path, tree_name, 0, None,
+                manifest.GetPartPath(file_path)))
+        print(
+            ' --- Run {} on {} new files with {} workers'
+            .format(self.tuple_filter.name, len(tasks), self.nworkers))
+
+        new_entries = 0
+        for index, output, cutflow in self.IterTasks(tasks):
+            new_entries += cutflow.GetEntries()
+            if output is None:
+                error('No output for {}, it will be retried at the next run'.format(tasks[index]['file']))
+                continue
+            manifest.AddFile(tasks[index]['file'], output, cutflow)
+
+        # The cut-flow of the whole output, previous runs included
+        self.tuple_filter.cutflow = manifest.GetCutFlow()
+        ref = manifest.GetTupleRef(chain)
+        print(
+            ' --- Done ! Ran over {} new entries, {} kept in {} files !'
+            .format(new_entries, ref.GetEntries(), len(ref.file_paths)))
+        print(self.tuple_filter.cutflow)
+
+        return ref
+
+    # ______________________________________
+    def IterTasks(self, tasks):
+        """Run RunFilterTask over the tasks, in the process pool
+        if nworkers > 1, and yield the results as they complete
+
+        Arguments:
+            tasks {list} -- see SplitChain
+
+        Yields:
+            int, str, dict -- see RunFilterTask
+        """
+
+        if self.nworkers <= 1:
+            # same as in a worker, the tasks must not modify our filter
+            for task in tasks:
+                yield RunFilterTask(dict(task, filter=copy.copy(task['filter'])))
+            return
+
+        pool = multiprocessing.Pool(processes=self.nworkers)
+        try:
+            for result in pool.imap_unordered(RunFilterTask, tasks):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+    # ______________________________________
+    def MakeTask(self, index, file_path, tree_name, start, stop, output):
+        """
+        Task for RunFilterTask, filter [start, stop[ of the tree
+        of file_path into output
+        """
+
+        return {
+            'index': index,
+            'filter': self.tuple_filter,
+            'tree': tree_name,
+            'file': file_path,
+            'start': start,
+            'stop': stop,
+            'columnar': self.columnar,
+            'chunk_size': self.chunk_size,
+            'output': output}
+
+    # ______________________________________
+    def SplitChain(self, chain, output_dir):
+        """Split the chain into tasks for RunFilterTask
+
+        Arguments:
+            chain {TChain}
+            output_dir {str} -- where the workers write their tuples
+
+        Returns:
+            list -- one dict per entry range
+        """
+
+        tasks = list()
+        for element in chain.GetListOfFiles():
+            file_path = element.GetTitle()
+            tree_name = element.GetName()
+
+            if self.split == 'cluster':
+                ranges = self.GetClusterRanges(file_path, tree_name)
+            else:
+                ranges = [[0, None]]
+
+            for start, stop in ranges:
+                tasks.append(self.MakeTask(
+                    len(tasks), file_path, tree_name, start, stop,
+                    os.path.join(output_dir, 'part_{}.root'.format(len(tasks)))))
+
+        info('SplitChain: {} files in {} tasks'.format(chain.GetListOfFiles().GetEntries(), len(tasks)))
+        return tasks
+
+# =============================================================================
+# The END
+# =============================================================================
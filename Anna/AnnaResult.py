@@ -31,6 +31,10 @@ class AnnaResult():
 	A AnnaResult can hold other AnnaResult, refered as
 	subresults later.
 
+	The values merged from the subresults are computed once per
+	(quantity, merging method) and kept until Set, AdoptSubResult,
+	Include, Exclude or Scale changes this result or one of its
+	subresults (see Invalidate). They are not stored with the result.
 	"""
 
 	# ______________________________________
@@ -61,8 +65,26 @@ class AnnaResult():
 		self.binning = None
 		self.histo = histo
 		self.frame = None
+		self.curves = None  # sampled fit curves, instead of the frame of a headless fit
 		self.weigth = 1.
 
+		# Merged values and the result holding this one, see GetMerged
+		self._cache = dict()
+		self._parent = None
+
+	# ______________________________________
+	def __getstate__(self):
+		state = dict(self.__dict__)
+		state.pop('_cache', None)
+		state.pop('_parent', None)
+		return state
+
+	# ______________________________________
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._cache = dict()
+		self._parent = None
+
 	# ______________________________________
 	def AdoptSubResult(self, result_list):
 		"""Adopt all results in the result list
@@ -81,7 +103,9 @@ class AnnaResult():
 		for r in result_list:
 			self.subresults[r.GetName()] = r
 			self.SubResultsToBeIncluded().append(r.GetName())
+			r._parent = self
 		subresultsAfterAdd = len(self.subresults)
+		self.Invalidate()
 
 		if subresultsBeforeAdd < subresultsAfterAdd:
 			return subresultsAfterAdd - subresultsBeforeAdd
@@ -131,14 +155,14 @@ class AnnaResult():
 		to_be_excluded = self.GetSubResultNameList()
 
 		if slist == "*":
-			self.Exclude(to_be_excluded)
-			return
+			slist = to_be_excluded
 
-		if self.self._subresult is not None:
+		if self.subresults is not None:
 			a = slist.split(",")
 
 			for s in a:
-				self.DeleteEntry(a)
+				self.DeleteEntry(s)
+		self.Invalidate()
 
 	# ______________________________________
 	def GetErrorStat(self, name, subresult_name=''):
@@ -179,6 +203,249 @@ class AnnaResult():
 				return None
 			return error_stat
 
+		# Merged from the subresults, once (see GetMerged)
+		return self.GetMerged(self.MergeErrorStat, name)
+
+	# ______________________________________
+	def GetFitStatus(self, result):
+		"""
+		FitResult, CovMatrixStatus and FitChi2PerNDF of a subresult,
+		0, 3 and 1 when not set
+		"""
+
+		status = list()
+		for name, default in [("FitResult", 0), ("CovMatrixStatus", 3), ("FitChi2PerNDF", 1)]:
+			value = result.GetValue(name)
+			status.append(value if value is not None else default)
+		return status
+
+	# ______________________________________
+	def GetMerged(self, method, name):
+		"""Value merged from the subresults, computed once
+
+		Kept by (quantity, merging method) until Invalidate.
+
+		Arguments:
+			method {method} -- MergeValue, MergeErrorStat or MergeRMS
+			name {str} -- Name of the variable
+
+		Returns:
+			number -- as returned by method
+		"""
+
+		key = (method.__name__, name, self._resultMergingMethod)
+		if key not in self._cache:
+			for rname in self.subresults:
+				self.subresults[rname]._parent = self
+			self._cache[key] = method(name)
+		return self._cache[key]
+
+	# ______________________________________
+	def GetName(self):
+		return self.name
+
+	# ______________________________________
+	def GetRMS(self, name, subresult_name=''):
+		"""Compute the rms of the subresults.
+
+		Arguments:
+			name {str -- Name of the variable
+			subresult_name {str -- subresults
+
+		Returns:
+			number -- 0 in case of problem
+		"""
+
+		# If we specify a subresults
+		if len(subresult_name) > 0:
+
+			if not self._subresult:
+
+				error("No subresult from which \
+						I could get the {} one...".format(subresult_name))
+				return 0
+
+			sub = self._subresult[subresult_name]
+			if not sub:
+				error("No subresult from which \
+						I could get the {} one...".format(subresult_name))
+				return 0
+
+			return sub.GetRMS(name)
+
+		# self._map existes only for AnnaResults w/o subresults
+		if self._map is not None:
+			try:
+				error_sys = self._map[name][self._index.kSys]
+			except KeyError:
+				error_sys = 0.0
+			return error_sys
+
+		# Merged from the subresults, once (see GetMerged)
+		return self.GetMerged(self.MergeRMS, name)
+
+	# ______________________________________
+	def GetSubResultNameList(self):
+		"""Get a comma separated list of our subresult aliases
+		"""
+		subresult_name_list = ''
+
+		for rname in self.subresults:
+			if len(subresult_name_list) > 0:
+				subresult_name_list += ","
+
+			subresult_name_list += rname
+
+		return subresult_name_list
+
+	# ______________________________________
+	def GetTitle(self):
+		return self.title
+
+	# ______________________________________
+	def GetValue(self, name, subresult_name=''):
+		"""Get a value (either directly or by computing the mean of the subresults).
+
+		Default method is mean, but it can be changed with a different settings
+		of self._resultMergingMethod
+
+		Arguments:
+			name {str -- Name of the variable
+			subresult_name {str -- subresult name
+
+		Returns:
+			number -- None in case of error
+		"""
+
+		# If we specify a subresults
+		if len(subresult_name) > 0:
+
+			if not self._subresult:
+				error("No subresult from which \
+						I could get the {} one...".format(subresult_name))
+				return None
+
+			sub = self._subresult[subresult_name]
+
+			if not sub:
+				error("No subresult from which \
+						I could get the {} one...".format(subresult_name))
+				return None
+
+			return sub.GetValue(name)
+
+		# self._map existes only for AnnaResults w/o subresults
+		if self._map is not None:
+			try:
+				value = self._map[name][self._index.kValue]
+			except KeyError:
+				return None
+			return value
+
+		# Merged from the subresults, once (see GetMerged)
+		return self.GetMerged(self.MergeValue, name)
+
+	# ______________________________________
+	def GetValueNames(self):
+		"""
+		Names of the values set directly (see Set)
+		"""
+		if self._map is None:
+			return list()
+		return list(self._map.keys())
+
+	# ______________________________________
+	def HasValue(self, name, subresult_name=''):
+		"""Whether this result (or subresult if subresult_name is provided)
+		has a property named "name"
+		When having subresults, return the number of subresults that have this value
+		"""
+		if len(subresult_name) > 0:
+			if self.subresults is None:
+				error("Error : No subresults from which \
+				I could get the {} one...".format(subresult_name))
+				return 0
+
+			try:
+				sub = self.subresults[subresult_name]
+			except KeyError:
+				error("Error : Could not get subresult named " + subresult_name)
+				return 0
+
+			return sub.HasValue(name)
+
+		if self._map is not None:
+			try:
+				self._map[name]
+			except KeyError:
+				debug(
+					"Error : Don't find value " +
+					subresult_name + " in map")
+				return 0
+			return 1
+
+		n = 0
+		for rname in self.subresults:
+			r = self.subresults[rname]
+			if r.HasValue(name) == 1:
+				n += 1
+
+		return n
+
+	# ______________________________________
+	def Include(self, sub_result_list):
+		"""
+		(re)include some subresult names
+		"""
+		if len(sub_result_list) == 0:
+			self.Exclude("*")
+			return
+
+		if sub_result_list == '*':
+			sub_result_list = self.GetSubResultNameList()
+
+		a = sub_result_list.split(',')
+		for s in a:
+			if self.subresults_to_be_included is None:
+				self.subresults_to_be_included = list()
+
+			if self.IsIncluded(s) is False:
+				self.subresults_to_be_included.append(s)
+		self.Invalidate()
+
+	# ______________________________________
+	def Invalidate(self):
+		"""
+		Forget the merged values of this result and of the results holding it
+		"""
+
+		result = self
+		while result is not None:
+			result._cache.clear()
+			result = result._parent
+
+	# ______________________________________
+	def IsIncluded(self, alias):
+		"""
+		whether that subresult alias should be included when computing means, etc...
+		"""
+
+		if self.subresults_to_be_included is None:
+			return True
+
+		try:
+			assert self.subresults_to_be_included.count(alias) == 1
+		except AssertionError:
+			return False
+
+		return True
+
+	# ______________________________________
+	def MergeErrorStat(self, name):
+		"""
+		Stat. error merged from the included subresults, see GetErrorStat
+		"""
+
 		# Mean method (by default)
 		if self._resultMergingMethod == self._mergingMethod.kMean:
 
@@ -193,12 +460,7 @@ class AnnaResult():
 					"""
 
 					# Check fit status
-					fitStatus = r.GetValue("FitResult") \
-						if r.GetValue("FitResult") is not None else 0
-					covStatus = r.GetValue("CovMatrixStatus") \
-						if r.GetValue("CovMatrixStatus") is not None else 3
-					chi2 = r.GetValue("FitChi2PerNDF") \
-						if r.GetValue("FitChi2PerNDF") is not None else 1
+					fitStatus, covStatus, chi2 = self.GetFitStatus(r)
 
 					# Select only Fit that converge
 					if (fitStatus != 0 and fitStatus != 4000) or chi2 > 2.5:
@@ -252,45 +514,10 @@ class AnnaResult():
 				return None
 
 	# ______________________________________
-	def GetName(self):
-		return self.name
-
-	# ______________________________________
-	def GetRMS(self, name, subresult_name=''):
-		"""Compute the rms of the subresults.
-
-		Arguments:
-			name {str -- Name of the variable
-			subresult_name {str -- subresults
-
-		Returns:
-			number -- 0 in case of problem
+	def MergeRMS(self, name):
+		"""
+		RMS of the included subresults, see GetRMS
 		"""
-
-		# If we specify a subresults
-		if len(subresult_name) > 0:
-
-			if not self._subresult:
-
-				error("No subresult from which \
-						I could get the {} one...".format(subresult_name))
-				return 0
-
-			sub = self._subresult[subresult_name]
-			if not sub:
-				error("No subresult from which \
-						I could get the {} one...".format(subresult_name))
-				return 0
-
-			return sub.GetRMS(name)
-
-		# self._map existes only for AnnaResults w/o subresults
-		if self._map is not None:
-			try:
-				error_sys = self._map[name][self._index.kSys]
-			except KeyError:
-				error_sys = 0.0
-			return error_sys
 
 		v1, v2, sm = 0., 0., 0.
 		n = 0
@@ -312,12 +539,7 @@ class AnnaResult():
 				"""
 
 				# Check fit status
-				fitStatus = r.GetValue("FitResult") \
-					if r.GetValue("FitResult") is not None else 0
-				covStatus = r.GetValue("CovMatrixStatus") \
-					if r.GetValue("CovMatrixStatus") is not None else 3
-				chi2 = r.GetValue("FitChi2PerNDF") \
-					if r.GetValue("FitChi2PerNDF") is not None else 1
+				fitStatus, covStatus, chi2 = self.GetFitStatus(r)
 
 				# Select only Fit that converge
 				if (fitStatus != 0 and fitStatus != 4000) or chi2 > 2.5:
@@ -363,63 +585,11 @@ class AnnaResult():
 		return unbiased
 
 	# ______________________________________
-	def GetSubResultNameList(self):
-		"""Get a comma separated list of our subresult aliases
+	def MergeValue(self, name):
 		"""
-		subresult_name_list = ''
-
-		for result in self.subresults:
-			if len(subresult_name_list) > 0:
-				subresult_name_list += ","
-
-			subresult_name_list += result.GetName()
-
-		return subresult_name_list
-
-	# ______________________________________
-	def GetTitle(self):
-		return self.title
-
-	# ______________________________________
-	def GetValue(self, name, subresult_name=''):
-		"""Get a value (either directly or by computing the mean of the subresults).
-
-		Default method is mean, but it can be changed with a different settings
-		of self._resultMergingMethod
-
-		Arguments:
-			name {str -- Name of the variable
-			subresult_name {str -- subresult name
-
-		Returns:
-			number -- None in case of error
+		Value merged from the included subresults, see GetValue
 		"""
 
-		# If we specify a subresults
-		if len(subresult_name) > 0:
-
-			if not self._subresult:
-				error("No subresult from which \
-						I could get the {} one...".format(subresult_name))
-				return None
-
-			sub = self._subresult[subresult_name]
-
-			if not sub:
-				error("No subresult from which \
-						I could get the {} one...".format(subresult_name))
-				return None
-
-			return sub.GetValue(name)
-
-		# self._map existes only for AnnaResults w/o subresults
-		if self._map is not None:
-			try:
-				value = self._map[name][self._index.kValue]
-			except KeyError:
-				return None
-			return value
-
 		# Mean method (by default)
 		if self._resultMergingMethod == self._mergingMethod.kMean:
 
@@ -442,12 +612,7 @@ class AnnaResult():
 					"""
 
 					# Check fit status
-					fitStatus = r.GetValue("FitResult") \
-						if r.GetValue("FitResult") is not None else 0
-					covStatus = r.GetValue("CovMatrixStatus") \
-						if r.GetValue("CovMatrixStatus") is not None else 3
-					chi2 = r.GetValue("FitChi2PerNDF") \
-						if r.GetValue("FitChi2PerNDF") is not None else 1
+					fitStatus, covStatus, chi2 = self.GetFitStatus(r)
 
 					# Select only Fit that converge
 					if (fitStatus != 0 and fitStatus != 4000) or chi2 > 2.5:
@@ -490,80 +655,6 @@ class AnnaResult():
 
 			return sm
 
-	# ______________________________________
-	def HasValue(self, name, subresult_name=''):
-		"""Whether this result (or subresult if subresult_name is provided)
-		has a property named "name"
-		When having subresults, return the number of subresults that have this value
-		"""
-		if len(subresult_name) > 0:
-			if self.subresults is None:
-				error("Error : No subresults from which \
-				I could get the {} one...".format(subresult_name))
-				return 0
-
-			try:
-				sub = self.subresults[subresult_name]
-			except KeyError:
-				error("Error : Could not get subresult named " + subresult_name)
-				return 0
-
-			return sub.HasValue(name)
-
-		if self._map is not None:
-			try:
-				self._map[name]
-			except KeyError:
-				debug(
-					"Error : Don't find value " +
-					subresult_name + " in map")
-				return 0
-			return 1
-
-		n = 0
-		for rname in self.subresults:
-			r = self.subresults[rname]
-			if r.HasValue(name) == 1:
-				n += 1
-
-		return n
-
-	# ______________________________________
-	def Include(self, sub_result_list):
-		"""
-		(re)include some subresult names
-		"""
-		if len(sub_result_list) == 0:
-			self.Exclude("*")
-			return
-
-		if sub_result_list == '*':
-			sub_result_list = self.GetSubResultNameList()
-
-		a = sub_result_list.split(',')
-		for s in a:
-			if self.subresults_to_be_included is None:
-				self.subresults_to_be_included = list()
-
-			if self.IsIncluded(s) is False:
-				self.subresults_to_be_included.append(s)
-
-	# ______________________________________
-	def IsIncluded(self, alias):
-		"""
-		whether that subresult alias should be included when computing means, etc...
-		"""
-
-		if self.subresults_to_be_included is None:
-			return True
-
-		try:
-			assert self.subresults_to_be_included.count(alias) == 1
-		except AssertionError:
-			return False
-
-		return True
-
 	# ______________________________________
 	def Print(self, opt=''):
 		"""
@@ -701,6 +792,7 @@ class AnnaResult():
 		"""
 		Set a (value,error) pair with a given name
 		"""
+		self.Invalidate()
 		if self._map is None:
 			self._map = dict()
 		try:
@@ -14,10 +14,22 @@ class AnnaSpectra():
 
     AnnaResults are stored according to a specific binning into a TObjArray.
 
+    For a N dimensional binning, each result is also keyed by its
+    cell, the index of its bin on each axis (see GetResultForCell).
+
+    The fits of a headless AnnaFitter have no frame, only sampled
+    curves: their frames are rebuilt when drawn (see GetFrame).
+
     Extends:
         TNamed
     """
 
+    # Line color and style of the sampled curves, in drawing order
+    _curve_styles = [
+        ('background', ROOT.kBlue, 2),
+        ('signal', ROOT.kRed, 2),
+        ('model', ROOT.kBlue, 1)]
+
     # ______________________________________
     def __init__(self, name, title):
         """ cstr """
@@ -25,10 +37,13 @@ class AnnaSpectra():
         self.name = name
         self.title = title
         self.results = dict()   # where are stored the AnnaResults
+        self.axes = None        # [name, limits...] of each binning axis
+        self.cells = dict()     # bin of each cell
 
     # ______________________________________
-    def AdoptResult(self, result, bin):
-        """ adopt (i.e. we are becoming the owner) a result for a given bin"""
+    def AdoptResult(self, result, bin, cell=None):
+        """ adopt (i.e. we are becoming the owner) a result for a given bin,
+        and its cell (tuple) in a N dimensional binning """
 
         if result is None:
             error("Cannot adopt a null result list")
@@ -46,6 +61,8 @@ class AnnaSpectra():
             return 0
 
         else:
+            if cell is not None:
+                self.GetCells()[tuple(cell)] = str(bin)
             print(" --- result {} (bin {}) adopted !".format(result.GetName(), str(bin)))
             return 1
 
@@ -75,11 +92,12 @@ class AnnaSpectra():
                 if subresults is not None and subresult.name not in subresults:
                     continue
 
-                if subresult.frame is not None:
-                    frame_list.append(subresult.frame)
+                frame = self.GetFrame(subresult)
+                if frame is not None:
+                    frame_list.append(frame)
                 else:
                     warning(
-                        'Cannot find frame in subresult {}'
+                        'Cannot find frame or curves in subresult {}'
                         .format(subresult.name))
                     continue
 
@@ -154,10 +172,88 @@ class AnnaSpectra():
                     '', '{} : {:.1f} +- {:.1f}'.format(q[0], q[1], q[2]))
             leg.Draw("same")
 
+    # ______________________________________
+    def GetAxes(self):
+        """
+        [name, limits...] of each axis of the binning, None if unknown
+        """
+        return getattr(self, 'axes', None)
+
     # ______________________________________
     def GetBins(self):
         return self.results.keys()
 
+    # ______________________________________
+    def GetCells(self):
+        if not hasattr(self, 'cells'):
+            self.cells = dict()
+        return self.cells
+
+    # ______________________________________
+    def GetFrame(self, subresult):
+        """Frame of a subresult
+
+        The frame drawn during the fit, or for a headless fit a frame
+        rebuilt from the histo and the sampled curves
+        (see AnnaFitter.GetCurves). Rebuilt frames are not stored.
+
+        Arguments:
+            subresult {AnnaResult}
+
+        Returns:
+            RooPlot -- None if the subresult has neither
+        """
+
+        if subresult.frame is not None:
+            return subresult.frame
+
+        curves = getattr(subresult, 'curves', None)
+        histo = subresult.histo
+        if curves is None or histo is None:
+            return None
+
+        x = curves['x']
+        var = ROOT.RooRealVar(
+            histo.GetXaxis().GetName(),
+            histo.GetXaxis().GetTitle(),
+            x[0], x[-1])
+        frame = var.frame()
+        ROOT.SetOwnership(frame, False)
+        frame.SetTitle(subresult.GetTitle())
+        data = ROOT.RooDataHist(histo.GetName(), histo.GetTitle(), ROOT.RooArgList(var), histo)
+        data.plotOn(frame)
+
+        # The curves are in entries per unit of x
+        width = histo.GetXaxis().GetBinWidth(1)
+        for name, color, style in self._curve_styles:
+            if name not in curves:
+                continue
+            graph = ROOT.TGraph(len(x))
+            for i, (xi, yi) in enumerate(zip(x, curves[name])):
+                graph.SetPoint(i, xi, yi * width)
+            graph.SetLineColor(color)
+            graph.SetLineStyle(style)
+            graph.SetLineWidth(2)
+            frame.addObject(graph, 'L')
+        return frame
+
+    # ______________________________________
+    def GetResultForCell(self, cell):
+        """Result of a cell of the binning
+
+        Arguments:
+            cell {tuple} -- index of the bin on each axis, e.g. (ipt, iy)
+
+        Returns:
+            AnnaResult -- None if there is no result for the cell
+        """
+
+        bin = self.GetCells().get(tuple(cell))
+        if bin is None:
+            warning('No result for cell {} in {}'.format(tuple(cell), self.GetName()))
+            return None
+        return self.results.get(bin)
+
     # ______________________________________
     def GetResults(self):
         return self.results
@@ -174,6 +270,10 @@ class AnnaSpectra():
     def GetTitle(self):
         return self.title
 
+    # ______________________________________
+    def SetAxes(self, axes):
+        self.axes = axes
+
 # =============================================================================
 # The END
 # =============================================================================
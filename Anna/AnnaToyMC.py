@@ -0,0 +1,257 @@
+# =============================================================================
+#  @class AnnaToyMC
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-05-22
+
+from .AnnaFitter import has_scipy
+from .AnnaFitScheduler import AnnaFitScheduler, GetTaskFitter
+# Python
+import hashlib
+import json
+import math
+import multiprocessing
+from logging import error, info
+
+
+# ______________________________________
+def RunToyTask(task):
+    """Generate and fit some toys of one subresult
+
+    Executed in the worker processes of AnnaToyMC, the fitters
+    are shared as for the fits (see GetTaskFitter).
+
+    Arguments:
+        task {dict} -- see AnnaToyMC.GetTasks
+
+    Returns:
+        int, int, list -- subresult index, first toy and (value, error)
+            by parameter name of each toy, None for the toys not converged
+    """
+
+    fitter = GetTaskFitter(task)
+    fits = list()
+    for seed in task['seeds']:
+        histo = fitter.GenerateToy(task['fit_type'], task['histo'], task['truth'], seed)
+        if histo is None:
+            fits.append(None)
+            continue
+        subresults = fitter.FitHisto([task['fit_type']], histo)
+        if not subresults or \
+                subresults[0].GetValue("FitResult") != 0 or subresults[0].GetValue("CovMatrixStatus") != 3:
+            fits.append(None)
+            continue
+        fits.append(dict([
+            (name, (subresults[0].GetValue(name), subresults[0].GetErrorStat(name)))
+            for name in task['parameters'] if subresults[0].HasValue(name)]))
+    return task['index'], task['first'], fits
+
+
+# ______________________________________
+class AnnaToyMC:
+    """Fit stability of subresults with pseudo-datasets
+
+    Each converged subresult is the model of ntoys pseudo-datasets
+    (see AnnaFitter.GenerateToy) fitted again with the same fit type,
+    in a pool of processes as AnnaFitScheduler. Toy i of a subresult
+    has its own random stream, seeded from the seed, the key of the
+    subresult and i: the toys are the same whatever the number of
+    processes and the order of the tasks.
+
+    The toys are fitted headless (see AnnaFitter). For each studied
+    parameter p the subresult gets:
+        p_ToyBias -- mean of fitted - true value
+        p_ToyPullMean -- mean of (fitted - true) / error
+        p_ToyPullWidth -- standard deviation of the pulls
+    each with its error, and ToyFits and ToyFailed, the numbers of
+    converged and failed toy fits.
+
+        toys = AnnaToyMC(ntoys=200, ncores=16)
+        toys.AddSubResult(key, fitter, fit_type, subresult)
+        for key, summary in toys.Run():
+            ...
+    """
+
+    # Toys generated and fitted by one task
+    toys_per_task = 10
+
+    # ______________________________________
+    def __init__(self, ntoys=100, ncores=None, nworkers=None, seed=0, parameters=None):
+        """cstr
+
+        Keyword Arguments:
+            ntoys {int} -- toys per subresult (default: {100})
+            ncores {int} -- see AnnaFitScheduler (default: {None})
+            nworkers {int} -- see AnnaFitScheduler (default: {None})
+            seed {int} -- of all the random streams (default: {0})
+            parameters {list} -- names of the studied parameters,
+                None for the signal yield, mean and width (default: {None})
+        """
+
+        self.ntoys = ntoys
+        self.seed = seed
+        self.parameters = parameters
+        self.scheduler = AnnaFitScheduler(ncores, nworkers)
+        self.subresults = list()
+
+    # ______________________________________
+    def AddSubResult(self, key, fitter, fit_type, subresult):
+        """Register a subresult for the toys
+
+        Arguments:
+            key {str} -- unique, e.g. the path of the spectra, the bin
+                and the subresult name, it seeds the toys
+            fitter {AnnaFitter} -- with the particle and binning of the fit
+            fit_type {list} -- fit configuration string of the subresult
+            subresult {AnnaResult} -- as returned by AnnaFitter.FitHisto
+
+        Returns:
+            bool -- False if the subresult cannot be used
+        """
+
+        if subresult.histo is None:
+            error('No histo in {}'.format(subresult.GetName()))
+            return False
+        seed = fitter.GetSeed(subresult, subresult.histo)
+        if seed is None:
+            error('{} did not converge, no toys'.format(subresult.GetName()))
+            return False
+
+        parameters = self.parameters
+        if parameters is None:
+            parameters = [
+                fitter._yields[0],
+                fitter._mean_map[fitter._particle_name].GetName(),
+                fitter._width_map[fitter._particle_name].GetName()]
+        self.subresults.append((key, fitter, fit_type, subresult, seed['parameters'], parameters))
+        return True
+
+    # ______________________________________
+    def GetSeed(self, key, toy):
+        """
+        Seed of the random stream of a toy
+        """
+
+        content = json.dumps([self.seed, key, toy])
+        return int(hashlib.sha1(content.encode('utf-8')).hexdigest()[:8], 16)
+
+    # ______________________________________
+    def GetSummary(self, truth, fits, parameters):
+        """Bias and pulls of the toys of a subresult
+
+        Arguments:
+            truth {dict} -- values of the model of the toys
+            fits {list} -- see RunToyTask
+            parameters {list} -- studied parameter names
+
+        Returns:
+            dict -- (value, error) by summary name
+        """
+
+        converged = [fit for fit in fits if fit is not None]
+        summary = {
+            'ToyFits': (len(converged), 0.),
+            'ToyFailed': (len(fits) - len(converged), 0.)}
+
+        for name in parameters:
+            if name not in truth:
+                continue
+            deltas = [fit[name][0] - truth[name] for fit in converged if name in fit]
+            pulls = [
+                (fit[name][0] - truth[name]) / fit[name][1]
+                for fit in converged if name in fit and fit[name][1] > 0]
+            for suffix, values in [('Bias', deltas), ('Pull', pulls)]:
+                n = len(values)
+                if n < 2:
+                    continue
+                mean = sum(values) / n
+                width = math.sqrt(sum([(v - mean) ** 2 for v in values]) / (n - 1))
+                if suffix == 'Bias':
+                    summary[name + '_ToyBias'] = (mean, width / math.sqrt(n))
+                else:
+                    summary[name + '_ToyPullMean'] = (mean, width / math.sqrt(n))
+                    summary[name + '_ToyPullWidth'] = (width, width / math.sqrt(2. * (n - 1)))
+        return summary
+
+    # ______________________________________
+    def GetTasks(self):
+        """
+        toys_per_task toys of one subresult per task
+        """
+
+        tasks = list()
+        for i, (key, fitter, fit_type, subresult, truth, parameters) in enumerate(self.subresults):
+            seeds = [self.GetSeed(key, toy) for toy in range(self.ntoys)]
+            for first in range(0, self.ntoys, self.toys_per_task):
+                tasks.append({
+                    'index': i,
+                    'first': first,
+                    'particle': fitter._particle_name,
+                    'binning': fitter._binning,
+                    'engine': fitter.engine,
+                    'adaptive': fitter.adaptive,
+                    'headless': True,
+                    'fit_type': fit_type,
+                    'histo': subresult.histo,
+                    'truth': truth,
+                    'parameters': parameters,
+                    'seeds': seeds[first:first + self.toys_per_task]})
+        return tasks
+
+    # ______________________________________
+    def Run(self):
+        """Fit the toys of all the registered subresults
+
+        The summaries are stored in the subresults (see SetSummary).
+
+        Returns:
+            list -- (key, summary) pairs in the order of AddSubResult,
+                see GetSummary
+        """
+
+        if has_scipy is False:
+            error('The toys require numpy and scipy')
+            return list()
+
+        tasks = self.GetTasks()
+        nworkers, ncpu = self.scheduler.GetBudget(len(tasks))
+        for task in tasks:
+            task['ncpu'] = ncpu
+        print(
+            ' --- {} toys of {} subresults in {} tasks on {} processes with {} cores each'
+            .format(self.ntoys * len(self.subresults), len(self.subresults), len(tasks), nworkers, ncpu))
+
+        # Toy fits of each subresult, in the toy order
+        fits = [[None] * self.ntoys for subresult in self.subresults]
+        if nworkers <= 1:
+            for task in tasks:
+                index, first, task_fits = RunToyTask(task)
+                fits[index][first:first + len(task_fits)] = task_fits
+        elif len(tasks) > 0:
+            pool = multiprocessing.Pool(processes=nworkers)
+            try:
+                for ndone, (index, first, task_fits) in enumerate(pool.imap_unordered(RunToyTask, tasks)):
+                    fits[index][first:first + len(task_fits)] = task_fits
+                    info('Run: {}/{} toy tasks done'.format(ndone + 1, len(tasks)))
+            finally:
+                pool.close()
+                pool.join()
+
+        summaries = list()
+        for i, (key, fitter, fit_type, subresult, truth, parameters) in enumerate(self.subresults):
+            summary = self.GetSummary(truth, fits[i], parameters)
+            self.SetSummary(subresult, summary)
+            summaries.append((key, summary))
+        return summaries
+
+    # ______________________________________
+    def SetSummary(self, subresult, summary):
+        """
+        Store the bias and pulls in the subresult
+        """
+
+        for name, (value, value_error) in summary.items():
+            subresult.Set(name, value, value_error, 0.)
+
+# =============================================================================
+# The END
+# =============================================================================
@@ -0,0 +1,204 @@
+# =============================================================================
+#  @class AnnaCutExpression
+#  Compiler for the filter_mask cut strings of the TupleFilterBank
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-03-12
+
+import operator
+import re
+from logging import error
+
+# Comparison operators understood in a filter mask
+_operators = {
+	'<=': operator.le,
+	'>=': operator.ge,
+	'==': operator.eq,
+	'!=': operator.ne,
+	'<': operator.lt,
+	'>': operator.gt}
+
+_cut_pattern = re.compile(
+	r'^([A-Za-z_][A-Za-z0-9_]*)(<=|>=|==|!=|<|>)([-+]?[0-9]*\.?[0-9]*(?:[eE][-+]?[0-9]+)?)$')
+
+
+# ______________________________________
+class AnnaCut:
+	"""Single comparison between a branch and a number
+
+	Example: muplus_PIDmu > 3.
+	"""
+
+	# ______________________________________
+	def __init__(self, branch, op, value):
+		"""cstr
+
+		Arguments:
+			branch {str} -- full branch name
+			op {str} -- one of the keys of _operators
+			value {float}
+		"""
+		self.branch = branch
+		self.op = op
+		self.value = value
+		self._compare = _operators[op]
+
+	# ______________________________________
+	def __str__(self):
+		return self.ToFormula()
+
+	# ______________________________________
+	def Evaluate(self, arrays):
+		"""
+		Vectorized evaluation on columns (numpy arrays)
+		"""
+		return self._compare(arrays[self.branch], self.value)
+
+	# ______________________________________
+	def GetBranches(self):
+		return [self.branch]
+
+	# ______________________________________
+	def Passes(self, entry):
+		"""
+		Evaluation on a single entry (TChain entry or numpy record)
+		"""
+		return self._compare(getattr(entry, self.branch), self.value)
+
+	# ______________________________________
+	def ToFormula(self):
+		"""
+		TTreeFormula string
+		"""
+		return '{}{}{}'.format(self.branch, self.op, repr(self.value))
+
+
+# ______________________________________
+class AnnaCutAnd:
+	"""Logical AND of AnnaCut, i.e. a compiled filter mask
+	"""
+
+	# ______________________________________
+	def __init__(self, cuts=[]):
+		self.cuts = list()
+		for cut in cuts:
+			if isinstance(cut, AnnaCutAnd):
+				self.cuts += cut.cuts
+			else:
+				self.cuts.append(cut)
+
+	# ______________________________________
+	def __str__(self):
+		return self.ToFormula()
+
+	# ______________________________________
+	def Evaluate(self, arrays):
+		"""Vectorized evaluation
+
+		Arguments:
+			arrays {numpy.recarray or dict} -- columns by branch name
+
+		Returns:
+			numpy.array or bool -- True when there is no cut
+		"""
+
+		mask = True
+		for cut in self.cuts:
+			mask = mask & cut.Evaluate(arrays)
+		return mask
+
+	# ______________________________________
+	def GetBranches(self):
+		"""
+		Branches read by the cuts, without duplicates
+		"""
+		branches = list()
+		for cut in self.cuts:
+			if cut.branch not in branches:
+				branches.append(cut.branch)
+		return branches
+
+	# ______________________________________
+	def GetFailingCut(self, entry):
+		"""Return the first cut the entry does not pass
+
+		Returns:
+			AnnaCut -- None if all cuts pass
+		"""
+
+		for cut in self.cuts:
+			try:
+				if cut.Passes(entry) is False:
+					return cut
+			except AttributeError:
+				return cut
+		return None
+
+	# ______________________________________
+	def Passes(self, entry):
+		"""
+		Evaluation on a single entry (TChain entry or numpy record)
+		"""
+		return self.GetFailingCut(entry) is None
+
+	# ______________________________________
+	def Split(self, branches):
+		"""Split the cuts between the ones ROOT can evaluate
+		(i.e. on branches of the chain) and the others
+
+		Arguments:
+			branches {list} -- branches available in the chain
+
+		Returns:
+			AnnaCutAnd, AnnaCutAnd -- ROOT cuts, remaining cuts
+		"""
+
+		pushed = [cut for cut in self.cuts if cut.branch in branches]
+		remaining = [cut for cut in self.cuts if cut.branch not in branches]
+		return AnnaCutAnd(pushed), AnnaCutAnd(remaining)
+
+	# ______________________________________
+	def ToFormula(self):
+		"""
+		TTreeFormula string, as used by chain.withCuts()
+		"""
+		return '&&'.join([cut.ToFormula() for cut in self.cuts])
+
+
+# ______________________________________
+def CompileMask(mask, leafs):
+	"""Parse a filter mask once
+
+	Each cut of the mask is applied to every leaf, as
+	<leaf>_<cut>, or as <cut> if the leaf is ''.
+
+	Arguments:
+		mask {str} -- cuts separated by '**'
+			example: 'TRACK_GhostProb<0.5 ** PIDmu > 3'
+		leafs {list} -- prefixes of the cut variables
+
+	Returns:
+		AnnaCutAnd -- None if the mask cannot be parsed
+	"""
+
+	cuts = list()
+	for leaf in leafs:
+		for cut in mask.replace(' ', '').split('**'):
+			if cut == '':
+				continue
+
+			match = _cut_pattern.match(cut)
+			try:
+				assert match is not None
+				value = float(match.group(3))
+			except (AssertionError, ValueError):
+				error(" Cannot compile cut '{}', expect <variable><op><number>".format(cut))
+				return None
+
+			branch = match.group(1) if leaf == '' else '{}_{}'.format(leaf, match.group(1))
+			cuts.append(AnnaCut(branch, match.group(2), value))
+
+	return AnnaCutAnd(cuts)
+
+# =============================================================================
+# The END
+# =============================================================================
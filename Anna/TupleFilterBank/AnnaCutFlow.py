@@ -0,0 +1,139 @@
+# =============================================================================
+#  @class AnnaCutFlow
+#  Cut-flow of the TupleFilterBank filters
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-04-16
+
+import time
+
+
+# ______________________________________
+class AnnaCutFlow:
+	"""Candidates entering and passing each cut of a filter,
+	with the wall time spent in each cut
+
+	Cuts are recorded in the order they are first seen, which
+	is the order they are applied. Row by row:
+
+		start = time.time()
+		if not cutflow.Fill('ghost', not is_ghost, start):
+			continue
+
+	or for a whole array: cutflow.FillArray('ghost', entered, passed, elapsed)
+	"""
+
+	# ______________________________________
+	def __init__(self, name='CutFlow', content=None):
+		"""cstr
+
+		Keyword Arguments:
+			name {str} -- (default: {'CutFlow'})
+			content {dict} -- as returned by ToDict (default: {None})
+		"""
+
+		self.name = name
+		self.cuts = list()
+		self.entered = dict()
+		self.passed = dict()
+		self.time = dict()
+
+		if content is not None:
+			for cut in content['cuts']:
+				self.FillArray(cut, content['entered'][cut], content['passed'][cut], content['time'][cut])
+
+	# ______________________________________
+	def __str__(self):
+		lines = ['{:<40} {:>12} {:>12} {:>8} {:>10}'.format(
+			self.name, 'entered', 'passed', 'eff [%]', 'time [s]')]
+		for cut in self.cuts:
+			eff = 100. * self.passed[cut] / self.entered[cut] if self.entered[cut] > 0 else 0.
+			lines.append('{:<40} {:>12} {:>12} {:>8.2f} {:>10.2f}'.format(
+				cut, self.entered[cut], self.passed[cut], eff, self.time[cut]))
+		return '\n'.join(lines)
+
+	# ______________________________________
+	def Add(self, other):
+		"""
+		Add the counts and times of another cut-flow,
+		e.g. from a worker process
+		"""
+
+		for cut in other.cuts:
+			self.FillArray(cut, other.entered[cut], other.passed[cut], other.time[cut])
+
+	# ______________________________________
+	def Fill(self, cut, passed, start):
+		"""Record one candidate
+
+		Arguments:
+			cut {str} -- cut name
+			passed {bool}
+			start {float} -- time.time() before the cut was evaluated
+
+		Returns:
+			bool -- passed
+		"""
+
+		if cut not in self.entered:
+			self.FillArray(cut, 0, 0, 0.)
+		self.time[cut] += time.time() - start
+		self.entered[cut] += 1
+		if passed:
+			self.passed[cut] += 1
+		return passed
+
+	# ______________________________________
+	def FillArray(self, cut, entered, passed, elapsed):
+		"""
+		Record many candidates at once
+		"""
+
+		if cut not in self.entered:
+			self.cuts.append(cut)
+			self.entered[cut] = 0
+			self.passed[cut] = 0
+			self.time[cut] = 0.
+		self.entered[cut] += int(entered)
+		self.passed[cut] += int(passed)
+		self.time[cut] += elapsed
+
+	# ______________________________________
+	def GetEntries(self):
+		"""
+		Candidates entering the first cut
+		"""
+		if len(self.cuts) == 0:
+			return 0
+		return self.entered[self.cuts[0]]
+
+	# ______________________________________
+	def GetExcluded(self):
+		return self.GetEntries() - self.GetKept()
+
+	# ______________________________________
+	def GetKept(self):
+		"""
+		Candidates passing the last cut
+		"""
+		if len(self.cuts) == 0:
+			return 0
+		return self.passed[self.cuts[-1]]
+
+	# ______________________________________
+	def GetName(self):
+		return self.name
+
+	# ______________________________________
+	def ToDict(self):
+		"""
+		Plain content, e.g. for json
+		"""
+		return {
+			'cuts': list(self.cuts),
+			'entered': dict(self.entered),
+			'passed': dict(self.passed),
+			'time': dict(self.time)}
+
+# =============================================================================
+# The END
+# =============================================================================
@@ -0,0 +1,256 @@
+# =============================================================================
+#  @class AnnaDerivedColumns
+#  Cached vertex and lifetime columns for the TupleFilterBank
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-04-20
+
+import hashlib
+import os
+import re
+from logging import error, info
+import ROOT
+from ROOT import TMath
+
+# The cache is built with numpy and root_numpy
+try:
+	import numpy as np
+	from root_numpy import array2tree, tree2array
+	has_numpy = True
+except ImportError:
+	has_numpy = False
+
+# Mass of the J/psi in the pseudo-proper time (MeV)
+jpsi_mass = 3096.916
+
+# Definitions of the columns, in the order they are computed: expressions
+# valid both in Python (numpy) and in C++ (RDataFrame, see AnnaRDataFrameFilter)
+# of the {m}_ branches of the mother and of the columns defined above them
+_definitions = [
+	('DV', 'sqrt(pow({m}_OWNPV_X - {m}_ENDVERTEX_X, 2) + pow({m}_OWNPV_Y - {m}_ENDVERTEX_Y, 2) + pow({m}_OWNPV_Z - {m}_ENDVERTEX_Z, 2))'),
+	('dZ', '({m}_ENDVERTEX_Z - {m}_OWNPV_Z) * 1e-3'),
+	('tZ', 'dZ * {mass!r} / ({m}_PZ * {c!r})'),
+	('OWNPV_R', 'hypot({m}_OWNPV_X, {m}_OWNPV_Y)'),
+	('ENDVERTEX_R', 'hypot({m}_ENDVERTEX_X, {m}_ENDVERTEX_Y)')]
+
+_identifier = re.compile(r'\b[A-Za-z_][A-Za-z0-9_]*')
+
+
+# ______________________________________
+def EvaluateFormula(formula, arrays, columns={}):
+	"""Vectorized evaluation of a formula of the definitions
+
+	Arguments:
+		formula {str} -- see _definitions
+		arrays {numpy.recarray or dict} -- branches by name
+
+	Keyword Arguments:
+		columns {dict} -- other columns and functions by name,
+			looked up before the branches (default: {})
+
+	Returns:
+		numpy.array
+	"""
+
+	namespace = {'sqrt': np.sqrt, 'pow': np.power, 'hypot': np.hypot}
+	namespace.update(columns)
+	for name in set(_identifier.findall(formula)):
+		if name not in namespace:
+			namespace[name] = arrays[name]
+	return eval(formula, {'__builtins__': {}}, namespace)
+
+
+# ______________________________________
+class AnnaDerivedColumns:
+	"""Vertex and lifetime quantities of a mother particle
+
+	<mother>_DV -- distance between OWNPV and ENDVERTEX
+	<mother>_dZ -- (ENDVERTEX_Z - OWNPV_Z) in m
+	<mother>_tZ -- pseudo-proper time
+	<mother>_OWNPV_R, <mother>_ENDVERTEX_R -- transverse radii
+
+	They are computed once per input file and stored in a friend
+	tree, in a cache file named after a fingerprint of the input
+	file (path, size, mtime or ROOT UUID) and of the column
+	definitions, so that a changed input gives a new cache.
+	"""
+
+	# Bump when the definitions of Compute change
+	version = 1
+
+	# ______________________________________
+	def __init__(self, mother_leaf, cache_dir='.', chunk_size=1000000):
+		"""cstr
+
+		Arguments:
+			mother_leaf {str}
+
+		Keyword Arguments:
+			cache_dir {str} -- where the cache files are written (default: {'.'})
+			chunk_size {int} -- entries read at once when building (default: {1000000})
+		"""
+
+		self.mother_leaf = mother_leaf
+		self.cache_dir = os.path.abspath(cache_dir)
+		self.chunk_size = chunk_size
+
+		# friend chains must live as long as their chain
+		self._friends = list()
+
+	# ______________________________________
+	def __getstate__(self):
+		# ROOT objects are not sent to the worker processes
+		state = dict(self.__dict__)
+		state['_friends'] = list()
+		return state
+
+	# ______________________________________
+	def AddFriend(self, chain):
+		"""Add the cached columns as a friend of the chain,
+		building the missing cache files
+
+		Arguments:
+			chain {TChain}
+
+		Returns:
+			bool -- False if a cache file cannot be built
+		"""
+
+		friend = ROOT.TChain(self.GetFriendName())
+		for element in chain.GetListOfFiles():
+			cache_path = self.Build(element.GetTitle(), element.GetName())
+			if cache_path is None:
+				return False
+			friend.Add(cache_path)
+
+		chain.AddFriend(friend)
+		self._friends.append(friend)
+		return True
+
+	# ______________________________________
+	def Build(self, file_path, tree_name):
+		"""Compute the columns of a file if not already cached
+
+		Arguments:
+			file_path {str}
+			tree_name {str}
+
+		Returns:
+			str -- cache file path, None in case of error
+		"""
+
+		cache_path = self.GetCachePath(file_path)
+		if cache_path is None:
+			return None
+		if os.path.isfile(cache_path):
+			return cache_path
+
+		if has_numpy is False:
+			error(' derived columns require numpy and root_numpy')
+			return None
+
+		f = ROOT.TFile.Open(file_path)
+		if not f or f.IsZombie():
+			error('Cannot open {}'.format(file_path))
+			return None
+		tree = f.Get(tree_name)
+		entries = tree.GetEntries()
+
+		if os.path.isdir(self.cache_dir) is False:
+			os.makedirs(self.cache_dir)
+
+		# Write in a temporary file, so that an interrupted build is not used
+		tmp_path = cache_path + '.tmp'
+		cache_file = ROOT.TFile(tmp_path, 'recreate')
+		friend = None
+		for first in range(0, max(entries, 1), self.chunk_size):
+			arrays = tree2array(
+				tree,
+				branches=self.GetInputBranches(),
+				start=first,
+				stop=min(first + self.chunk_size, entries))
+			columns = self.Compute(arrays)
+			record = np.empty(len(arrays), dtype=[(name, np.float64) for name in self.GetBranchNames()])
+			for name in self.GetBranchNames():
+				record[name] = columns[name]
+			cache_file.cd()
+			friend = array2tree(record, name=self.GetFriendName(), tree=friend)
+
+		cache_file.cd()
+		friend.Write('', ROOT.TObject.kOverwrite)
+		cache_file.Close()
+		f.Close()
+		os.rename(tmp_path, cache_path)
+		info('Build: {} entries of {} cached in {}'.format(entries, file_path, cache_path))
+
+		return cache_path
+
+	# ______________________________________
+	def Compute(self, arrays):
+		"""Vectorized computation of the columns
+
+		Arguments:
+			arrays {numpy.recarray or dict} -- GetInputBranches() columns
+
+		Returns:
+			dict -- arrays by branch name (see GetBranchNames)
+		"""
+
+		columns = dict()
+		for name, formula in self.GetDefinitions():
+			columns[name] = EvaluateFormula(formula, arrays, columns)
+		return dict([(self.mother_leaf + '_' + name, columns[name]) for name in self.GetColumnNames()])
+
+	# ______________________________________
+	def GetBranchNames(self):
+		return [self.mother_leaf + '_' + name for name in self.GetColumnNames()]
+
+	# ______________________________________
+	def GetCachePath(self, file_path):
+		"""
+		Cache file of an input file, None if the file cannot be read
+		"""
+
+		if os.path.isfile(file_path):
+			stat = os.stat(file_path)
+			identity = [os.path.abspath(file_path), stat.st_size, int(stat.st_mtime)]
+		else:
+			f = ROOT.TFile.Open(file_path)
+			if not f or f.IsZombie():
+				error('Cannot open {}'.format(file_path))
+				return None
+			identity = [file_path, f.GetSize(), f.GetUUID().AsString()]
+			f.Close()
+
+		key = hashlib.sha1(repr(identity + [self.mother_leaf, self.version]).encode('utf-8')).hexdigest()[:16]
+		name = os.path.splitext(os.path.basename(file_path))[0]
+		return os.path.join(self.cache_dir, '{}_{}_derived_{}.root'.format(name, self.mother_leaf, key))
+
+	# ______________________________________
+	def GetColumnNames(self):
+		return [name for name, formula in _definitions]
+
+	# ______________________________________
+	def GetDefinitions(self):
+		"""
+		(column, expression) pairs of _definitions for the mother,
+		the columns named without the mother prefix
+		"""
+
+		return [
+			(name, formula.format(m=self.mother_leaf, mass=jpsi_mass, c=TMath.C()))
+			for name, formula in _definitions]
+
+	# ______________________________________
+	def GetFriendName(self):
+		return self.mother_leaf + '_derived'
+
+	# ______________________________________
+	def GetInputBranches(self):
+		return [
+			self.mother_leaf + '_' + vertex + '_' + axis
+			for vertex in ['OWNPV', 'ENDVERTEX']
+			for axis in ['X', 'Y', 'Z']] + [self.mother_leaf + '_PZ']
+
+# =============================================================================
+# The END
+# =============================================================================
@@ -0,0 +1,87 @@
+# =============================================================================
+#  @class AnnaGhostIndex
+#  Ghost/clone muon detector for the TupleFilterBank
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-03-26
+
+import math
+
+
+# ______________________________________
+class AnnaGhostIndex:
+	"""Spatial index of the dimuon candidates of an event
+
+	A candidate is a ghost if both its muons are almost collinear
+	(cos > cos_min) with the muons of a previous candidate of
+	the same event (run number, event number).
+
+	The unit vectors of the first muon are binned in a grid of
+	cells of the size of the chord at the threshold angle, so two
+	directions passing the cut are always in neighbouring cells
+	and a lookup only checks the 27 cells around the candidate.
+	The index is reset when the event changes.
+	"""
+
+	# ______________________________________
+	def __init__(self, cos_min=0.9999):
+		"""cstr
+
+		Keyword Arguments:
+			cos_min {float} -- collinearity threshold (default: {0.9999})
+		"""
+
+		self.cos_min = cos_min
+		self.cell_size = math.sqrt(2. * (1. - cos_min))
+		self.event = None
+		self.cells = dict()
+
+	# ______________________________________
+	def GetCell(self, u):
+		return (
+			int(math.floor(u[0] / self.cell_size)),
+			int(math.floor(u[1] / self.cell_size)),
+			int(math.floor(u[2] / self.cell_size)))
+
+	# ______________________________________
+	def GetUnitVector(self, p):
+		norm = math.sqrt(p[0] * p[0] + p[1] * p[1] + p[2] * p[2])
+		if norm == 0.:
+			return (0., 0., 0.)
+		return (p[0] / norm, p[1] / norm, p[2] / norm)
+
+	# ______________________________________
+	def IsGhost(self, event, p1, p2):
+		"""Check a candidate and add it to the index if it is not a ghost
+
+		Arguments:
+			event {tuple} -- (run number, event number)
+			p1 {tuple} -- (px, py, pz) of the first muon
+			p2 {tuple} -- (px, py, pz) of the second muon
+
+		Returns:
+			bool
+		"""
+
+		if event != self.event:
+			self.event = event
+			self.cells = dict()
+
+		u1 = self.GetUnitVector(p1)
+		u2 = self.GetUnitVector(p2)
+		i, j, k = self.GetCell(u1)
+
+		for di in (-1, 0, 1):
+			for dj in (-1, 0, 1):
+				for dk in (-1, 0, 1):
+					for v1, v2 in self.cells.get((i + di, j + dj, k + dk), []):
+						cos1 = u1[0] * v1[0] + u1[1] * v1[1] + u1[2] * v1[2]
+						cos2 = u2[0] * v2[0] + u2[1] * v2[1] + u2[2] * v2[2]
+						if cos1 > self.cos_min and cos2 > self.cos_min:
+							return True
+
+		self.cells.setdefault((i, j, k), []).append((u1, u2))
+		return False
+
+# =============================================================================
+# The END
+# =============================================================================
@@ -0,0 +1,210 @@
+# =============================================================================
+#  @class AnnaRDataFrameFilter
+#  RDataFrame backend of the TupleFilterBank
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-04-24
+
+import os
+import time
+from logging import error, info
+import ROOT
+from .AnnaCutFlow import AnnaCutFlow
+from .AnnaDerivedColumns import AnnaDerivedColumns
+from .AnnaTupleRef import AnnaTupleRef
+
+# C++ ghost index, shared with the selectors
+_ghost_header = os.path.join(
+	os.path.dirname(os.path.abspath(__file__)),
+	'..', '..', 'Selectors', 'AnnaGhostIndex.h')
+_ghost_declared = False
+
+
+# ______________________________________
+def DeclareGhostIndex():
+	"""
+	JIT-compile one AnnaGhostIndex per RDataFrame slot, and
+	the C++ functions of the luminous region definitions
+	(see AnnaTupleFilterBase.GetLuminosityRegionDefinitions)
+	"""
+
+	global _ghost_declared
+	if _ghost_declared is True:
+		return True
+
+	if ROOT.gInterpreter.Declare('#include "{}"'.format(os.path.normpath(_ghost_header))) is False:
+		error('Cannot compile {}'.format(_ghost_header))
+		return False
+	ROOT.gInterpreter.Declare(
+		'namespace AnnaRDF {\n'
+		'   std::vector<AnnaGhostIndex> ghostIndexes;\n'
+		'   void ResetGhostIndexes(unsigned int n) { ghostIndexes.assign(n, AnnaGhostIndex()); }\n'
+		'}\n'
+		'double VertexProb(double chi2, double ndof) { return TMath::Prob(chi2, (int) ndof); }\n')
+	_ghost_declared = True
+	return True
+
+
+# ______________________________________
+class AnnaRDataFrameFilter:
+	"""Run a TupleFilterBank filter as a compiled RDataFrame graph
+
+	The graph is generated from the filter definitions, so that
+	they stay the only copy of the selection:
+	the derived columns (AnnaDerivedColumns definitions), the cuts of
+	GetGeneralCut() and GetLuminosityRegionCuts() and the ghost check
+	(C++ AnnaGhostIndex, one per slot) are JIT-compiled Define/Filter
+	nodes, and GetOutputColumns() are written with a Snapshot, as floats
+	with the names of the CreateTuple() tuple.
+
+	By default the graph runs on one thread and gives the tuple of the
+	other engines. With nthreads != 1 the entries are shared between the
+	threads by clusters, without care for the events: a ghost candidate
+	whose event is cut by a cluster boundary is then kept.
+
+	Needs ROOT >= 6.26 (rdfslot_ and Redefine).
+	"""
+
+	# ______________________________________
+	def __init__(self, tuple_filter, nthreads=1):
+		"""cstr
+
+		Arguments:
+			tuple_filter {AnnaTupleFilterBase} -- the configured filter,
+				with output_path set
+
+		Keyword Arguments:
+			nthreads {int} -- threads for ROOT.EnableImplicitMT, 0 for all
+				the cores, 1 to run sequentially (default: {1})
+		"""
+
+		self.tuple_filter = tuple_filter
+		self.nthreads = nthreads
+
+	# ______________________________________
+	def BuildGraph(self, df, chain_branches):
+		"""Add the filter nodes to a RDataFrame
+
+		Arguments:
+			df {ROOT.RDataFrame}
+			chain_branches {list} -- branches of the chain
+
+		Returns:
+			RNode -- None in case of error
+		"""
+
+		general_cut = self.tuple_filter.GetGeneralCut()
+		if general_cut is None:
+			error(':BuildGraph: Cannot get the mask')
+			return None
+
+		columns = [str(name) for name in df.GetColumnNames()]
+		node = ROOT.RDF.AsRNode(df)
+		definitions = AnnaDerivedColumns(self.tuple_filter.mother_leaf).GetDefinitions()
+		for name, expression in definitions + self.tuple_filter.GetLuminosityRegionDefinitions():
+			if name not in columns:
+				node = node.Define(name, expression)
+
+		# Same order as the columnar engine
+		pushed, remaining = general_cut.Split(chain_branches)
+		for cut in pushed.cuts:
+			node = node.Filter(cut.ToFormula(), str(cut))
+		for name, cut in self.tuple_filter.GetLuminosityRegionCuts():
+			node = node.Filter(cut.ToFormula(), name)
+		for cut in remaining.cuts:
+			node = node.Filter(cut.ToFormula(), str(cut))
+		node = node.Filter(self.GetGhostExpression(), 'ghost')
+
+		return node
+
+	# ______________________________________
+	def GetGhostExpression(self):
+		m = self.tuple_filter.daughter_leafs
+		return (
+			'!AnnaRDF::ghostIndexes[rdfslot_].IsGhost(runNumber, eventNumber, '
+			'{0}_PX, {0}_PY, {0}_PZ, {1}_PX, {1}_PY, {1}_PZ)'.format(m[0], m[1]))
+
+	# ______________________________________
+	def GetOutputNames(self):
+		"""
+		Leaf names of the CreateTuple() tuple
+		"""
+
+		ROOT.gROOT.cd()
+		ntuple = self.tuple_filter.CreateTuple()
+		names = [leaf.GetName() for leaf in ntuple.GetListOfLeaves()]
+		ntuple.Delete()
+		return names
+
+	# ______________________________________
+	def GetTuple(self, chain):
+		"""Filter the chain and write the tuple in tuple_filter.output_path
+
+		Arguments:
+			chain {TChain}
+
+		Returns:
+			AnnaTupleRef -- None in case of error,
+				tuple_filter.cutflow is filled from the RDataFrame report
+		"""
+
+		if self.tuple_filter.output_path is None:
+			error(' the RDataFrame backend needs tuple_filter.output_path')
+			return None
+
+		if self.tuple_filter.CheckChainBranch(chain) is False:
+			error(' attributes are missing')
+			return None
+
+		if DeclareGhostIndex() is False:
+			return None
+
+		# The implicit multithreading of the caller is restored afterwards
+		was_mt = ROOT.IsImplicitMTEnabled()
+		pool_size = ROOT.GetThreadPoolSize() if was_mt else 0
+		try:
+			if self.nthreads != 1:
+				ROOT.EnableImplicitMT(self.nthreads)
+			else:
+				ROOT.DisableImplicitMT()
+			ROOT.AnnaRDF.ResetGhostIndexes(max(ROOT.GetThreadPoolSize(), 1))
+
+			df = ROOT.RDataFrame(chain)
+			node = self.BuildGraph(df, [branch.GetName() for branch in chain.GetListOfBranches()])
+			if node is None:
+				return None
+
+			# Output columns, as floats with the tuple names
+			columns = [str(name) for name in node.GetColumnNames()]
+			output_names = self.GetOutputNames()
+			for name, column in zip(output_names, self.tuple_filter.GetOutputColumns()):
+				if name in columns:
+					node = node.Redefine(name, '(float)({})'.format(column))
+				else:
+					node = node.Define(name, '(float)({})'.format(column))
+
+			print(' --- Start running over events with {} threads ...'.format(max(ROOT.GetThreadPoolSize(), 1)))
+			start = time.time()
+			report = node.Report()
+			node.Snapshot(self.tuple_filter.name, self.tuple_filter.output_path, output_names)
+			elapsed = time.time() - start
+		finally:
+			ROOT.DisableImplicitMT()
+			if was_mt:
+				ROOT.EnableImplicitMT(pool_size)
+
+		# The report only has the counts, the time goes to the first cut
+		cutflow = AnnaCutFlow()
+		for i, cut in enumerate(report):
+			cutflow.FillArray(cut.GetName(), cut.GetAll(), cut.GetPass(), elapsed if i == 0 else 0.)
+		self.tuple_filter.cutflow.Add(cutflow)
+		print(self.tuple_filter.cutflow)
+
+		entries = cutflow.GetKept()
+		info('GetTuple: {} entries written in {}'.format(entries, self.tuple_filter.output_path))
+		print(' --- Done ! Ran over {} entries, {} kept in {:.1f} s !'.format(chain.GetEntries(), entries, elapsed))
+
+		return AnnaTupleRef(self.tuple_filter.name, [self.tuple_filter.output_path], entries)
+
+# =============================================================================
+# The END
+# =============================================================================
@@ -4,24 +4,146 @@
 #  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
 #  @date   2017-12-21
 
+import hashlib
+import time
+from logging import error
+from .AnnaCutExpression import AnnaCut, AnnaCutAnd, CompileMask
+from .AnnaCutFlow import AnnaCutFlow
+from .AnnaDerivedColumns import AnnaDerivedColumns, EvaluateFormula, jpsi_mass
+from .AnnaGhostIndex import AnnaGhostIndex
+from .AnnaTupleRef import AnnaTupleRef
+from ROOT import TFile, TMath, TObject, TVector3
+from Ostap.progress_bar import ProgressBar
+
+# The columnar engine needs numpy, scipy and root_numpy
+try:
+	import numpy as np
+	from root_numpy import tree2array
+	from scipy.special import gammaincc
+	has_columnar = True
+except ImportError:
+	has_columnar = False
+
+
+# ______________________________________
+def VertexProb(chi2, ndof):
+	"""
+	Vectorized TMath.Prob, 0 for a negative chi2 or ndof
+	"""
+
+	chi2 = np.asarray(chi2, dtype=np.float64)
+	ndof = np.asarray(ndof, dtype=np.float64)
+	prob = np.zeros(chi2.shape)
+	ok = (ndof > 0) & (chi2 >= 0.)
+	prob[ok] = gammaincc(0.5 * ndof[ok], 0.5 * chi2[ok])
+	return prob
+
 
 class AnnaTupleFilterBase:
 
 	# ______________________________________
-	def __init__(self, mother_leaf='', daughter_leafs=['']):
+	def __init__(self, mother_leaf='', daughter_leafs=[''], name=''):
 		"""List of the minimal methods for AnnaFilter classes
 		For more detailed example, see AnnaTupleFilterJpsiPbPb
 		"""
 		self.daughter_leafs = daughter_leafs
 		self.mother_leaf = mother_leaf
+		self.name = name
 		self.filter_mask = dict()
+		self._compiled_masks = dict()
+
+		# Candidates entering / passing each cut over all the GetTuple calls
+		self.cutflow = AnnaCutFlow()
+
+		# If set, the tuple is written in this file while filling
+		# (see NewTuple), with baskets flushed every flush_bytes
+		self.output_path = None
+		self.flush_bytes = 30000000
+		self._output_file = None
+
+		# AnnaDerivedColumns added as a friend of the chain,
+		# if set the vertex quantities are read instead of computed
+		self.derived_columns = None
+
+		# Luminous region definition
+		self.lumi_region = {
+			'z': [-200., 200.],
+			'r': [0.35, 0.95],
+			'vertex_prob': 0.5 / 100.0}
+
+	# ______________________________________
+	def ActivateBranches(self, chain):
+		"""Switch off all the chain branches not in GetRequiredBranches()
+
+		Arguments:
+			chain {TChain}
+
+		Returns:
+			int -- estimated compressed bytes that will not be read
+		"""
+
+		required = self.GetRequiredBranches()
+		chain.LoadTree(0)
+
+		# Baskets sizes are known for the current tree only, scale to the chain
+		skipped_bytes = 0
+		for branch in chain.GetListOfBranches():
+			if branch.GetName() not in required:
+				skipped_bytes += branch.GetZipBytes()
+		tree_entries = chain.GetTree().GetEntries()
+		if tree_entries > 0:
+			skipped_bytes = int(skipped_bytes * float(chain.GetEntries()) / tree_entries)
+
+		chain.SetBranchStatus('*', 0)
+		for branch in required:
+			chain.SetBranchStatus(branch, 1)
+
+		print(
+			' --- {} of {} branches activated, ~{:.1f} MB of compressed baskets skipped'
+			.format(
+				len(required),
+				chain.GetListOfBranches().GetEntries(),
+				skipped_bytes / 1024. / 1024.))
+
+		return skipped_bytes
 
 	# ______________________________________
 	def CheckChainBranch(self, chain):
+		"""Make sure the chain has the requiered leafs
+		Arguments:
+			chain {TChain} --
 		"""
-		Where the user check the chain leafs
+
+		for branch in self.GetRequiredBranches():
+			try:
+				assert branch in chain.GetListOfBranches() or chain.GetBranch(branch)
+			except AssertionError:
+				error(" No info {} branch in chain".format(branch))
+				return False
+
+		return True
+
+	# ______________________________________
+	def CloseTuple(self, ntuple):
+		"""Finish a tuple created with NewTuple
+
+		Arguments:
+			ntuple {TNtuple}
+
+		Returns:
+			AnnaTupleRef -- or the TNtuple itself if it is in memory
 		"""
-		raise NotImplementedError  # abstract
+
+		if self._output_file is None:
+			return ntuple
+
+		ref = AnnaTupleRef(ntuple.GetName(), [self.output_path], ntuple.GetEntries())
+		self._output_file.cd()
+		ntuple.Write('', TObject.kOverwrite)
+		self._output_file.Close()
+		self._output_file = None
+
+		return ref
 
 	# ______________________________________
 	def CreateTuple(self):
@@ -31,6 +153,88 @@ class AnnaTupleFilterBase:
 		"""
 		raise NotImplementedError  # abstract
 
+	# ______________________________________
+	def GetColumnarBranches(self, remaining_cut=None):
+		"""
+		Return the list of branches read by the
+		columnar engine (see GetTupleColumnar)
+
+		Keyword Arguments:
+			remaining_cut {AnnaCutAnd} -- cuts evaluated on the
+				arrays, their branches are added (default: {None})
+
+		Returns:
+			list
+		"""
+
+		branches = self.GetVertexBranches()
+		columns = self.GetOutputColumns()
+		if remaining_cut is not None:
+			columns += remaining_cut.GetBranches()
+		for column in columns:
+			if column not in ['DV', 'dZ', 'tZ'] and column not in branches:
+				branches.append(column)
+
+		return branches
+
+	# ______________________________________
+	def GetCut(self, mask_key, leafs):
+		"""Compiled version of self.filter_mask[mask_key]
+
+		The mask is parsed once and compiled again only
+		if the mask string has been changed in the meantime.
+
+		Arguments:
+			mask_key {str} -- key in self.filter_mask
+			leafs {list} -- prefixes of the cut variables
+
+		Returns:
+			AnnaCutAnd -- None if the mask cannot be compiled
+		"""
+
+		key = (mask_key, self.filter_mask[mask_key], tuple(leafs))
+		if key not in self._compiled_masks:
+			self._compiled_masks[key] = CompileMask(self.filter_mask[mask_key], leafs)
+		return self._compiled_masks[key]
+
+	# ______________________________________
+	def GetFingerprint(self):
+		"""
+		Hash of everything that changes the content of the tuple:
+		filter class, leafs, masks, luminous region and columns
+
+		Returns:
+			str
+		"""
+
+		definition = repr((
+			self.__class__.__name__,
+			self.mother_leaf,
+			list(self.daughter_leafs),
+			sorted(self.filter_mask.items()),
+			sorted(self.lumi_region.items()),
+			self.GetOutputColumns()))
+		return hashlib.sha1(definition.encode('utf-8')).hexdigest()
+
+	# ______________________________________
+	def GetGeneralCut(self):
+		"""
+		Return all the masks of GetMaskLeafs() compiled
+		in a single AnnaCutAnd
+
+		Returns:
+			AnnaCutAnd -- None in case of error
+		"""
+
+		if self.filter_mask is None:
+			error(" no filter mask !")
+			return None
+
+		cuts = [self.GetCut(mask_key, leafs) for mask_key, leafs in self.GetMaskLeafs()]
+		if None in cuts:
+			return None
+		return AnnaCutAnd(cuts)
+
 	# ______________________________________
 	def GetGeneralMask(self):
 		"""
@@ -39,11 +243,58 @@ class AnnaTupleFilterBase:
 		Chain events
 
 		Returns:
-			[str] -- [description]
+			[str] -- TTreeFormula string, None in case of error
+		"""
+
+		general_cut = self.GetGeneralCut()
+		if general_cut is None:
+			return None
+		return general_cut.ToFormula()
+
+	# ______________________________________
+	def GetMaskLeafs(self):
+		"""
+		Return the (mask key, leafs) pairs entering the
+		general mask. The cuts of filter_mask[mask key]
+		are applied to each leaf of leafs
+
+		Returns:
+			list
+		"""
+		raise NotImplementedError  # abstract
+
+	# ______________________________________
+	def GetOutputColumns(self):
+		"""
+		Return the list of columns filling the tuple, in the
+		CreateTuple() order. A column is either a branch name
+		or one of the derived columns of GetDerivedColumns()
+
+		Returns:
+			list
 		"""
 		raise NotImplementedError  # abstract
 
 		# ______________________________________
+	def GetRequiredBranches(self):
+		"""
+		Return all the chain branches read by the filter:
+		the columnar branches and the mask variables
+
+		Returns:
+			list
+		"""
+
+		branches = self.GetColumnarBranches()
+		general_cut = self.GetGeneralCut()
+		if general_cut is not None:
+			for branch in general_cut.GetBranches():
+				if branch not in ['DV', 'dZ', 'tZ'] and branch not in branches:
+					branches.append(branch)
+
+		return branches
+
+	# ______________________________________
 	def GetTuple(self, chain):
 		"""The main method of the class
 
@@ -59,6 +310,404 @@ class AnnaTupleFilterBase:
 		"""
 		raise NotImplementedError  # abstract
 
+	# ______________________________________
+	def GetTupleColumnar(self, chain, chunk_size=100000, start=0, stop=None):
+		"""Columnar version of GetTuple
+
+		The branches of GetColumnarBranches() are read in chunks
+		of chunk_size entries into numpy arrays. The cuts of
+		GetGeneralCut() on chain branches are evaluated by ROOT while
+		reading, the luminous region cuts, the derived columns and
+		the remaining cuts are computed on whole arrays. Only the
+		ghost check runs on the candidates left, since it depends
+		on the previous ones.
+
+		Arguments:
+			chain {TChain}
+
+		Keyword Arguments:
+			chunk_size {int} -- entries per chunk (default: {100000})
+			start {int} -- first entry (default: {0})
+			stop {int} -- last entry excluded, None for
+				the end of the chain (default: {None})
+
+		Returns:
+			TNtuple -- or AnnaTupleRef, see NewTuple
+		"""
+
+		if has_columnar is False:
+			error(' columnar mode requires numpy, scipy and root_numpy')
+			return None
+
+		okBranch = self.CheckChainBranch(chain)
+		if okBranch is False:
+			error(' attributes are missing')
+			return None
+
+		general_cut = self.GetGeneralCut()
+		if general_cut is None:
+			error(':GetTupleColumnar: Cannot get the mask')
+			return None
+
+		# ROOT evaluates the cuts on chain branches, the others
+		# (e.g. on DV, dZ, tZ) are evaluated on the arrays
+		selection, remaining_cut = general_cut.Split(
+			[branch.GetName() for branch in chain.GetListOfBranches()])
+		selection = selection.ToFormula()
+		branches = self.GetColumnarBranches(remaining_cut)
+		print(" ----> Columnar mode, selection applied while reading : \n {}".format(selection))
+		print(" ----> and on the arrays : \n {}".format(remaining_cut.ToFormula()))
+
+		ntuple = self.StartColumnar(remaining_cut)
+		if ntuple is None:
+			return None
+
+		if stop is None or stop > chain.GetEntries():
+			stop = chain.GetEntries()
+		tot_entries = stop - start
+
+		print(' --- Start running over events ...')
+		with ProgressBar(max_value=tot_entries, silent=False) as bar:
+			for first in range(start, stop, chunk_size):
+				last = min(first + chunk_size, stop)
+				read_start = time.time()
+				arrays = self.ReadChunk(chain, branches, selection, first, last)
+				self.cutflow.FillArray('selection', last - first, len(arrays), time.time() - read_start)
+				self.ProcessChunk(arrays, ntuple)
+				bar.update_amount(last - start)
+
+		print(
+			' --- Done ! Ran over {} entries, {} passed the selection and {} were kept !'
+			.format(tot_entries, self._entry_read, ntuple.GetEntries()))
+		print(self.cutflow)
+		return self.CloseTuple(ntuple)
+
+	# ______________________________________
+	def NewTuple(self):
+		"""Create the tuple to be filled
+
+		If self.output_path is set, the tuple is created in
+		that file, so that accepted rows are flushed on disk
+		while filling instead of staying in memory.
+		Must be finished with CloseTuple.
+
+		Returns:
+			TNtuple -- None in case of error
+		"""
+
+		if self.output_path is None:
+			return self.CreateTuple()
+
+		self._output_file = TFile(self.output_path, 'recreate')
+		if self._output_file.IsZombie():
+			error("Cannot create {}".format(self.output_path))
+			self._output_file = None
+			return None
+
+		self._output_file.cd()
+		ntuple = self.CreateTuple()
+		ntuple.SetAutoFlush(-self.flush_bytes)
+		ntuple.SetAutoSave(-10 * self.flush_bytes)
+
+		return ntuple
+
+	# ______________________________________
+	def StartColumnar(self, remaining_cut):
+		"""Reset the state of a columnar run and create its tuple
+
+		Arguments:
+			remaining_cut {AnnaCutAnd} -- cuts ProcessChunk evaluates
+				on the arrays, the others are applied while reading
+
+		Returns:
+			TNtuple -- see NewTuple
+		"""
+
+		self._remaining_cut = remaining_cut
+		self._entry_number = 0
+		self._entry_read = 0
+		self._ghost_index = AnnaGhostIndex()
+
+		return self.NewTuple()
+
+	# ______________________________________
+	def ReadChunk(self, chain, branches, selection, start, stop):
+		"""Read [start, stop[ entries of the chain
+
+		Returns:
+			numpy.recarray
+		"""
+
+		arrays = tree2array(
+			chain,
+			branches=branches,
+			selection=selection if selection != '' else None,
+			start=start,
+			stop=stop)
+		return arrays.view(np.recarray)
+
+	# ______________________________________
+	def ProcessChunk(self, arrays, ntuple):
+		"""Apply the cuts on a chunk and fill the tuple
+
+		Arguments:
+			arrays {numpy.recarray} -- see ReadChunk
+			ntuple {TNtuple}
+		"""
+
+		self._entry_read += len(arrays)
+
+		# Derived and luminous region columns, then the branches of the cuts
+		columns = dict(self.GetDerivedColumns(arrays))
+		for name, formula in self.GetLuminosityRegionDefinitions():
+			columns[name] = EvaluateFormula(formula, arrays, {'VertexProb': VertexProb})
+		lumi_cuts = self.GetLuminosityRegionCuts()
+		for cut in [cut for name, cut in lumi_cuts] + [self._remaining_cut]:
+			for branch in cut.GetBranches():
+				if branch not in columns:
+					columns[branch] = arrays[branch]
+
+		mask = np.ones(len(arrays), dtype=bool)
+		for name, cut in lumi_cuts:
+			start = time.time()
+			entered = np.count_nonzero(mask)
+			mask &= cut.Evaluate(columns)
+			self.cutflow.FillArray(name, entered, np.count_nonzero(mask), time.time() - start)
+
+		for cut in self._remaining_cut.cuts:
+			start = time.time()
+			entered = np.count_nonzero(mask)
+			mask &= cut.Evaluate(columns)
+			self.cutflow.FillArray(str(cut), entered, np.count_nonzero(mask), time.time() - start)
+		selected = arrays[mask]
+
+		# Ghosts depend on the previous candidates, keep the entry order
+		start = time.time()
+		keep = np.ones(len(selected), dtype=bool)
+		for i, record in enumerate(selected):
+			self._entry_number += 1
+			keep[i] = not self.IsMuonsGhosts(self._entry_number, record, self._ghost_index)
+		self.cutflow.FillArray('ghost', len(selected), np.count_nonzero(keep), time.time() - start)
+		selected = selected[keep]
+
+		values = np.empty((len(selected), len(self.GetOutputColumns())), dtype=np.float32)
+		for i, column in enumerate(self.GetOutputColumns()):
+			values[:, i] = columns[column][mask][keep] if column in columns else selected[column]
+
+		for row in values:
+			ntuple.Fill(row)
+
+	# ______________________________________
+	def GetLuminosityRegionCuts(self):
+		"""
+		Cuts of IsInLuminosityRegion, on the branches, the derived
+		columns and the columns of GetLuminosityRegionDefinitions,
+		shared by the columnar and the RDataFrame engines
+
+		Returns:
+			list -- (cut name, AnnaCutAnd) pairs in the order of IsInLuminosityRegion
+		"""
+
+		def window(columns, limits):
+			return AnnaCutAnd([
+				AnnaCut(column, op, limit)
+				for column in columns
+				for op, limit in zip(['>=', '<='], limits)])
+
+		m = self.mother_leaf
+		return [
+			('lumi_z', window([m + '_OWNPV_Z', m + '_ENDVERTEX_Z'], self.lumi_region['z'])),
+			('vertex_prob', AnnaCutAnd([AnnaCut('ENDVERTEX_PROB', '>=', self.lumi_region['vertex_prob'])])),
+			('lumi_r', window(['OWNPV_R', 'ENDVERTEX_R'], self.lumi_region['r']))]
+
+	# ______________________________________
+	def GetLuminosityRegionDefinitions(self):
+		"""
+		Columns of the luminous region cuts which are neither branches nor
+		derived columns, as the definitions of AnnaDerivedColumns:
+		VertexProb is TMath.Prob (the C++ one is declared by AnnaRDataFrameFilter)
+
+		Returns:
+			list -- (column, expression) pairs
+		"""
+
+		return [('ENDVERTEX_PROB', 'VertexProb({0}_ENDVERTEX_CHI2, {0}_ENDVERTEX_NDOF)'.format(self.mother_leaf))]
+
+	# ______________________________________
+	def IsInLuminosityRegion(self, entry_number, entry):
+		"""
+		require mother inside luminous region (see self.lumi_region),
+		each cut is recorded in self.cutflow
+
+		Returns:
+			bool, TVector3, TVector3 -- ok, OWNPV and ENDVERTEX positions
+				(None if the derived columns are read, see GetDerivedValues)
+		"""
+
+		zmin, zmax = self.lumi_region['z']
+		rmin, rmax = self.lumi_region['r']
+
+		start = time.time()
+		OWNPV_Z = getattr(entry, self.mother_leaf + '_OWNPV_Z')
+		ENDVERTEX_Z = getattr(entry, self.mother_leaf + '_ENDVERTEX_Z')
+		ok = zmin <= OWNPV_Z <= zmax and zmin <= ENDVERTEX_Z <= zmax
+		if not self.cutflow.Fill('lumi_z', ok, start):
+			return False, None, None
+
+		# goodness of the dimuon vertex
+		start = time.time()
+		prob = TMath.Prob(
+			getattr(entry, self.mother_leaf + '_ENDVERTEX_CHI2'),
+			int(getattr(entry, self.mother_leaf + '_ENDVERTEX_NDOF')))
+		if not self.cutflow.Fill('vertex_prob', prob >= self.lumi_region['vertex_prob'], start):
+			return False, None, None
+
+		start = time.time()
+		if self.derived_columns is not None:
+			OWNPV_R = getattr(entry, self.mother_leaf + '_OWNPV_R')
+			ENDVERTEX_R = getattr(entry, self.mother_leaf + '_ENDVERTEX_R')
+			ok = rmin <= OWNPV_R <= rmax and rmin <= ENDVERTEX_R <= rmax
+			if not self.cutflow.Fill('lumi_r', ok, start):
+				return False, None, None
+			return True, None, None
+
+		v_OWNPV = TVector3(
+			getattr(entry, self.mother_leaf + '_OWNPV_X'),
+			getattr(entry, self.mother_leaf + '_OWNPV_Y'),
+			OWNPV_Z)
+		v_ENDVERTEX = TVector3(
+			getattr(entry, self.mother_leaf + '_ENDVERTEX_X'),
+			getattr(entry, self.mother_leaf + '_ENDVERTEX_Y'),
+			ENDVERTEX_Z)
+		ok = rmin <= v_OWNPV.Perp() <= rmax and rmin <= v_ENDVERTEX.Perp() <= rmax
+		if not self.cutflow.Fill('lumi_r', ok, start):
+			return False, None, None
+
+		return True, v_OWNPV, v_ENDVERTEX
+
+	# ______________________________________
+	def PassCuts(self, cut, entry):
+		"""Check the cuts of a compiled mask on an entry,
+		one by one so that each is recorded in self.cutflow
+
+		Arguments:
+			cut {AnnaCutAnd} -- see GetCut
+			entry -- chain entry or numpy record
+
+		Returns:
+			bool
+		"""
+
+		for single_cut in cut.cuts:
+			start = time.time()
+			try:
+				ok = single_cut.Passes(entry)
+			except AttributeError:
+				ok = False
+			if not self.cutflow.Fill(str(single_cut), ok, start):
+				return False
+		return True
+
+	# ______________________________________
+	def GetDerivedColumns(self, arrays):
+		"""
+		Vertex and lifetime quantities, read from the
+		derived columns friend if any, computed otherwise
+
+		Returns:
+			dict -- arrays by column name, without the mother prefix
+				(DV, dZ, tZ, OWNPV_R and ENDVERTEX_R)
+		"""
+
+		derived_columns = self.derived_columns
+		if derived_columns is None:
+			derived_columns = AnnaDerivedColumns(self.mother_leaf)
+			arrays = derived_columns.Compute(arrays)
+
+		return dict([
+			(name, arrays[branch])
+			for name, branch in zip(derived_columns.GetColumnNames(), derived_columns.GetBranchNames())])
+
+	# ______________________________________
+	def GetDerivedValues(self, entry, v_OWNPV, v_ENDVERTEX):
+		"""
+		Row version of GetDerivedColumns
+
+		Arguments:
+			entry -- chain entry
+			v_OWNPV {TVector3} -- see IsInLuminosityRegion
+			v_ENDVERTEX {TVector3}
+
+		Returns:
+			float, float, float -- DV, dZ, tZ
+		"""
+
+		m = self.mother_leaf
+		if self.derived_columns is not None:
+			return getattr(entry, m + '_DV'), getattr(entry, m + '_dZ'), getattr(entry, m + '_tZ')
+
+		DV = (v_OWNPV - v_ENDVERTEX).Mag()
+		dZ = (getattr(entry, m + '_ENDVERTEX_Z') - getattr(entry, m + '_OWNPV_Z')) * 1e-3
+		tZ = dZ * jpsi_mass / (getattr(entry, m + '_PZ') * TMath.C())
+
+		return DV, dZ, tZ
+
+	# ______________________________________
+	def GetVertexBranches(self):
+		"""
+		Branches needed by the luminous region cuts,
+		the derived columns and the ghost check
+		"""
+
+		if self.derived_columns is not None:
+			branches = [
+				self.mother_leaf + '_OWNPV_Z',
+				self.mother_leaf + '_ENDVERTEX_Z']
+			branches += self.derived_columns.GetBranchNames()
+		else:
+			branches = [
+				self.mother_leaf + '_' + vertex + '_' + axis
+				for vertex in ['OWNPV', 'ENDVERTEX']
+				for axis in ['X', 'Y', 'Z']]
+		branches += [
+			self.mother_leaf + '_ENDVERTEX_CHI2',
+			self.mother_leaf + '_ENDVERTEX_NDOF',
+			self.mother_leaf + '_PZ']
+		branches += [
+			muon + '_P' + axis
+			for muon in self.daughter_leafs
+			for axis in ['X', 'Y', 'Z']]
+		branches += ['runNumber', 'eventNumber']
+
+		return branches
+
+	# ______________________________________
+	def IsMuonsGhosts(self, entry_number, entry, ghost_index):
+		"""
+		Check if the muons of the candidate are collinear with
+		the ones of a previous candidate of the same event
+
+		Arguments:
+			entry_number {int}
+			entry -- chain entry or numpy record
+			ghost_index {AnnaGhostIndex} -- candidates already seen
+
+		Returns:
+			Bool
+		"""
+
+		momenta = [
+			(
+				getattr(entry, muon + '_PX'),
+				getattr(entry, muon + '_PY'),
+				getattr(entry, muon + '_PZ'))
+			for muon in self.daughter_leafs[:2]]
+
+		return ghost_index.IsGhost(
+			(entry.runNumber, entry.eventNumber),
+			momenta[0],
+			momenta[1])
+
 
 # =============================================================================
 # The END
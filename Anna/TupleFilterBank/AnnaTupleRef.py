@@ -0,0 +1,116 @@
+# =============================================================================
+#  @class AnnaTupleRef
+#  Reference to a filtered tuple written on disk
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-04-03
+
+import os
+import ROOT
+from logging import error
+from .AnnaTupleStats import AnnaTupleStats
+
+
+# ______________________________________
+class AnnaTupleRef:
+	"""Reference to a filtered tuple written on disk
+
+	This is what is stored in the result file instead of
+	the tuple itself. The tuple can be spread over several
+	files, GetTuple() then returns a TChain over all of them.
+	GetStats() gives the ranges and quantiles of its columns
+	without reading it (see AnnaTupleStats).
+	"""
+
+	# ______________________________________
+	def __init__(self, name, file_paths=[], entries=0):
+		"""cstr
+
+		Arguments:
+			name {str} -- name of the tuple in the files
+
+		Keyword Arguments:
+			file_paths {list} -- ROOT files containing the tuple (default: {[]})
+			entries {int} -- total number of entries (default: {0})
+		"""
+
+		self.name = name
+		self.file_paths = [os.path.abspath(path) for path in file_paths]
+		self.entries = entries
+
+		# Merged index of the files, with their size and mtime
+		self.stats = None
+		self.stats_files = None
+
+	# ______________________________________
+	def __str__(self):
+		return "AnnaTupleRef {} ({} entries in {} files)".format(
+			self.name, self.entries, len(self.file_paths))
+
+	# ______________________________________
+	def AddFile(self, file_path, entries):
+		self.file_paths.append(os.path.abspath(file_path))
+		self.entries += entries
+
+	# ______________________________________
+	def GetEntries(self):
+		return self.entries
+
+	# ______________________________________
+	def GetName(self):
+		return self.name
+
+	# ______________________________________
+	def GetStats(self):
+		"""Statistics index of the tuple
+
+		Each file has its own index, stored next to it and only built
+		when the file is new or changed. The merged index is kept
+		in the reference, and so in the result file.
+
+		Returns:
+			AnnaTupleStats -- None in case of error
+		"""
+
+		stats = AnnaTupleStats(self.name)
+		files = list()
+		for path in self.file_paths:
+			if os.path.isfile(path) is False:
+				error("Cannot find {} for tuple {}".format(path, self.name))
+				return None
+			files.append([path, stats.GetFileInfo(path)])
+
+		# References saved before the index have no stats attribute
+		if getattr(self, 'stats', None) is not None and self.stats_files == files:
+			return self.stats
+
+		for path in self.file_paths:
+			file_stats = AnnaTupleStats(self.name)
+			if file_stats.Load(path, self.name) is False:
+				if file_stats.Build(path, self.name) is False:
+					return None
+			stats.Add(file_stats)
+
+		self.stats = stats
+		self.stats_files = files
+		return stats
+
+	# ______________________________________
+	def GetTuple(self):
+		"""Open the tuple
+
+		Returns:
+			TChain -- None if a file is missing
+		"""
+
+		chain = ROOT.TChain(self.name)
+		for path in self.file_paths:
+			if os.path.isfile(path) is False:
+				error("Cannot find {} for tuple {}".format(path, self.name))
+				return None
+			chain.Add(path)
+
+		return chain
+
+# =============================================================================
+# The END
+# =============================================================================
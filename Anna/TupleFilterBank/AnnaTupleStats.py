@@ -0,0 +1,403 @@
+# =============================================================================
+#  @class AnnaTupleStats
+#  Statistics index of a filtered tuple
+#  @author Benjamin AUDURIER benjamin.audurier@ca.infn.it
+#  @date   2018-05-02
+
+import bisect
+import json
+import os
+from logging import error, info, warning
+import ROOT
+
+# The index is built with numpy and root_numpy
+try:
+	import numpy as np
+	from root_numpy import tree2array
+	has_numpy = True
+except ImportError:
+	has_numpy = False
+
+
+# ______________________________________
+class AnnaQuantileSketch:
+	"""Mergeable summary of a distribution
+
+	The values are kept as at most size centroids (mean, weight)
+	of about equal weight. Two sketches are added by merging their
+	centroids and compressing them again, so that quantiles are known
+	to about 1/size in rank whatever the number of entries, and the
+	sketches of chunks or files can be merged in any order.
+	"""
+
+	# ______________________________________
+	def __init__(self, size=200, centroids=None):
+		"""cstr
+
+		Keyword Arguments:
+			size {int} -- maximum number of centroids (default: {200})
+			centroids {list} -- [mean, weight] pairs, as returned
+				by ToList (default: {None})
+		"""
+
+		self.size = size
+		self.centroids = list()
+		if centroids is not None:
+			self.centroids = [[float(mean), float(weight)] for mean, weight in centroids]
+
+	# ______________________________________
+	def Add(self, other):
+		self.Compress(self.centroids + other.centroids)
+
+	# ______________________________________
+	def Compress(self, centroids):
+		"""
+		Merge neighbouring centroids down to self.size groups
+		of equal cumulative weight
+		"""
+
+		centroids = sorted(centroids, key=lambda centroid: centroid[0])
+		total = sum([weight for mean, weight in centroids])
+		merged = list()
+		cumulative = 0.
+		for mean, weight in centroids:
+			group = int(cumulative / total * self.size) if total > 0 else 0
+			if len(merged) > 0 and merged[-1][2] == group:
+				last = merged[-1]
+				last[0] = (last[0] * last[1] + mean * weight) / (last[1] + weight)
+				last[1] += weight
+			else:
+				merged.append([mean, weight, group])
+			cumulative += weight
+
+		self.centroids = [[mean, weight] for mean, weight, group in merged]
+
+	# ______________________________________
+	def Fill(self, values):
+		"""
+		Add a numpy array of finite values
+		"""
+
+		if len(values) == 0:
+			return
+		values = np.sort(values)
+		groups = np.array_split(values, min(self.size, len(values)))
+		self.Compress(
+			self.centroids + [[float(group.mean()), float(len(group))] for group in groups])
+
+	# ______________________________________
+	def GetPoints(self, vmin, vmax):
+		"""
+		(rank, value) points of the cumulative distribution,
+		rank in [0, 1], from vmin to vmax
+		"""
+
+		total = sum([weight for mean, weight in self.centroids])
+		points = [(0., vmin)]
+		cumulative = 0.
+		for mean, weight in self.centroids:
+			points.append(((cumulative + weight / 2.) / total, mean))
+			cumulative += weight
+		points.append((1., vmax))
+		return points
+
+	# ______________________________________
+	def ToList(self):
+		return [list(centroid) for centroid in self.centroids]
+
+
+# ______________________________________
+class AnnaTupleStats:
+	"""Statistics of the columns of a filtered tuple
+
+	For each column: minimum, maximum, number of finite entries,
+	sum and a quantile sketch (see AnnaQuantileSketch).
+
+	The index of a tuple file is built in one read and stored next to
+	it, in <file without .root>.stats.json, together with the size and
+	mtime of the file: it is only rebuilt when the file changes.
+	Indexes of several files are merged with Add (see AnnaTupleRef.GetStats).
+
+		stats = ref.GetStats()
+		stats.GetMinimum('JPSI_M'), stats.GetQuantile('JPSI_PT', 0.5)
+	"""
+
+	# Bump when the content of the index changes
+	version = 1
+
+	# ______________________________________
+	def __init__(self, name='TupleStats', content=None):
+		"""cstr
+
+		Keyword Arguments:
+			name {str} -- (default: {'TupleStats'})
+			content {dict} -- as returned by ToDict (default: {None})
+		"""
+
+		self.name = name
+		self.columns = dict()
+
+		if content is not None:
+			for column, record in content.items():
+				self.columns[column] = {
+					'min': record['min'],
+					'max': record['max'],
+					'entries': record['entries'],
+					'sum': record['sum'],
+					'sketch': AnnaQuantileSketch(centroids=record['sketch'])}
+
+	# ______________________________________
+	def __str__(self):
+		lines = ['{:<30} {:>12} {:>14} {:>14} {:>14}'.format(
+			self.name, 'entries', 'min', 'median', 'max')]
+		for column in sorted(self.columns):
+			lines.append('{:<30} {:>12} {:>14.6g} {:>14.6g} {:>14.6g}'.format(
+				column,
+				self.GetEntries(column),
+				self.GetMinimum(column),
+				self.GetQuantile(column, 0.5),
+				self.GetMaximum(column)))
+		return '\n'.join(lines)
+
+	# ______________________________________
+	def Add(self, other):
+		"""
+		Merge the index of another tuple file
+		"""
+
+		for column, record in other.columns.items():
+			if column not in self.columns:
+				self.columns[column] = {
+					'min': record['min'],
+					'max': record['max'],
+					'entries': 0,
+					'sum': 0.,
+					'sketch': AnnaQuantileSketch()}
+			mine = self.columns[column]
+			if record['entries'] > 0:
+				mine['min'] = min(mine['min'], record['min']) if mine['entries'] > 0 else record['min']
+				mine['max'] = max(mine['max'], record['max']) if mine['entries'] > 0 else record['max']
+			mine['entries'] += record['entries']
+			mine['sum'] += record['sum']
+			mine['sketch'].Add(record['sketch'])
+
+	# ______________________________________
+	def Build(self, file_path, tree_name, chunk_size=1000000):
+		"""Read a tuple file once and store its index next to it
+
+		Arguments:
+			file_path {str}
+			tree_name {str}
+
+		Keyword Arguments:
+			chunk_size {int} -- entries read at once (default: {1000000})
+
+		Returns:
+			bool -- False in case of error
+		"""
+
+		if has_numpy is False:
+			error(' the statistics index requires numpy and root_numpy')
+			return False
+
+		f = ROOT.TFile.Open(file_path)
+		if not f or f.IsZombie():
+			error('Cannot open {}'.format(file_path))
+			return False
+		tree = f.Get(tree_name)
+		if not tree:
+			error('Cannot find {} in {}'.format(tree_name, file_path))
+			f.Close()
+			return False
+
+		columns = [leaf.GetName() for leaf in tree.GetListOfLeaves() if leaf.GetLen() == 1]
+		entries = tree.GetEntries()
+		for first in range(0, entries, chunk_size):
+			arrays = tree2array(
+				tree,
+				branches=columns,
+				start=first,
+				stop=min(first + chunk_size, entries))
+			self.Fill(dict([(column, arrays[column]) for column in columns]))
+		for column in columns:
+			if column not in self.columns:
+				self.Fill({column: np.zeros(0)})
+		f.Close()
+
+		self.Save(file_path, tree_name)
+		info('Build: {} entries of {} indexed in {}'.format(entries, file_path, self.GetPath(file_path)))
+		return True
+
+	# ______________________________________
+	def Fill(self, arrays):
+		"""
+		Add numpy arrays, by column name
+		"""
+
+		for column, values in arrays.items():
+			values = np.asarray(values, dtype=np.float64)
+			values = values[np.isfinite(values)]
+			self.Add(AnnaTupleStats(content={column: {
+				'min': float(values.min()) if len(values) > 0 else 0.,
+				'max': float(values.max()) if len(values) > 0 else 0.,
+				'entries': len(values),
+				'sum': float(values.sum()),
+				'sketch': list()}}))
+			self.columns[column]['sketch'].Fill(values)
+
+	# ______________________________________
+	def GetColumns(self):
+		return sorted(self.columns)
+
+	# ______________________________________
+	def GetEntries(self, column):
+		return self.columns[column]['entries']
+
+	# ______________________________________
+	def GetFileInfo(self, file_path):
+		stat = os.stat(file_path)
+		return {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+	# ______________________________________
+	def GetFraction(self, column, vmin, vmax):
+		"""Estimated fraction of the entries in [vmin, vmax]
+
+		Arguments:
+			column {str}
+			vmin {float}
+			vmax {float}
+
+		Returns:
+			float
+		"""
+
+		return max(self.GetRank(column, vmax) - self.GetRank(column, vmin), 0.)
+
+	# ______________________________________
+	def GetMaximum(self, column):
+		return self.columns[column]['max']
+
+	# ______________________________________
+	def GetMean(self, column):
+		entries = self.GetEntries(column)
+		return self.columns[column]['sum'] / entries if entries > 0 else 0.
+
+	# ______________________________________
+	def GetMinimum(self, column):
+		return self.columns[column]['min']
+
+	# ______________________________________
+	def GetName(self):
+		return self.name
+
+	# ______________________________________
+	def GetPath(self, file_path):
+		return os.path.splitext(file_path)[0] + '.stats.json'
+
+	# ______________________________________
+	def GetQuantile(self, column, q):
+		"""Estimated quantile of a column
+
+		Arguments:
+			column {str}
+			q {float} -- in [0, 1]
+
+		Returns:
+			float
+		"""
+
+		record = self.columns[column]
+		if record['entries'] == 0:
+			return 0.
+		points = record['sketch'].GetPoints(record['min'], record['max'])
+		ranks = [rank for rank, value in points]
+		i = min(max(bisect.bisect_left(ranks, q), 1), len(points) - 1)
+		(r0, v0), (r1, v1) = points[i - 1], points[i]
+		if r1 <= r0:
+			return v1
+		return v0 + (v1 - v0) * (q - r0) / (r1 - r0)
+
+	# ______________________________________
+	def GetRank(self, column, value):
+		"""
+		Estimated fraction of the entries below value
+		"""
+
+		record = self.columns[column]
+		if record['entries'] == 0 or value <= record['min']:
+			return 0.
+		if value >= record['max']:
+			return 1.
+		points = record['sketch'].GetPoints(record['min'], record['max'])
+		values = [v for rank, v in points]
+		i = min(max(bisect.bisect_left(values, value), 1), len(points) - 1)
+		(r0, v0), (r1, v1) = points[i - 1], points[i]
+		if v1 <= v0:
+			return r1
+		return r0 + (r1 - r0) * (value - v0) / (v1 - v0)
+
+	# ______________________________________
+	def HasColumn(self, column):
+		return column in self.columns
+
+	# ______________________________________
+	def Load(self, file_path, tree_name):
+		"""Read the index stored next to a tuple file
+
+		Returns:
+			bool -- False if there is none, or if it is outdated
+		"""
+
+		path = self.GetPath(file_path)
+		if os.path.isfile(path) is False or os.path.isfile(file_path) is False:
+			return False
+
+		try:
+			with open(path) as f:
+				content = json.load(f)
+		except ValueError:
+			warning('Cannot read {}, rebuild it'.format(path))
+			return False
+
+		if content.get('version') != self.version or \
+			content.get('tree') != tree_name or \
+			content.get('file') != self.GetFileInfo(file_path):
+			return False
+
+		self.columns = AnnaTupleStats(content=content['columns']).columns
+		return True
+
+	# ______________________________________
+	def Save(self, file_path, tree_name):
+		"""
+		Write the index next to the tuple file, atomically
+		"""
+
+		path = self.GetPath(file_path)
+		tmp_path = path + '.tmp'
+		with open(tmp_path, 'w') as f:
+			json.dump(
+				{'version': self.version,
+				 'tree': tree_name,
+				 'file': self.GetFileInfo(file_path),
+				 'columns': self.ToDict()},
+				f, sort_keys=True)
+		os.rename(tmp_path, path)
+
+	# ______________________________________
+	def ToDict(self):
+		"""
+		Plain content, e.g. for json
+		"""
+		return dict([
+			(column, {
+				'min': record['min'],
+				'max': record['max'],
+				'entries': record['entries'],
+				'sum': record['sum'],
+				'sketch': record['sketch'].ToList()})
+			for column, record in self.columns.items()])
+
+# =============================================================================
+# The END
+# =============================================================================
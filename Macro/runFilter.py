@@ -1,8 +1,20 @@
+import argparse
+import os
+import ROOT
 from Ostap.Data import Data
 
 # =============================================================================
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description='Run the jpsi and D0 PbPb 2015 selector')
+    parser.add_argument(
+        '-j', '--workers', type=int, default=1,
+        help='number of PROOF-Lite workers, 1 to run in the current process')
+    parser.add_argument(
+        '-o', '--output', default='Selector_jpsi_and_D0_PbPb_2015.root',
+        help='file where the ntuple and the control histograms are written')
+    args = parser.parse_args()
+
     # patterns = '/eos/lhcb/user/b/baudurie/ntuple_jpsi_and_D0_PbPb_2015/jpsi_and_D0_PbPb_2015/*/*/output/PbPb_D0_Jpsi.root'
     # patterns = '/eos/lhcb/user/b/baudurie/ntuple_jpsi_and_D0_PbPb_2015/jpsi_and_D0_PbPb_2015/229/*/output/PbPb_D0_Jpsi.root'
     #
@@ -10,6 +22,12 @@ if __name__ == '__main__':
     # patterns = '/st100-gr1/audurier/ntuple_jpsi_and_D0_PbPb_2015/jpsi_and_D0_PbPb_2015/229/*/output/PbPb_D0_Jpsi.root'
 
     chain = Data('Jpsi/DecayTree', patterns).chain
+
+    # Each PROOF-Lite worker writes its own file, merged in args.output
+    if args.workers > 1:
+        ROOT.TProof.Open('workers={}'.format(args.workers))
+        chain.SetProof()
+
     # chain.Process("/afs/cern.ch/user/b/baudurie/public/LHCb-tools/Filter_jpsi_PbPb_2015_lxplus.C+")
     # chain.Process("/afs/cern.ch/user/b/baudurie/public/LHCb-tools/Selectors/Selector_jpsi_and_D0_PbPb_2015.C+")
-    chain.Process("/home/audurier/LHCb-tools/Selectors/Selector_jpsi_and_D0_PbPb_2015.C+")
+    chain.Process("/home/audurier/LHCb-tools/Selectors/Selector_jpsi_and_D0_PbPb_2015.C+", 'out={}'.format(os.path.abspath(args.output)))
@@ -0,0 +1,113 @@
+//////////////////////////////////////////////////////////
+// AnnaGhostIndex
+//
+// Ghost/clone muon detector, C++ version of
+// Anna/TupleFilterBank/AnnaGhostIndex.py
+//
+// A candidate is a ghost if both its muons are almost collinear
+// (cos > cosMin) with the muons of a previous candidate of the
+// same event. The first muon unit vectors are binned in a grid of
+// cells of the size of the chord at the threshold angle, so a
+// lookup only checks the 27 neighbouring cells. The index is
+// reset when the (run, event) number changes.
+//////////////////////////////////////////////////////////
+
+#ifndef AnnaGhostIndex_h
+#define AnnaGhostIndex_h
+
+#include <cmath>
+#include <unordered_map>
+#include <vector>
+
+class AnnaGhostIndex {
+public :
+
+   AnnaGhostIndex(double cosMin = 0.9999)
+      : fCosMin(cosMin), fCellSize(std::sqrt(2. * (1. - cosMin))),
+        fRun(0), fEvent(0), fEmpty(true) {}
+
+   // ______________________________________________________
+   void Clear()
+   {
+      fCells.clear();
+      fEmpty = true;
+   }
+
+   // ______________________________________________________
+   bool IsGhost(unsigned int run, unsigned long long event,
+      double px1, double py1, double pz1,
+      double px2, double py2, double pz2)
+   {
+      // Check a candidate and add it to the index if it is not a ghost
+
+      if ( fEmpty || run != fRun || event != fEvent ) {
+         fCells.clear();
+         fRun = run;
+         fEvent = event;
+         fEmpty = false;
+      }
+
+      Candidate cand;
+      SetUnitVector(cand.u1, px1, py1, pz1);
+      SetUnitVector(cand.u2, px2, py2, pz2);
+
+      long long i = Bin(cand.u1[0]);
+      long long j = Bin(cand.u1[1]);
+      long long k = Bin(cand.u1[2]);
+
+      for ( int di = -1; di <= 1; di++ ) {
+         for ( int dj = -1; dj <= 1; dj++ ) {
+            for ( int dk = -1; dk <= 1; dk++ ) {
+               auto cell = fCells.find(Key(i + di, j + dj, k + dk));
+               if ( cell == fCells.end() ) continue;
+
+               for ( const Candidate &prev : cell->second ) {
+                  if ( Dot(cand.u1, prev.u1) > fCosMin && Dot(cand.u2, prev.u2) > fCosMin ) return true;
+               }
+            }
+         }
+      }
+
+      fCells[Key(i, j, k)].push_back(cand);
+      return false;
+   }
+
+private :
+
+   struct Candidate {
+      double u1[3];
+      double u2[3];
+   };
+
+   // ______________________________________________________
+   long long Bin(double x) const { return static_cast<long long>(std::floor(x / fCellSize)); }
+
+   // ______________________________________________________
+   static double Dot(const double *u, const double *v) { return u[0] * v[0] + u[1] * v[1] + u[2] * v[2]; }
+
+   // ______________________________________________________
+   static long long Key(long long i, long long j, long long k)
+   {
+      // bins of a unit vector component are well within +-2^20
+      return ((i + (1 << 20)) << 42) | ((j + (1 << 20)) << 21) | (k + (1 << 20));
+   }
+
+   // ______________________________________________________
+   static void SetUnitVector(double *u, double px, double py, double pz)
+   {
+      double norm = std::sqrt(px * px + py * py + pz * pz);
+      if ( norm == 0. ) norm = 1.;
+      u[0] = px / norm;
+      u[1] = py / norm;
+      u[2] = pz / norm;
+   }
+
+   double fCosMin;
+   double fCellSize;
+   unsigned int fRun;
+   unsigned long long fEvent;
+   bool fEmpty;
+   std::unordered_map<long long, std::vector<Candidate> > fCells;
+};
+
+#endif
@@ -15,8 +15,12 @@
 #include <TTreeReaderValue.h>
 #include <TTreeReaderArray.h>
 #include <TObject.h>
+#include <TNtuple.h>
+#include <TH1F.h>
+#include <TProofOutputFile.h>
 
 // Headers needed by this particular selector
+#include "AnnaGhostIndex.h"
 
 
 class Selector_jpsi_and_D0_PbPb_2015 : public TSelector {
@@ -1370,6 +1374,17 @@ public :
    // added by me
    bool IsEventSelected();
    bool hasGhosts();
+   void ParseOption();
+
+   AnnaGhostIndex fGhostIndex; //! candidates of the current event, see hasGhosts
+
+   // Outputs, created once per worker in SlaveBegin
+   TString           fOutputName = "Selector_jpsi_and_D0_PbPb_2015.root"; //! set with the "out=<file>" option
+   TProofOutputFile *fProofFile = 0; //! per-worker file merged by PROOF
+   TFile            *fFile = 0;      //! file the ntuple is written in
+   TNtuple          *fNtuple = 0;    //!
+   TH1F             *fRuns = 0;      //! merged through the output list
+   TH1F             *fExEvent = 0;   //!
 
    ClassDef(Selector_jpsi_and_D0_PbPb_2015,0);
 
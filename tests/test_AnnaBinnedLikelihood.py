@@ -0,0 +1,57 @@
+# =============================================================================
+#  Toys of AnnaBinnedLikelihood, without ROOT
+#  Run from the top directory: python -m pytest -q tests
+
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Anna.AnnaBinnedLikelihood import AnnaBinnedLikelihood  # noqa: E402
+
+# Model of the toys, as a J/psi peak over a falling background
+truth = {
+    'mean': 3097., 'sigma': 14., 'alpha': 2., 'n': 3.,
+    'tau': -2e-3, 'phi1': 0.6, 'S': 4000., 'B': 6000.}
+fixed = ['alpha', 'n']
+
+
+# ______________________________________
+def GetLikelihood(counts):
+    edges = np.linspace(2900., 3300., 81)
+    parameters = {
+        'mean': (3090., 3050., 3150.),
+        'sigma': (20., 5., 50.)}
+    for name in fixed:
+        parameters[name] = (truth[name], truth[name], truth[name])
+    return AnnaBinnedLikelihood(edges, counts, 'CrystalBall_pdf', 'Bkg_pdf', parameters, power=1)
+
+
+# ______________________________________
+def test_generate_is_reproducible():
+    model = GetLikelihood(np.zeros(80))
+    assert np.array_equal(model.Generate(truth, 7), model.Generate(truth, 7))
+    assert not np.array_equal(model.Generate(truth, 7), model.Generate(truth, 8))
+
+
+# ______________________________________
+def test_pulls_are_centred():
+    model = GetLikelihood(np.zeros(80))
+    pulls = dict([(name, list()) for name in ['mean', 'sigma', 'S']])
+    for seed in range(50):
+        likelihood = GetLikelihood(model.Generate(truth, seed))
+        result = likelihood.Fit()
+        if result['status'] != 0 or result['covQual'] != 3:
+            continue
+        for name in pulls:
+            pulls[name].append((result['values'][name] - truth[name]) / result['errors'][name])
+
+    for name, values in pulls.items():
+        n = len(values)
+        assert n >= 45, name
+        mean = sum(values) / n
+        width = math.sqrt(sum([(v - mean) ** 2 for v in values]) / (n - 1))
+        assert abs(mean) < 4. * width / math.sqrt(n), (name, mean)
+        assert 0.6 < width < 1.4, (name, width)